@@ -0,0 +1,194 @@
+# Command line analysis of the scraped subject data, answered from a precomputed aggregate cube.
+# Every subject csv is reduced once to cells of department x year x term x level x respondents bucket x metric holding
+# the number of rows and the weighted count, sum and sum of squares of the metric (weighted by the number of
+# respondents). A filtered query then only sums the matching cells instead of rescanning the raw rows. The cube is
+# persisted next to the subject tables with the modification time and size of the file each of them was read from, and
+# only the departments whose table changed are recomputed.
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from normalized_store import find_subject_tables, get_source_signature, read_subject_columns, read_subject_table
+from stats_utils import weighted_mean_and_std_from_sums
+
+# 1. Constants
+CSV_FOLDER_PATH = "course_csv_data"
+CUBE_FILENAME = "analysis_cube.csv"
+CUBE_MANIFEST_FILENAME = "analysis_cube.json"
+WEIGHT_COLUMN = "Number of Respondents"
+DIMENSIONS = ["Department", "Year", "Term", "Level", "Min Respondents"]
+CELL_STATS = ["Rows", "Weight", "Sum", "Sum of Squares"]
+# Lower edges of the respondent buckets, a --min-responses threshold on an edge is answered exactly
+RESPONDENT_BUCKET_EDGES = np.array(list(range(0, 21)) + [25, 30, 40, 50, 75, 100, 150, 200, 300, 500])
+UNKNOWN_LEVEL = 'Unknown'
+
+def get_metric_columns(df):
+    """The averaged evaluation metrics of a subject csv (and the response rate)."""
+    return [column for column in df.columns if column.endswith('(Avg)')] + ["Response Rate"]
+
+def get_department(csv_path):
+    """Department label of a subject csv ('course_csv_data/subject_2.csv' -> '2')."""
+    return os.path.splitext(os.path.basename(csv_path))[0][len('subject_'):]
+
+def get_respondent_bucket(num_respondents):
+    """Lower bucket edge of each number of respondents."""
+    return RESPONDENT_BUCKET_EDGES[np.searchsorted(RESPONDENT_BUCKET_EDGES, num_respondents, side='right') - 1]
+
+def build_department_cube(df, department):
+    """Reduce the rows of one subject csv to cube cells (a long dataframe with DIMENSIONS, 'Metric' and CELL_STATS)."""
+    # 1. Dimension values of every row
+    weights = df[WEIGHT_COLUMN].to_numpy(dtype=float)
+    rows = pd.DataFrame({'Department': department,
+                         'Year': df['Year'].to_numpy(),
+                         'Term': df['Term'].fillna('Unknown').to_numpy(),
+                         'Level': df['Level (U or G)'].fillna(UNKNOWN_LEVEL).to_numpy(),
+                         'Min Respondents': get_respondent_bucket(np.nan_to_num(weights, nan=0))})
+
+    # 2. Weighted sums of every metric per cell, one vectorized group-by per metric
+    cells = []
+    for metric in get_metric_columns(df):
+        values = df[metric].to_numpy(dtype=float)
+        valid = ~np.isnan(values) & ~np.isnan(weights)
+        if not valid.any():
+            continue
+        metric_rows = rows.loc[valid].assign(**{'Metric': metric,
+                                                'Rows': 1,
+                                                'Weight': weights[valid],
+                                                'Sum': weights[valid] * values[valid],
+                                                'Sum of Squares': weights[valid] * values[valid]**2})
+        cells.append(metric_rows.groupby(DIMENSIONS + ['Metric'], sort=False, as_index=False)[CELL_STATS].sum())
+    if not cells:
+        return pd.DataFrame(columns=DIMENSIONS + ['Metric'] + CELL_STATS)
+    return pd.concat(cells, ignore_index=True)
+
+def load_cube(csv_folder_path=CSV_FOLDER_PATH, rebuild=False):
+    """
+    Return the aggregate cube of every subject csv in `csv_folder_path`, recomputing only the departments whose csv
+    was added, changed or removed since the persisted cube was built.
+    """
+    cube_path = os.path.join(csv_folder_path, CUBE_FILENAME)
+    manifest_path = os.path.join(csv_folder_path, CUBE_MANIFEST_FILENAME)
+    sources = {get_department(x): x for x in find_subject_tables(csv_folder_path)}
+
+    # 1. Load the persisted cube and the signatures of the csv files it was built from
+    cube, manifest = None, {}
+    if not rebuild and os.path.exists(cube_path) and os.path.exists(manifest_path):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        cube = pd.read_csv(cube_path, dtype={'Department': str})
+
+    # 2. Recompute the departments whose csv changed
+    signatures = {department: get_source_signature(path) for department, path in sources.items()}
+    stale = [x for x in sources if manifest.get(x) != signatures[x]]
+    removed = [x for x in manifest if x not in sources]
+    if cube is not None and not stale and not removed:
+        return cube
+    parts = [] if cube is None else [cube.loc[~cube['Department'].isin(stale + removed)]]
+    for department in stale:
+        df = read_subject_table(sources[department], [x for x in read_subject_columns(sources[department]) if x != 'Description'])
+        parts.append(build_department_cube(df, department))
+        print(f"Rebuilt the analysis cube of department {department} ({len(df)} rows).")
+    cube = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=DIMENSIONS + ['Metric'] + CELL_STATS)
+
+    # 3. Persist the cube, then the manifest that validates it
+    temp_path = cube_path + '.tmp'
+    cube.to_csv(temp_path, index=False)
+    os.replace(temp_path, cube_path)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(signatures, f)
+    os.replace(manifest_path + '.tmp', manifest_path)
+    return cube
+
+def resolve_metrics(cube, metrics):
+    """Match metric names given on the command line ('Teacher Rating' or 'Teacher Rating (Avg)') to cube metrics."""
+    available = list(pd.unique(cube['Metric']))
+    if not metrics:
+        return available
+    resolved = []
+    for metric in metrics:
+        matches = [x for x in available if x == metric or x == f'{metric} (Avg)']
+        if not matches:
+            raise ValueError(f"Unknown metric '{metric}', available metrics: {', '.join(available)}")
+        resolved.extend(matches)
+    return resolved
+
+def query_cube(cube, metrics=None, departments=None, years=None, terms=None, levels=None, min_responses=0, by=None):
+    """
+    Weighted statistics of the metrics over the cells matching the filters.
+
+    Parameters:
+    - cube (pd.DataFrame): The aggregate cube from load_cube.
+    - metrics (list): Metric names, every metric if None.
+    - departments, terms, levels (list): Values to keep, everything if None.
+    - years (tuple): Inclusive (first year, last year), every year if None.
+    - min_responses (int): Minimum number of respondents of a course, rounded up to the next respondent bucket edge.
+    - by (list): Dimensions to group the result by ('Department', 'Year', 'Term', 'Level'), besides the metric.
+
+    Returns:
+    - pd.DataFrame: Rows, weight, weighted mean and weighted std per group and metric.
+    """
+    metrics = resolve_metrics(cube, metrics)
+    by = list(by or [])
+
+    # 1. One combined mask over the cells
+    mask = cube['Metric'].isin(metrics).to_numpy(copy=True)
+    if departments:
+        mask &= cube['Department'].isin([str(x) for x in departments]).to_numpy()
+    if years:
+        mask &= ((cube['Year'] >= years[0]) & (cube['Year'] <= years[1])).to_numpy()
+    if terms:
+        mask &= cube['Term'].isin(terms).to_numpy()
+    if levels:
+        mask &= cube['Level'].isin(levels).to_numpy()
+    if min_responses:
+        edge_index = np.searchsorted(RESPONDENT_BUCKET_EDGES, min_responses)
+        threshold = RESPONDENT_BUCKET_EDGES[edge_index] if edge_index < len(RESPONDENT_BUCKET_EDGES) else np.inf
+        mask &= (cube['Min Respondents'] >= threshold).to_numpy()
+
+    # 2. Sum the matching cells per group and derive the statistics
+    result = cube.loc[mask].groupby(by + ['Metric'], as_index=False)[CELL_STATS].sum()
+    result['Mean'], result['STD'] = weighted_mean_and_std_from_sums(result['Sum'].to_numpy(), result['Sum of Squares'].to_numpy(), result['Weight'].to_numpy())
+    return result[by + ['Metric', 'Rows', 'Weight', 'Mean', 'STD']]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Query weighted statistics of the scraped MIT subject evaluations.")
+    parser.add_argument('metrics', nargs='*', help="Metrics to report, e.g. 'Teacher Rating' (default: all).")
+    parser.add_argument('--csv-folder', default=CSV_FOLDER_PATH, help="Folder of the subject csv files.")
+    parser.add_argument('--departments', nargs='+', default=None, help="Departments to include, e.g. 2 6 (default: all).")
+    parser.add_argument('--years', nargs=2, type=int, default=None, metavar=('FIRST', 'LAST'), help="Inclusive year range.")
+    parser.add_argument('--terms', nargs='+', default=None, help="Terms to include, e.g. Fall Spring.")
+    parser.add_argument('--levels', nargs='+', default=None, choices=['U', 'G', UNKNOWN_LEVEL], help="Course levels to include.")
+    parser.add_argument('--min-responses', type=int, default=0, help="Minimum number of respondents of a course.")
+    parser.add_argument('--by', nargs='+', default=None, choices=DIMENSIONS[:4], help="Group the results by these dimensions.")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild the aggregate cube from scratch.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.min_responses and args.min_responses not in RESPONDENT_BUCKET_EDGES:
+        print(f"Note: --min-responses is rounded up to the next respondent bucket edge ({', '.join(map(str, RESPONDENT_BUCKET_EDGES))}).")
+
+    # 1. Load the cube, recomputing the departments whose data changed
+    cube = load_cube(args.csv_folder, args.rebuild)
+
+    # 2. Answer the query from the cube
+    start_time = time.perf_counter()
+    try:
+        result = query_cube(cube, args.metrics, args.departments, args.years, args.terms, args.levels, args.min_responses, args.by)
+    except ValueError as e:
+        print(e)
+        return 1
+    elapsed_time = time.perf_counter() - start_time
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(result.to_string(index=False, float_format=lambda x: f'{x:0.3f}'))
+    print(f"Answered from {len(cube)} cube cells in {elapsed_time*1e3:0.1f} ms.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+# Offline benchmarks of the scraper's hot paths.
+# The page parsing and extraction functions run against the fixture corpus in fixtures/pages (an old-format and a
+# new-format evaluation page, the listing page and a catalog page), and the table and statistics functions run
+# against synthetic subject tables of increasing size (1k to 100k rows by default, with 10k distinct professors), so
+# their scaling can be compared without the MIT site. Every benchmark reports the median time per call, the
+# throughput in items (pages, rows, lookups) per second and the peak memory traced by tracemalloc during one call.
+# Results can be saved as json and compared against the results of another commit:
+#
+#   python MiTSubjectScraper/benchmark.py --output before.json
+#   python MiTSubjectScraper/benchmark.py --compare before.json
+
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import scrape
+from catalog_index import build_catalog_index
+from mock_server import FIXTURE_PAGES_DIR, FIXTURE_PAGE_FORMATS
+from professor_store import build_professor_table, join_teacher_values
+from row_buffer import RowBuffer
+from scraped_index import ScrapedIndex
+from stats_utils import weighted_nanmedian, weighted_nanmean, weighted_nanstd, weighted_stats_by, bootstrap_ci_by, WeightedQuantileSketch
+
+# 1. Constants
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+DEFAULT_NUM_PROFESSORS = 10_000
+# Every benchmark runs for at least this long (and at least MIN_REPEATS times) to get a stable median
+DEFAULT_MIN_TIME = 0.5
+MIN_REPEATS = 3
+MAX_REPEATS = 1000
+BOOTSTRAP_RESAMPLES = 200
+TERMS = ['Fall', 'Spring', 'IAP', 'Summer']
+METRIC_COLUMNS = ["Teacher Rating (Avg)", "Teacher Helpfulness (Avg)", "Subject Rating (Avg)", "Total Weekly Hours Spent (Avg)"]
+
+def load_fixture_corpus(pages_dir=FIXTURE_PAGES_DIR):
+    """The fixture pages keyed by name ('new_format', 'old_format', 'listing', 'catalog')."""
+    corpus = {}
+    for name in FIXTURE_PAGE_FORMATS:
+        with open(os.path.join(pages_dir, f'evaluation_{name}.html'), 'rb') as f:
+            corpus[name] = f.read()
+    for name in ['listing', 'catalog']:
+        with open(os.path.join(pages_dir, f'{name}.html'), 'rb') as f:
+            corpus[name] = f.read()
+    return corpus
+
+def make_synthetic_subject_df(num_rows, num_professors=DEFAULT_NUM_PROFESSORS, seed=0):
+    """A subject table of `num_rows` random rows (one page per row) taught by `num_professors` distinct teachers."""
+    rng = np.random.default_rng(seed)
+    num_courses = max(1, num_rows // 10)
+    course_ids = rng.integers(0, num_courses, num_rows)
+    teacher_ids = rng.integers(0, num_professors, (num_rows, 2))
+    teachers = [f'First{a} Last{a}' if i % 3 else f'First{a} Last{a}; First{b} Last{b}' for i, (a, b) in enumerate(teacher_ids)]
+    df = pd.DataFrame({column: np.nan for column in scrape.SUBJECT_COLUMNS}, index=range(num_rows))
+    df['Year'] = rng.integers(2004, 2024, num_rows)
+    df['Term'] = np.array(TERMS)[rng.integers(0, len(TERMS), num_rows)]
+    df['Course Number'] = [f'="2.{x}"' for x in course_ids]
+    df['Subject Name'] = [f'Subject {x}' for x in course_ids]
+    df['Level (U or G)'] = np.where(course_ids % 2, 'U', 'G')
+    df['Teachers'] = teachers
+    num_teachers = np.where(np.arange(num_rows) % 3, 1, 2)
+    for column, values in [("Teacher Ratings", rng.uniform(1, 7, (num_rows, 2)).round(1)), ("Teacher Helpfulness Ratings", rng.uniform(1, 7, (num_rows, 2)).round(1)),
+                           ("Teacher Rating Counts", rng.integers(1, 100, (num_rows, 2)))]:
+        df[column] = [join_teacher_values(x[:n]) for x, n in zip(values, num_teachers)]
+    df['Number of Respondents'] = rng.integers(1, 200, num_rows)
+    df['Response Rate'] = rng.uniform(10, 100, num_rows)
+    for column in METRIC_COLUMNS + ["Pace (Avg)", "Assignment Quality (Avg)", "Grading Fairness (Avg)"]:
+        df[column] = rng.uniform(1, 7, num_rows).round(2)
+    df['Webpage Link'] = [f'subjectEvaluationReport.htm?surveyId={i}' for i in range(num_rows)]
+    return df[scrape.SUBJECT_COLUMNS]
+
+def make_synthetic_catalog_page(num_courses):
+    """A catalog page with `num_courses` course blocks in the layout of catalog.mit.edu."""
+    blocks = [f'<div class="courseblock"><p class="courseblocktitle"><strong>2.{i} Subject {i}</strong></p>'
+              f'<p class="courseblockprereq">Prereq: None; {"U" if i % 2 else "G"} (Fall)</p>'
+              f'<p class="courseblockdesc">Description of subject {i} and its topics.</p></div>' for i in range(num_courses)]
+    return ('<html><body>' + ''.join(blocks) + '</body></html>').encode('utf-8')
+
+class Benchmark:
+    """A function to time, called without arguments after `setup`, processing `items` items per call."""
+
+    def __init__(self, name, function, items=1, setup=None, group='corpus'):
+        self.name = name
+        self.function = function
+        self.items = items
+        self.setup = setup
+        self.group = group
+
+def time_benchmark(benchmark, min_time=DEFAULT_MIN_TIME):
+    """Return the median seconds per call and the peak traced memory (bytes) of one call."""
+    if benchmark.setup is not None:
+        benchmark.setup()
+
+    # 1. Peak memory of a single call, traced separately since tracemalloc slows the calls down
+    tracemalloc.start()
+    benchmark.function()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    # 2. Repeat the calls until enough time has passed
+    durations = []
+    start_time = time.perf_counter()
+    while len(durations) < MIN_REPEATS or (time.perf_counter() - start_time < min_time and len(durations) < MAX_REPEATS):
+        call_start_time = time.perf_counter()
+        benchmark.function()
+        durations.append(time.perf_counter() - call_start_time)
+    return statistics.median(durations), peak_memory
+
+def make_corpus_benchmarks(corpus):
+    """Benchmarks of the parsing and extraction of the fixture pages."""
+    catalog_index = build_catalog_index(scrape.make_soup(corpus['catalog']))
+    benchmarks = [
+        Benchmark('make_soup[listing, SoupStrainer]', lambda: scrape.make_soup(corpus['listing'], parse_only=scrape.LISTING_PARSE_ONLY)),
+        Benchmark('iter_listing_courses', lambda: list(scrape.iter_listing_courses(listing_soup))),
+        Benchmark('build_catalog_index[fixture]', lambda: build_catalog_index(scrape.make_soup(corpus['catalog']))),
+    ]
+    listing_soup = scrape.make_soup(corpus['listing'], parse_only=scrape.LISTING_PARSE_ONLY)
+    for page_format in FIXTURE_PAGE_FORMATS:
+        content = corpus[page_format]
+        soup = scrape.make_soup(content)
+        benchmarks.append(Benchmark(f'make_soup[{page_format}]', lambda content=content: scrape.make_soup(content)))
+        benchmarks.append(Benchmark(f'extract_data[{page_format}]', lambda soup=soup: scrape.extract_data(soup, catalog_index, scrape.make_subject_rows(), 'url')))
+    titles = [entry['title'] for entry in catalog_index.values()]
+    benchmarks.append(Benchmark('get_course_catalog_info[fixture]', lambda: [scrape.get_course_catalog_info(catalog_index, x) for x in titles], len(titles)))
+    return benchmarks
+
+def make_scaling_benchmarks(num_rows, num_professors):
+    """Benchmarks of the table and statistics functions on a synthetic subject table of `num_rows` rows."""
+    df = make_synthetic_subject_df(num_rows, num_professors)
+    records = df.to_dict('records')
+    values = df['Teacher Rating (Avg)'].to_numpy()
+    weights = df['Number of Respondents'].to_numpy(dtype=float)
+    catalog_index = build_catalog_index(scrape.make_soup(make_synthetic_catalog_page(min(num_rows, 10_000))))
+    titles = [f'2.{i} Subject {i}' for i in range(min(num_rows, 10_000))]
+    keys = list(zip(df['Course Number'], df['Term'], df['Year']))
+    with tempfile.TemporaryDirectory() as temp_dir:
+        scraped_index = ScrapedIndex(temp_dir)
+        scraped_index.add_rows(df, persist=False)
+
+    def append_rows():
+        rows = RowBuffer(scrape.SUBJECT_COLUMNS, scrape.SUBJECT_COLUMN_DTYPES)
+        rows.extend(records)
+
+    def update_sketch():
+        WeightedQuantileSketch().update(values, weights)
+
+    size = f'{num_rows} rows'
+    group = f'synthetic {size}'
+    return [
+        Benchmark(f'RowBuffer.append[{size}]', append_rows, num_rows, group=group),
+        Benchmark(f'build_professor_table[{size}]', lambda: build_professor_table(df), num_rows, group=group),
+        Benchmark(f'ScrapedIndex.contains[{size}]', lambda: [scraped_index.contains(*x) for x in keys], num_rows, group=group),
+        Benchmark(f'get_course_catalog_info[{size}, {len(titles)} courses]', lambda: [scrape.get_course_catalog_info(catalog_index, x) for x in titles], len(titles), group=group),
+        Benchmark(f'weighted_nanmedian[{size}]', lambda: weighted_nanmedian(values, weights), num_rows, group=group),
+        Benchmark(f'weighted_nanmean[{size}]', lambda: weighted_nanmean(values, weights), num_rows, group=group),
+        Benchmark(f'weighted_nanstd[{size}]', lambda: weighted_nanstd(values, weights), num_rows, group=group),
+        Benchmark(f'weighted_stats_by[{size}, Year]', lambda: weighted_stats_by(df, METRIC_COLUMNS, 'Number of Respondents', 'Year'), num_rows, group=group),
+        Benchmark(f'WeightedQuantileSketch.update[{size}]', update_sketch, num_rows, group=group),
+        Benchmark(f'bootstrap_ci_by[{size}, {BOOTSTRAP_RESAMPLES} resamples]', lambda: bootstrap_ci_by(df, ['Teacher Rating (Avg)'], 'Number of Respondents', 'Year', num_resamples=BOOTSTRAP_RESAMPLES), num_rows, group=group),
+    ]
+
+def run_benchmarks(benchmarks, min_time=DEFAULT_MIN_TIME, name_filter=None):
+    """Time the benchmarks (whose name contains `name_filter`, if given) and return their results keyed by name."""
+    results = {}
+    for benchmark in benchmarks:
+        if name_filter and name_filter not in benchmark.name:
+            continue
+        seconds_per_call, peak_memory = time_benchmark(benchmark, min_time)
+        results[benchmark.name] = {'group': benchmark.group, 'seconds_per_call': seconds_per_call,
+                                   'items_per_second': benchmark.items / seconds_per_call, 'peak_memory_bytes': peak_memory}
+        print(format_result(benchmark.name, results[benchmark.name]), flush=True)
+    return results
+
+def format_result(name, result, baseline=None):
+    line = f"{name:<52}{result['seconds_per_call']*1e3:>12.3f}{result['items_per_second']:>14.0f}{result['peak_memory_bytes']/2**20:>10.2f}"
+    if baseline is not None:
+        line += f"{baseline['seconds_per_call'] / result['seconds_per_call']:>10.2f}x"
+    return line
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the scraper's hot paths offline on the fixture corpus and synthetic tables.")
+    parser.add_argument('--sizes', nargs='+', type=int, default=DEFAULT_SIZES, help="Numbers of rows of the synthetic subject tables.")
+    parser.add_argument('--professors', type=int, default=DEFAULT_NUM_PROFESSORS, help="Number of distinct teachers in the synthetic tables.")
+    parser.add_argument('--min-time', type=float, default=DEFAULT_MIN_TIME, help="Minimum time spent repeating each benchmark (seconds).")
+    parser.add_argument('--filter', default=None, help="Only run the benchmarks whose name contains this text.")
+    parser.add_argument('--parser', choices=scrape.PARSER_BACKENDS, default=scrape.DEFAULT_PARSER_BACKEND, help="html parser backend.")
+    parser.add_argument('--output', default=None, help="Save the results to this json file.")
+    parser.add_argument('--compare', default=None, help="json results of an earlier run to report the speedup against.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    scrape.parser_backend = args.parser
+
+    # 1. Run the corpus benchmarks, then the synthetic ones from the smallest table up
+    print(f"{'benchmark':<52}{'ms/call':>12}{'items/s':>14}{'peak MiB':>10}")
+    results = run_benchmarks(make_corpus_benchmarks(load_fixture_corpus()), args.min_time, args.filter)
+    for num_rows in sorted(args.sizes):
+        results.update(run_benchmarks(make_scaling_benchmarks(num_rows, args.professors), args.min_time, args.filter))
+
+    # 2. Save the results and compare them with an earlier run
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'parser': args.parser, 'results': results}, f, indent=2)
+        print(f"Saved the results to {args.output}")
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        print(f"\nSpeedup against {args.compare}:")
+        for name, result in results.items():
+            if name in baseline:
+                print(format_result(name, result, baseline[name]))
+    return results
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# Index of a department's MIT course catalog page.
+# The catalog page is parsed once into a dict keyed by normalized course number holding the title, level (U or G) and
+# description of every subject, so looking up a course is O(1) instead of a regex scan over every courseblock. The
+# index is persisted next to the csv files together with the hash of the catalog page it was built from, and is only
+# rebuilt when the catalog page changes.
+
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+# 1. Constants
+CATALOG_INDEX_FOLDER_PATH = os.path.join("course_csv_data", "catalog_index")
+COURSE_NUMBER_PATTERN = re.compile(r'\b[A-Z0-9]+\.[A-Z0-9]+\b')
+LEVEL_PATTERN = re.compile(r'U \(|G \(')
+DESCRIPTION_PATTERN = re.compile(r'<p class="courseblockdesc">.*</p>')
+
+def normalize_course_number(course_number):
+    """Normalize a course number such as ' 2.s972' to the form used as the index key ('2.S972')."""
+    return str(course_number).strip().upper()
+
+def parse_course_block(course_block):
+    """Extract the title, level and description of a single catalog courseblock."""
+    course_block_html = str(course_block)
+    strong_tag = course_block.find('strong')
+
+    # 1. Get the level of the course (U or G)
+    level_match = LEVEL_PATTERN.search(course_block_html)
+    level = level_match.group().strip().replace('>','').replace(' (','') if level_match is not None else None
+
+    # 2. Get the course description
+    description_match = DESCRIPTION_PATTERN.search(course_block_html)
+    description = description_match.group().strip().replace('>','').replace('<','').replace('/','').replace('p class="courseblockdesc"','').replace('"','').replace('Description','') if description_match is not None else None
+
+    return {'title': strong_tag.get_text() if strong_tag is not None else '',
+            'level': level,
+            'description': description,
+            'text': course_block.get_text()}
+
+def build_catalog_index(catalog_soup):
+    """Build the course number -> catalog entry index from a parsed catalog page."""
+    catalog_index = {}
+    for course_block in catalog_soup.find_all('div', class_='courseblock'):
+        strong_tag = course_block.find('strong')
+        if strong_tag is None:
+            continue
+        entry = parse_course_block(course_block)
+        # a block may list several numbers (e.g. cross-listed subjects), the first block mentioning a number wins
+        for course_number in COURSE_NUMBER_PATTERN.findall(strong_tag.get_text()):
+            catalog_index.setdefault(normalize_course_number(course_number), entry)
+    return catalog_index
+
+def get_catalog_index_path(subject_number, folder_path=CATALOG_INDEX_FOLDER_PATH):
+    return os.path.join(folder_path, f"catalog_{subject_number.replace('/', '-')}.json")
+
+def load_catalog_index(subject_number, content, make_soup, folder_path=CATALOG_INDEX_FOLDER_PATH):
+    """
+    Return the catalog index for a department's catalog page.
+
+    Parameters:
+    - subject_number (str): The department the catalog page belongs to.
+    - content (bytes): The html of the catalog page.
+    - make_soup (callable): Parses html into a BeautifulSoup tree, only called if the index has to be rebuilt.
+    - folder_path (str): Where the persisted indices live.
+
+    Returns:
+    - dict: normalized course number -> {'title', 'level', 'description', 'text'}
+    """
+    # 1. Reuse the persisted index if it was built from the same catalog page
+    content_hash = hashlib.sha256(content).hexdigest()
+    index_path = get_catalog_index_path(subject_number, folder_path)
+    if os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            persisted = json.load(f)
+        if persisted.get('sha256') == content_hash:
+            return persisted['courses']
+
+    # 2. Otherwise parse the catalog page once and persist the index
+    catalog_soup = make_soup(content)
+    catalog_index = build_catalog_index(catalog_soup)
+    catalog_soup.decompose()
+    os.makedirs(folder_path, exist_ok=True)
+    temp_path = index_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'sha256': content_hash, 'courses': catalog_index}, f)
+    os.replace(temp_path, index_path)
+    return catalog_index
+
+def lookup_course(catalog_index, course_number):
+    """Return the catalog entry of a course, or None if it is not in the catalog."""
+    return catalog_index.get(normalize_course_number(course_number))
+
+def as_value(value):
+    """Convert a missing (None) catalog value to np.nan as used in the csv files."""
+    return np.nan if value is None else value
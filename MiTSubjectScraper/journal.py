@@ -0,0 +1,192 @@
+# Append-only journal storage for the csv files written by the scraper.
+# Instead of rewriting a whole csv after every course page, new and updated rows are appended to a JSON lines journal
+# next to the csv, fsynced in batches. Every so often the journal is compacted: the full table is written to a temporary
+# file, fsynced and atomically renamed over the csv, and the journal is emptied. On restart, rows left in the journal by
+# an interrupted run are merged back into the csv snapshot before anything else happens.
+#
+# Recovery is idempotent: every row carries key columns and a journaled row replaces any snapshot row with the same
+# key, so replaying a journal whose rows already made it into the snapshot changes nothing.
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# 1. Defaults
+# 1.1 Number of appended records between two fsyncs of the journal
+DEFAULT_FSYNC_EVERY = 16
+# 1.2 Number of journaled rows after which the journal is compacted into the csv
+DEFAULT_COMPACT_EVERY = 500
+JOURNAL_SUFFIX = '.journal.jsonl'
+
+def to_json_value(value):
+    """Convert numpy scalars to plain Python values for json."""
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+class RecordJournal:
+    """Append-only JSON lines file of records, fsynced every `fsync_every` records."""
+
+    def __init__(self, path, fsync_every=DEFAULT_FSYNC_EVERY):
+        self.path = path
+        self.fsync_every = fsync_every
+        self.unsynced = 0
+        self.file = None
+
+    def _open(self):
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        return self.file
+
+    def append(self, records):
+        """Append records (dicts) to the journal."""
+        f = self._open()
+        for record in records:
+            f.write(json.dumps(record, default=to_json_value) + '\n')
+        f.flush()
+        self.unsynced += len(records)
+        if self.unsynced >= self.fsync_every:
+            self.sync()
+
+    def sync(self):
+        """Force the appended records to disk."""
+        if self.file is not None and self.unsynced:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def read(self):
+        """Return every complete record in the journal."""
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # a torn last line from an interrupted write
+                    break
+        return records
+
+    def reset(self):
+        """Empty the journal once its records are in the snapshot."""
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close(self):
+        if self.file is not None:
+            self.sync()
+            self.file.close()
+            self.file = None
+
+def write_csv_atomically(df, csv_path):
+    """Write a dataframe to a temporary file, fsync it and rename it over `csv_path`."""
+    temp_path = csv_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8', newline='') as f:
+        df.to_csv(f, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, csv_path)
+
+class JournaledTable:
+    """A csv snapshot plus a journal of the rows written to it since the snapshot was taken."""
+
+    def __init__(self, csv_path, columns, key_columns, compact_every=DEFAULT_COMPACT_EVERY, fsync_every=DEFAULT_FSYNC_EVERY):
+        self.csv_path = csv_path
+        self.columns = columns
+        self.key_columns = key_columns
+        self.compact_every = compact_every
+        self.journal = RecordJournal(csv_path + JOURNAL_SUFFIX, fsync_every)
+        self.journaled_rows = 0
+
+    def _read_snapshot(self):
+        if os.path.exists(self.csv_path):
+            # round-trip parsing so floats survive repeated compactions unchanged
+            return pd.read_csv(self.csv_path, float_precision='round_trip')
+        return pd.DataFrame(columns=self.columns)
+
+    def _merge_records(self, df, records):
+        """
+        Merge journaled records into the snapshot `df`: a record replaces the snapshot row that has the same key in place,
+        and records with new keys are appended in the order their keys were first journaled. A key journaled several
+        times takes the values of its last record. The merged order is thus the same whether the records are merged at
+        once or over several compactions.
+        """
+        records_df = pd.DataFrame(records, columns=self.columns)
+        record_keys = pd.MultiIndex.from_frame(records_df[self.key_columns].astype(str))
+        # codes number the keys in the order they were first journaled
+        key_codes = pd.factorize(record_keys)[0]
+        is_last = ~record_keys.duplicated(keep='last')
+        journal_df, journal_keys, journal_codes = records_df[is_last], record_keys[is_last], key_codes[is_last]
+
+        # 1. Position of every journaled row: the first snapshot row with its key, or after the snapshot
+        snapshot_keys = pd.MultiIndex.from_frame(df[self.key_columns].astype(str))
+        matches = journal_keys.get_indexer(snapshot_keys)
+        replaced = matches >= 0
+        replaced_rows = np.flatnonzero(replaced)
+        matched_records, first_rows = np.unique(matches[replaced_rows], return_index=True)
+        positions = len(df) + journal_codes
+        positions[matched_records] = replaced_rows[first_rows]
+
+        # 2. Put the kept snapshot rows and the journaled rows in that order
+        merged = pd.concat([df.loc[~replaced], journal_df], ignore_index=True)
+        order = np.argsort(np.concatenate([np.flatnonzero(~replaced), positions]), kind='stable')
+        return merged.iloc[order].reset_index(drop=True), len(journal_df)
+
+    def load(self):
+        """Load the snapshot, merge in any rows left in the journal by an interrupted run, and return the table."""
+        # 1. Load the snapshot
+        df = self._read_snapshot()
+
+        # 2. Recover the journal, replacing snapshot rows that have the same key
+        records = self.journal.read()
+        if records:
+            df, num_recovered = self._merge_records(df, records)
+            print(f"Recovered {num_recovered} rows from {self.journal.path}")
+            self.compact(df)
+
+        return df
+
+    def append(self, rows):
+        """Journal new or updated rows (a dataframe with the table's columns)."""
+        if len(rows) == 0:
+            return
+        self.journal.append(rows.to_dict('records'))
+        self.journaled_rows += len(rows)
+
+    def needs_compaction(self):
+        return self.journaled_rows >= self.compact_every
+
+    def compact(self, df):
+        """Write the full table `df` as the new snapshot and empty the journal."""
+        self.journal.sync()
+        write_csv_atomically(df, self.csv_path)
+        self.journal.reset()
+        self.journaled_rows = 0
+
+    def compact_journal(self):
+        """
+        Merge the journaled rows into the csv snapshot read back from disk, so the caller does not have to keep the
+        full table in memory between compactions.
+        """
+        self.journal.sync()
+        records = self.journal.read()
+        if records:
+            self.compact(self._merge_records(self._read_snapshot(), records)[0])
+        else:
+            self.journal.reset()
+            self.journaled_rows = 0
+
+    def close(self):
+        self.journal.close()
+
+def find_journals(folder_path):
+    """Return the csv paths in `folder_path` that have a journal left over from an interrupted run."""
+    if not os.path.isdir(folder_path):
+        return []
+    return [os.path.join(folder_path, filename[:-len(JOURNAL_SUFFIX)])
+            for filename in sorted(os.listdir(folder_path)) if filename.endswith(JOURNAL_SUFFIX)]
@@ -0,0 +1,85 @@
+# Resident memory budget for long crawls on small machines.
+# The crawl checks the resident set size of the process after every page. When it goes over the budget, garbage is
+# collected first; if that does not bring it back under, the largest allocation sites recorded by tracemalloc are
+# printed and MemoryBudgetExceeded is raised, which stops the crawl cleanly (rows are journaled and the departments
+# checkpointed page by page, so the next run resumes where it stopped).
+# The current resident size is read from /proc on Linux and from the process working set on Windows. Elsewhere (e.g.
+# macOS) only the peak resident size is available; it never goes down, so once it exceeds the budget the crawl stops
+# even if the memory has been freed since.
+
+import ctypes
+import gc
+import os
+import sys
+import tracemalloc
+
+# 1. Constants
+REPORT_TOP_ALLOCATIONS = 10
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+class _ProcessMemoryCounters(ctypes.Structure):
+    """PROCESS_MEMORY_COUNTERS of the Windows process status API."""
+    _fields_ = [('cb', ctypes.c_uint32), ('PageFaultCount', ctypes.c_uint32)] + \
+               [(name, ctypes.c_size_t) for name in ['PeakWorkingSetSize', 'WorkingSetSize', 'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage',
+                                                     'QuotaPeakNonPagedPoolUsage', 'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage']]
+
+def _get_windows_working_set_bytes():
+    kernel32, psapi = ctypes.windll.kernel32, ctypes.windll.psapi
+    kernel32.GetCurrentProcess.restype = ctypes.c_void_p
+    psapi.GetProcessMemoryInfo.argtypes = [ctypes.c_void_p, ctypes.POINTER(_ProcessMemoryCounters), ctypes.c_uint32]
+    counters = _ProcessMemoryCounters()
+    counters.cb = ctypes.sizeof(counters)
+    if not psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+        raise ctypes.WinError()
+    return counters.WorkingSetSize
+
+def get_rss_bytes():
+    """Current resident set size of the process (the peak size where the current one is not available, see above)."""
+    if sys.platform == 'win32':
+        return _get_windows_working_set_bytes()
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        import resource
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+class MemoryBudget:
+    """Resident memory limit of the crawl, with allocation reports backed by tracemalloc."""
+
+    def __init__(self, max_rss_bytes, trace=True):
+        self.max_rss_bytes = max_rss_bytes
+        self.peak_rss_bytes = 0
+        self.num_collections = 0
+        if trace and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def check(self):
+        """Raise MemoryBudgetExceeded if the process is over budget even after a garbage collection."""
+        rss = get_rss_bytes()
+        self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+        if rss <= self.max_rss_bytes:
+            return rss
+        gc.collect()
+        self.num_collections += 1
+        rss = get_rss_bytes()
+        if rss > self.max_rss_bytes:
+            self.report()
+            raise MemoryBudgetExceeded(f"The crawl uses {rss/2**20:0.1f} MiB of memory, over the budget of {self.max_rss_bytes/2**20:0.1f} MiB!")
+        return rss
+
+    def report(self):
+        """Print the current and peak memory use and the largest allocation sites."""
+        rss = get_rss_bytes()
+        self.peak_rss_bytes = max(self.peak_rss_bytes, rss)
+        print(f"Resident memory: {rss/2**20:0.1f} MiB now, {self.peak_rss_bytes/2**20:0.1f} MiB at the peak "
+              f"(budget {self.max_rss_bytes/2**20:0.1f} MiB, {self.num_collections} forced garbage collections).")
+        if tracemalloc.is_tracing():
+            current_memory, peak_memory = tracemalloc.get_traced_memory()
+            print(f"Traced Python memory: {current_memory/2**20:0.1f} MiB now, {peak_memory/2**20:0.1f} MiB at the peak. Largest allocation sites:")
+            for stat in tracemalloc.take_snapshot().statistics('lineno')[:REPORT_TOP_ALLOCATIONS]:
+                print(f"  {stat}")
@@ -0,0 +1,118 @@
+# Local stand-in for the MIT subject evaluation site, used to measure scraper throughput offline.
+# Every subjectEvaluationReport.htm request is answered with one of the fixture pages after an artificial delay,
+# so the fetch engine's concurrency and rate limiting can be exercised without touching the real server.
+
+import argparse
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import requests
+
+from fetcher import HostRateLimiter, fetch_pages, DEFAULT_CONCURRENCY
+import scrape
+
+# 1. Constants
+FIXTURE_PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'fixtures', 'pages')
+FIXTURE_PAGE_FORMATS = ['new_format', 'old_format']
+DEFAULT_LATENCY = 0.25
+
+def load_fixture_pages(pages_dir=FIXTURE_PAGES_DIR):
+    """Load the fixture evaluation pages keyed by page format."""
+    pages = {}
+    for page_format in FIXTURE_PAGE_FORMATS:
+        with open(os.path.join(pages_dir, f'evaluation_{page_format}.html'), 'rb') as f:
+            pages[page_format] = f.read()
+    return pages
+
+def make_handler(pages, latency):
+    """Build a request handler class that serves `pages` after `latency` seconds."""
+
+    class EvaluationPageHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            # 1. Only evaluation report pages are served
+            parsed_url = urlparse(self.path)
+            if not parsed_url.path.endswith('subjectEvaluationReport.htm'):
+                self.send_error(404)
+                return
+
+            # 2. Pick the page format from the query string, defaulting to the new format
+            page_format = parse_qs(parsed_url.query).get('format', ['new_format'])[0]
+            if page_format not in pages:
+                self.send_error(404)
+                return
+
+            # 3. Simulate network and server latency
+            time.sleep(latency)
+            body = pages[page_format]
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return EvaluationPageHandler
+
+def start_server(latency=DEFAULT_LATENCY, port=0, pages_dir=FIXTURE_PAGES_DIR):
+    """Start the stand-in server on a background thread and return it. Use server.shutdown() to stop it."""
+    server = ThreadingHTTPServer(('127.0.0.1', port), make_handler(load_fixture_pages(pages_dir), latency))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+def make_page_urls(server, num_pages):
+    """Build `num_pages` distinct evaluation urls on the stand-in server, alternating page formats."""
+    host, port = server.server_address[:2]
+    return [f'http://{host}:{port}/ose-rpt/subjectEvaluationReport.htm?surveyId={i}&subjectId=2.{i}&format={FIXTURE_PAGE_FORMATS[i % len(FIXTURE_PAGE_FORMATS)]}'
+            for i in range(num_pages)]
+
+def measure_throughput(num_pages=40, concurrency=DEFAULT_CONCURRENCY, rate=None, latency=DEFAULT_LATENCY):
+    """
+    Fetch, parse and extract `num_pages` pages from the stand-in server.
+
+    Parameters:
+    - num_pages (int): Number of evaluation pages to process.
+    - concurrency (int): Maximum number of requests in flight.
+    - rate (float): Requests per second allowed by the token bucket, or None for no rate limit.
+    - latency (float): Artificial delay added by the server to every response, in seconds.
+
+    Returns:
+    - float: Throughput in pages per second.
+    """
+    server = start_server(latency)
+    try:
+        session = requests.Session()
+        rate_limiter = HostRateLimiter(rate) if rate is not None else None
+        rows = scrape.make_subject_rows()
+
+        start_time = time.time()
+        for url, response in fetch_pages(session, make_page_urls(server, num_pages), concurrency, rate_limiter):
+            rows = scrape.process_course_response(url, response, {}, rows)
+        elapsed_time = time.time() - start_time
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    return num_pages / elapsed_time
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure scraper throughput against a local stand-in server.")
+    parser.add_argument('--pages', type=int, default=40, help="Number of evaluation pages to process.")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, DEFAULT_CONCURRENCY],
+                        help="One or more concurrency levels to measure.")
+    parser.add_argument('--rate', type=float, default=None, help="Requests per second allowed by the rate limiter.")
+    parser.add_argument('--latency', type=float, default=DEFAULT_LATENCY, help="Artificial server latency in seconds.")
+    args = parser.parse_args(argv)
+
+    for concurrency in args.concurrency:
+        throughput = measure_throughput(args.pages, concurrency, args.rate, args.latency)
+        print(f"concurrency={concurrency}: {throughput:0.2f} pages/sec")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+# Normalized storage of the subject tables.
+# A subject csv has one row per course listed on an evaluation page, so a page cross-listed under several course
+# numbers repeats all of its metric columns, and every row repeats the catalog description of its course for every
+# term the course ran. The scraper instead stores each department as three tables:
+# - evaluations: one row per evaluation page (year, term, teachers, metrics and link),
+# - course_aliases: one row per subject row, linking a course number (and the subject name shown on the page) to its
+#   evaluation, in the order of the subject rows,
+# - course_metadata: each distinct (course number, level, description) once.
+# The tables are written column by column into one compressed numpy archive per department ('subject_2.npz', where
+# 'subject_2.csv' used to be): numeric columns as arrays, text columns as integer codes into their distinct values.
+# Reading a column only decompresses that column, without parsing any text. The denormalizing view joins the tables
+# back into the subject csv columns and row order; every reader of the subject data goes through read_subject_table,
+# and `--export` writes the view as subject csv files for csv consumers. The subject csv of a department scraped by an
+# older version is still read, and replaced by its store the next time the department is written (or by `--migrate`).
+
+import argparse
+import glob
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from journal import JournaledTable, write_csv_atomically
+
+# 1. Constants
+CSV_FOLDER_PATH = "course_csv_data"
+STORE_EXTENSION = ".npz"
+EVALUATION_ID = "Evaluation Id"
+METADATA_ID = "Metadata Id"
+ALIAS_COLUMNS = ["Course Number", "Subject Name"]
+METADATA_COLUMNS = ["Course Number", "Level (U or G)", "Description"]
+# Archive member holding the json manifest: the subject columns and the (column, kind) layout of every table
+MANIFEST_KEY = "manifest"
+# Separator of the distinct values of a text column, and the suffix of the archive member holding them
+TEXT_SEPARATOR = "\x00"
+VALUES_SUFFIX = ".values"
+
+def get_store_path(csv_path):
+    """Store of a subject table ('course_csv_data/subject_2.csv' -> 'course_csv_data/subject_2.npz')."""
+    return os.path.splitext(csv_path)[0] + STORE_EXTENSION
+
+def get_table_file(csv_path):
+    """File holding a subject table: its store, or the subject csv of a department not migrated yet."""
+    store_path = get_store_path(csv_path)
+    return store_path if os.path.exists(store_path) else csv_path
+
+def find_subject_tables(csv_folder_path=CSV_FOLDER_PATH):
+    """Subject csv paths of every department stored in the folder, as a store or as a csv."""
+    csv_paths = glob.glob(os.path.join(csv_folder_path, 'subject_*.csv'))
+    csv_paths += [os.path.splitext(x)[0] + '.csv' for x in glob.glob(os.path.join(csv_folder_path, 'subject_*' + STORE_EXTENSION))]
+    return sorted(set(csv_paths))
+
+def get_source_signature(csv_path):
+    """Modification time and size of the file holding a subject table."""
+    stat = os.stat(get_table_file(csv_path))
+    return [stat.st_mtime_ns, stat.st_size]
+
+def split_subject_df(df):
+    """
+    Split subject rows into the evaluations, course_aliases and course_metadata tables.
+
+    Returns:
+    - dict: table name -> pd.DataFrame
+    """
+    evaluation_columns = [column for column in df.columns if column not in ALIAS_COLUMNS + METADATA_COLUMNS]
+
+    # 1. One evaluation per webpage link, the id being the code of the link; a row without a link is its own evaluation,
+    # numbered after the links by its position
+    evaluation_ids = pd.factorize(df['Webpage Link'])[0]
+    missing_link = evaluation_ids < 0
+    evaluation_ids[missing_link] = evaluation_ids.max(initial=-1) + 1 + np.flatnonzero(missing_link)
+    unique_ids, first_rows = np.unique(evaluation_ids, return_index=True)
+    evaluations = df.iloc[first_rows][evaluation_columns].reset_index(drop=True)
+    evaluations.insert(0, EVALUATION_ID, unique_ids)
+
+    # 2. Each distinct (course number, level, description) once
+    metadata_ids = df.groupby(METADATA_COLUMNS, sort=False, dropna=False).ngroup().to_numpy()
+    unique_ids, first_rows = np.unique(metadata_ids, return_index=True)
+    course_metadata = df.iloc[first_rows][METADATA_COLUMNS].reset_index(drop=True)
+    course_metadata.insert(0, METADATA_ID, unique_ids)
+
+    # 3. One alias per subject row, linking it to its evaluation and metadata
+    course_aliases = pd.DataFrame({EVALUATION_ID: evaluation_ids, METADATA_ID: metadata_ids})
+    for column in ALIAS_COLUMNS:
+        course_aliases[column] = df[column].to_numpy()
+    return {'evaluations': evaluations, 'course_aliases': course_aliases, 'course_metadata': course_metadata}
+
+def join_tables(tables, columns):
+    """
+    The denormalizing view: join the store tables (dataframes, or dicts of column arrays) back into subject rows with
+    `columns`, in the original order.
+    """
+    course_aliases = tables['course_aliases']
+    # row of every alias in the evaluations and course_metadata tables
+    rows = {name: pd.Index(np.asarray(tables[name][key])).get_indexer(np.asarray(course_aliases[key]))
+            for name, key in [('evaluations', EVALUATION_ID), ('course_metadata', METADATA_ID)] if name in tables}
+    data = {}
+    for column in columns:
+        if column in course_aliases:
+            data[column] = np.asarray(course_aliases[column])
+        else:
+            name = next(x for x in rows if column in tables[x])
+            data[column] = np.asarray(tables[name][column])[rows[name]]
+    return pd.DataFrame(data, columns=list(columns))
+
+def encode_column(values):
+    """
+    Arrays storing a column: the values of a numeric column, or for a text column the codes of its rows (-1 for a
+    missing value) and its distinct values, joined by TEXT_SEPARATOR and utf-8 encoded.
+
+    Returns:
+    - tuple: ('numeric' or 'text', list of np.ndarray)
+    """
+    if values.dtype.kind in 'biuf':
+        return 'numeric', [values.to_numpy()]
+    # object columns of numbers (e.g. merged from the journal) are stored as numbers, as parsing a csv would
+    if pd.api.types.infer_dtype(values, skipna=True) in ('integer', 'floating', 'mixed-integer-float', 'empty'):
+        return 'numeric', [pd.to_numeric(values).to_numpy()]
+    codes, uniques = pd.factorize(values)
+    text = TEXT_SEPARATOR.join(str(x) for x in uniques)
+    return 'text', [codes.astype(np.int32), np.frombuffer(text.encode('utf-8'), dtype=np.uint8)]
+
+def decode_column(kind, arrays):
+    if kind == 'numeric':
+        return arrays[0]
+    codes, text = arrays
+    # the trailing NaN is picked by the code -1 of the missing values
+    values = np.array(text.tobytes().decode('utf-8').split(TEXT_SEPARATOR) + [np.nan], dtype=object)
+    return values[codes]
+
+def write_store(df, store_path):
+    """
+    Write the normalized tables of subject rows to the archive `store_path`, atomically.
+    Raises ValueError (before anything is written) if the view of the stored tables does not reproduce the rows.
+    """
+    tables = split_subject_df(df)
+
+    # 1. Encode every column, decoding it back for the check of the view
+    arrays, layouts, decoded = {}, {}, {}
+    for name, table in tables.items():
+        layouts[name], decoded[name] = [], {}
+        for i, column in enumerate(table.columns):
+            kind, column_arrays = encode_column(table[column])
+            layouts[name].append([column, kind])
+            arrays[f'{name}.{i}'] = column_arrays[0]
+            if kind == 'text':
+                arrays[f'{name}.{i}{VALUES_SUFFIX}'] = column_arrays[1]
+            decoded[name][column] = decode_column(kind, column_arrays)
+    try:
+        pd.testing.assert_frame_equal(join_tables(decoded, df.columns), df.reset_index(drop=True), check_dtype=False)
+    except AssertionError as e:
+        raise ValueError(f"The normalized tables do not reproduce the subject rows: {str(e).splitlines()[0]}")
+
+    # 2. Write the archive to a temporary file, fsync it and rename it over the store
+    manifest = {'columns': list(df.columns), 'tables': layouts}
+    arrays[MANIFEST_KEY] = np.frombuffer(json.dumps(manifest).encode('utf-8'), dtype=np.uint8)
+    temp_path = store_path + '.tmp'
+    with open(temp_path, 'wb') as f:
+        np.savez_compressed(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, store_path)
+
+def read_manifest(archive):
+    return json.loads(archive[MANIFEST_KEY].tobytes().decode('utf-8'))
+
+def read_table(archive, name, layout, columns):
+    """Decode the `columns` of the table `name` from an open archive. Returns a dict of column arrays."""
+    data = {}
+    for i, (column, kind) in enumerate(layout):
+        if column in columns:
+            arrays = [archive[f'{name}.{i}']] + ([archive[f'{name}.{i}{VALUES_SUFFIX}']] if kind == 'text' else [])
+            data[column] = decode_column(kind, arrays)
+    return data
+
+def load_view(store_path, columns=None, dtype=None):
+    """
+    Read the subject rows of a store, decoding only the tables (and their columns) that hold `columns`.
+
+    Parameters:
+    - store_path (str): Archive of the store, see get_store_path.
+    - columns (list): Subject columns to return, every column if None.
+    - dtype (dict): Column -> dtype the returned columns are converted to.
+
+    Returns:
+    - pd.DataFrame: The subject rows in their stored order.
+    """
+    with np.load(store_path) as archive:
+        manifest = read_manifest(archive)
+        columns = manifest['columns'] if columns is None else list(columns)
+        missing = [x for x in columns if x not in manifest['columns']]
+        if missing:
+            raise ValueError(f"Columns {missing} are not in the store {store_path}")
+        needed = {'course_aliases': [EVALUATION_ID, METADATA_ID] + [x for x in ALIAS_COLUMNS if x in columns],
+                  'course_metadata': [METADATA_ID] + [x for x in METADATA_COLUMNS if x in columns and x not in ALIAS_COLUMNS],
+                  'evaluations': [EVALUATION_ID] + [x for x in columns if x not in ALIAS_COLUMNS + METADATA_COLUMNS]}
+        tables = {name: read_table(archive, name, manifest['tables'][name], table_columns)
+                  for name, table_columns in needed.items() if name == 'course_aliases' or len(table_columns) > 1}
+    df = join_tables(tables, columns)
+    for column, column_dtype in (dtype or {}).items():
+        if column not in df.columns:
+            continue
+        if column_dtype is not str:
+            df[column] = df[column].astype(column_dtype)
+        elif df[column].dtype.kind in 'biuf':
+            # like a csv parsed with dtype=str (text columns already hold str values and NaN)
+            df[column] = df[column].map(str, na_action='ignore')
+    return df
+
+def read_subject_columns(csv_path):
+    """Columns of a subject table, without reading its rows."""
+    store_path = get_store_path(csv_path)
+    if os.path.exists(store_path):
+        with np.load(store_path) as archive:
+            return read_manifest(archive)['columns']
+    return list(pd.read_csv(csv_path, nrows=0).columns)
+
+def read_subject_table(csv_path, columns=None, dtype=None, float_precision=None):
+    """
+    Read the rows of a subject table from its store, or from the subject csv of a department not migrated yet.
+
+    Parameters:
+    - csv_path (str): Subject csv path of the department (see scrape.get_subject_csv_path), existing or not.
+    - columns (list): Columns to return, every column if None. Raises ValueError if one of them is missing.
+    - dtype (dict): Column -> dtype of the returned columns.
+    - float_precision (str): Passed on to read_csv for a subject csv, the store always returns the floats it was given.
+
+    Returns:
+    - pd.DataFrame: The subject rows.
+    """
+    store_path = get_store_path(csv_path)
+    if os.path.exists(store_path):
+        return load_view(store_path, columns, dtype)
+    return pd.read_csv(csv_path, usecols=columns, dtype=dtype, float_precision=float_precision)
+
+class SubjectTable(JournaledTable):
+    """The subject rows of a department: its store (or csv not migrated yet) plus the journal of the rows written since."""
+
+    def _read_snapshot(self):
+        if os.path.exists(get_table_file(self.csv_path)):
+            return read_subject_table(self.csv_path, float_precision='round_trip')
+        return pd.DataFrame(columns=self.columns)
+
+    def compact(self, df):
+        """Write the full table `df` as the new store, replacing the subject csv if there was one, and empty the journal."""
+        self.journal.sync()
+        store_path = get_store_path(self.csv_path)
+        try:
+            write_store(df, store_path)
+        except ValueError as e:
+            # keep the rows as a csv rather than losing them, the store is written again at the next compaction
+            print(f"Writing {self.csv_path} instead of its store: {e}")
+            write_csv_atomically(df, self.csv_path)
+            if os.path.exists(store_path):
+                os.remove(store_path)
+        else:
+            if os.path.exists(self.csv_path):
+                os.remove(self.csv_path)
+        self.journal.reset()
+        self.journaled_rows = 0
+
+def migrate_folder(csv_folder_path=CSV_FOLDER_PATH):
+    """
+    Replace every subject csv of the folder by its store.
+
+    Returns:
+    - list: (csv filename, csv size, store size) of every migrated department.
+    """
+    migrated = []
+    for csv_path in sorted(glob.glob(os.path.join(csv_folder_path, 'subject_*.csv'))):
+        store_path = get_store_path(csv_path)
+        if os.path.exists(store_path):
+            print(f"Skipping {csv_path}: the department is already read from {store_path}")
+            continue
+        try:
+            write_store(pd.read_csv(csv_path, float_precision='round_trip'), store_path)
+        except ValueError as e:
+            print(f"Skipping {csv_path}: {e}")
+            continue
+        migrated.append((os.path.basename(csv_path), os.path.getsize(csv_path), os.path.getsize(store_path)))
+        os.remove(csv_path)
+    return migrated
+
+def export_folder(csv_folder_path=CSV_FOLDER_PATH, export_folder_path=None):
+    """Write the full denormalized view of every store of the folder as a subject csv in `export_folder_path`. Returns the number of files."""
+    os.makedirs(export_folder_path, exist_ok=True)
+    store_paths = sorted(glob.glob(os.path.join(csv_folder_path, 'subject_*' + STORE_EXTENSION)))
+    for store_path in store_paths:
+        csv_filename = os.path.splitext(os.path.basename(store_path))[0] + '.csv'
+        write_csv_atomically(load_view(store_path), os.path.join(export_folder_path, csv_filename))
+    return len(store_paths)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Migrate subject csv files to the normalized store, or export subject csv files from it.")
+    parser.add_argument('--csv-folder', default=CSV_FOLDER_PATH, help="Folder of the scraped data.")
+    parser.add_argument('--migrate', action='store_true', help="Replace the subject csv files of older versions by their stores.")
+    parser.add_argument('--export', default=None, metavar='FOLDER', help="Write the denormalized subject csv files of the stores to this folder.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not args.migrate and not args.export:
+        print("Nothing to do, pass --migrate and/or --export FOLDER.")
+        return 1
+
+    # 1. Replace the subject csv files by their stores
+    if args.migrate:
+        migrated = migrate_folder(args.csv_folder)
+        for csv_filename, csv_size, store_size in migrated:
+            print(f"{csv_filename}: {csv_size/2**10:0.0f} KiB -> {os.path.splitext(csv_filename)[0]}{STORE_EXTENSION}: {store_size/2**10:0.0f} KiB")
+        print(f"Migrated {len(migrated)} departments.")
+
+    # 2. Export the denormalized view for csv consumers
+    if args.export:
+        num_files = export_folder(args.csv_folder, args.export)
+        print(f"Exported {num_files} subject csv files to {args.export}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+# Content-addressed on-disk cache of fetched html pages.
+# Page bodies are gzip-compressed and stored once per sha256 content hash under `blobs/`, while `index.jsonl` maps
+# each url to the hash of its latest body together with the fetch time, http status and size. The index is
+# append-only, so a crash can at worst lose the last entry, and the latest entry for a url always wins on load.
+
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+# 1. Constants
+CACHE_FOLDER_PATH = "page_cache"
+INDEX_FILENAME = "index.jsonl"
+BLOB_FOLDER_NAME = "blobs"
+
+# Minimal stand-in for requests.Response with the attributes the scraper reads
+CachedResponse = namedtuple('CachedResponse', ['url', 'status_code', 'content', 'from_cache'])
+
+class PageCache:
+    """Thread-safe, persistent cache of page bodies keyed by url and content hash."""
+
+    def __init__(self, folder_path=CACHE_FOLDER_PATH):
+        self.folder_path = folder_path
+        self.index_path = os.path.join(folder_path, INDEX_FILENAME)
+        self.blob_folder_path = os.path.join(folder_path, BLOB_FOLDER_NAME)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.blob_folder_path, exist_ok=True)
+        self.entries = self._load_index()
+
+    def _load_index(self):
+        """Read the index file, keeping the latest entry for each url."""
+        entries = {}
+        if not os.path.exists(self.index_path):
+            return entries
+        with open(self.index_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # a partially written last line from an interrupted run
+                    continue
+                entries[entry['url']] = entry
+        return entries
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.blob_folder_path, content_hash[:2], content_hash + '.html.gz')
+
+    def __contains__(self, url):
+        return url in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def metadata(self, url):
+        """Return the index entry (sha256, status, size, fetched_at) for a url, or None."""
+        return self.entries.get(url)
+
+    def get(self, url):
+        """Return the cached page for `url` as a CachedResponse, or None if it is not cached."""
+        entry = self.entries.get(url)
+        if entry is None:
+            with self.lock:
+                self.misses += 1
+            return None
+        try:
+            with gzip.open(self._blob_path(entry['sha256']), 'rb') as f:
+                content = f.read()
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return CachedResponse(url, entry['status'], content, True)
+
+    def put(self, url, status_code, content):
+        """Store a page body and record it in the index. Returns the content hash."""
+        # 1. Write the compressed body once per unique content hash
+        content_hash = hashlib.sha256(content).hexdigest()
+        blob_path = self._blob_path(content_hash)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            temp_path = f'{blob_path}.{threading.get_ident()}.tmp'
+            with gzip.open(temp_path, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, blob_path)
+
+        # 2. Append the index entry
+        entry = {'url': url, 'sha256': content_hash, 'status': status_code, 'size': len(content), 'fetched_at': time.time()}
+        with self.lock:
+            with open(self.index_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+            self.entries[url] = entry
+        return content_hash
+
+    def store_response(self, url, response):
+        """Cache a successful requests.Response. Error responses are not cached."""
+        if response is not None and response.status_code == 200:
+            self.put(url, response.status_code, response.content)
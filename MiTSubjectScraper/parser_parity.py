@@ -0,0 +1,124 @@
+# Differential check of the html parser backends.
+# Every page in the corpus (the fixture pages, plus optionally every evaluation page in the html cache) is run through
+# extract_data once per installed parser backend, and the resulting subject and professor records are compared against
+# the html.parser reference. Switching the scraper to a faster backend is only safe while this reports no mismatches.
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+import scrape
+from page_cache import PageCache, CACHE_FOLDER_PATH
+from mock_server import FIXTURE_PAGES_DIR
+from catalog_index import build_catalog_index
+
+REFERENCE_BACKEND = 'html.parser'
+
+def load_corpus(pages_dir=FIXTURE_PAGES_DIR, cache_dir=None):
+    """Return a list of (name, html bytes) evaluation pages from the fixture folder and optionally the html cache."""
+    corpus = []
+    for filename in sorted(os.listdir(pages_dir)):
+        if filename.startswith('evaluation_') and filename.endswith('.html'):
+            with open(os.path.join(pages_dir, filename), 'rb') as f:
+                corpus.append((filename, f.read()))
+    if cache_dir is not None:
+        page_cache = PageCache(cache_dir)
+        for url in sorted(page_cache.entries):
+            if 'subjectEvaluationReport' in url:
+                corpus.append((url, page_cache.get(url).content))
+    return corpus
+
+def extract_records(content, backend, catalog_index=None, url='', subject_number=scrape.SUBJECT_NUMBER):
+    """Parse a page with `backend` and return its (subject records, professor records) as lists of dicts."""
+    course_soup = scrape.make_soup(content, backend)
+    rows = scrape.make_subject_rows()
+    rows = scrape.extract_data(course_soup, catalog_index or {}, rows, url, subject_number)
+    return rows.to_records(), scrape.build_professor_table(rows.to_frame()).to_frame().to_dict('records')
+
+def values_match(a, b):
+    """Compare two record values, treating NaNs as equal and allowing for float rounding."""
+    if isinstance(a, float) and isinstance(b, float):
+        return (np.isnan(a) and np.isnan(b)) or np.isclose(a, b)
+    return a == b
+
+def compare_records(reference, candidate):
+    """Return a list of human readable differences between two lists of records."""
+    if len(reference) != len(candidate):
+        return [f'{len(reference)} records vs {len(candidate)} records']
+    differences = []
+    for i, (reference_record, candidate_record) in enumerate(zip(reference, candidate)):
+        for column, reference_value in reference_record.items():
+            candidate_value = candidate_record.get(column)
+            if not values_match(reference_value, candidate_value):
+                differences.append(f'record {i}, {column}: {reference_value!r} vs {candidate_value!r}')
+    return differences
+
+def check_parity(corpus, backends=None, catalog_index=None):
+    """
+    Run every page of the corpus through every backend and compare against the reference backend.
+
+    Returns:
+    - dict: backend -> list of (page name, differences) for the pages whose records do not match.
+    - dict: backend -> total parse and extraction time in seconds.
+    """
+    backends = backends or scrape.get_available_parser_backends()
+    mismatches = {backend: [] for backend in backends}
+    timings = {backend: 0.0 for backend in backends}
+    for name, content in corpus:
+        reference = None
+        for backend in [REFERENCE_BACKEND] + [x for x in backends if x != REFERENCE_BACKEND]:
+            start_time = time.perf_counter()
+            try:
+                records = extract_records(content, backend, catalog_index, name)
+            except Exception as e:
+                records = e
+            elapsed_time = time.perf_counter() - start_time
+            if backend in timings:
+                timings[backend] += elapsed_time
+
+            # 1. The reference backend defines the expected records
+            if backend == REFERENCE_BACKEND:
+                reference = records
+                continue
+
+            # 2. Every other backend must fail the same way or produce the same records
+            if isinstance(reference, Exception) or isinstance(records, Exception):
+                if type(reference) is not type(records):
+                    mismatches[backend].append((name, [f'{reference!r} vs {records!r}']))
+                continue
+            differences = compare_records(reference[0], records[0]) + compare_records(reference[1], records[1])
+            if differences:
+                mismatches[backend].append((name, differences))
+
+    return mismatches, timings
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that every html parser backend extracts the same records.")
+    parser.add_argument('--pages-dir', default=FIXTURE_PAGES_DIR, help="Folder of fixture evaluation pages.")
+    parser.add_argument('--cache-dir', default=None, nargs='?', const=CACHE_FOLDER_PATH,
+                        help="Also check every evaluation page in the html cache.")
+    parser.add_argument('--backends', nargs='+', default=None, choices=scrape.PARSER_BACKENDS,
+                        help="Backends to check (default: every installed backend).")
+    args = parser.parse_args(argv)
+
+    # 1. Load the corpus and the fixture catalog page so the catalog columns are compared as well
+    corpus = load_corpus(args.pages_dir, args.cache_dir)
+    with open(os.path.join(args.pages_dir, 'catalog.html'), 'rb') as f:
+        catalog_index = build_catalog_index(scrape.make_soup(f.read(), REFERENCE_BACKEND))
+
+    # 2. Compare the backends
+    mismatches, timings = check_parity(corpus, args.backends, catalog_index)
+    for backend, backend_mismatches in mismatches.items():
+        print(f"{backend}: {len(corpus) - len(backend_mismatches)}/{len(corpus)} pages match, {timings[backend]/len(corpus)*1e3:0.2f} ms/page")
+        for name, differences in backend_mismatches:
+            print(f"  {name}:")
+            for difference in differences:
+                print(f"    {difference}")
+
+    return 1 if any(mismatches.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+# Shared data loading and filtering for the plotting scripts.
+# Only the columns a figure needs are parsed (the long Description column is never read unless asked for), with
+# explicit dtypes, and the parsed columns are cached per csv path and modification time so plotting several figures
+# from the same file parses it once. The columns are read from the normalized store of the department (see
+# normalized_store.py), or from its subject csv if it was not migrated yet. Filters are combined into a single boolean
+# mask and applied with one copy.
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from normalized_store import get_table_file, read_subject_columns, read_subject_table
+
+# 1. Constants
+# Columns every filter may use, always loaded alongside the requested ones
+FILTER_COLUMNS = ["Year", "Term", "Level (U or G)", "Number of Respondents"]
+# Storage types of the subject csv columns (the averages and stds not listed here are float64)
+SUBJECT_CSV_DTYPES = {"Year": np.int64, "Term": "category", "Level (U or G)": "category", "Number of Respondents": np.float64,
+                      "Course Number": str, "Subject Name": str, "Description": str, "Teachers": str, "Webpage Link": str,
+                      "Teacher Ratings": str, "Teacher Helpfulness Ratings": str, "Teacher Rating Counts": str}
+
+# (absolute csv path) -> (modification time, dataframe of the columns parsed so far)
+_cache = {}
+
+def get_dtype(column):
+    return SUBJECT_CSV_DTYPES.get(column, np.float64)
+
+def load_subject_data(csv_path, columns=None):
+    """
+    Load `columns` (plus the FILTER_COLUMNS) of a subject table, reusing the columns already parsed from the same file
+    as long as it has not been modified since.
+
+    Returns:
+    - pd.DataFrame: The requested columns. It is shared with the cache, so copy it before modifying it in place.
+    """
+    path = os.path.abspath(csv_path)
+    mtime = os.stat(get_table_file(path)).st_mtime_ns
+    header = read_subject_columns(path)
+    wanted = list(dict.fromkeys(FILTER_COLUMNS + list(header if columns is None else columns)))
+
+    # 1. Drop the cached columns if the file changed, then parse only the missing columns
+    cached_mtime, df = _cache.get(path, (None, None))
+    if cached_mtime != mtime:
+        df = None
+    missing = [column for column in wanted if df is None or column not in df.columns]
+    if missing:
+        dtype = {column: get_dtype(column) for column in missing}
+        loaded = read_subject_table(path, missing, dtype)
+        df = loaded if df is None else pd.concat([df, loaded], axis=1)
+        _cache[path] = (mtime, df)
+
+    return df[wanted]
+
+def make_filter_mask(df, levels=None, terms=None, min_year=None, max_year=None, min_responses=None):
+    """Combine the filters into one boolean mask over the rows of `df` (None disables a filter)."""
+    mask = np.ones(len(df), dtype=bool)
+    if levels is not None:
+        mask &= df['Level (U or G)'].isin(levels).to_numpy()
+    if terms is not None:
+        mask &= df['Term'].isin(terms).to_numpy()
+    if min_year is not None:
+        mask &= (df['Year'] >= min_year).to_numpy()
+    if max_year is not None:
+        mask &= (df['Year'] <= max_year).to_numpy()
+    if min_responses is not None:
+        mask &= (df['Number of Respondents'] >= min_responses).to_numpy()
+    return mask
+
+def load_filtered(csv_path, columns=None, **filters):
+    """Load the columns of a subject csv (cached) and return the rows passing `filters` (see make_filter_mask)."""
+    df = load_subject_data(csv_path, columns)
+    return df.loc[make_filter_mask(df, **filters)].reset_index(drop=True)
+
+def clear_cache():
+    _cache.clear()
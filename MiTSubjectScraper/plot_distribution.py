@@ -1,8 +1,8 @@
 # Plots a distribution of a column of interest in a csv.
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 import os
+from plot_data import load_filtered
 from stats_utils import weighted_nanmedian, weighted_nanmean, weighted_nanstd
 
 # Use LaTeX settings for Matplotlib text rendering
@@ -18,6 +18,8 @@ terms = None # ['Fall']
 min_year = 2004
 max_year = 2023
 min_responses = 1
+# 0.2 Specify which column you would like to plot
+var_name = 'Teacher Rating (Avg)'
 
 # 1. Access the contents of the csv of interest
 # 1.1 Load the csv file
@@ -27,41 +29,24 @@ csv_folder = './course_csv_data/scuffed_csv_files'
 csv_filename = 'subject_2_scuffed.csv'
 # 1.1.3 Make the csv path
 csv_path = os.path.join(csv_folder,csv_filename)
-# 1.1.4 Load the csv into a DataFrame
-df = pd.read_csv(csv_path)
+# 1.1.4 Load the columns needed for the plot and keep the rows passing the filters
+df = load_filtered(csv_path, columns=[var_name],
+                   levels=['G'] if filter_grad else None,
+                   terms=terms,
+                   min_year=min_year,
+                   max_year=max_year,
+                   min_responses=min_responses)
 # 1.1.5 Print the columns of the df
 print(df.columns)
 
-# 1.2 Filter the df
-# 1.2.1 Filter out graduate/undergraduate courses
-if filter_grad:
-    df = df.loc[df['Level (U or G)'].values == 'G']
-    df = df.reset_index()
-# 1.2.2 Filter out terms
-if terms is not None:
-    temp_df = pd.DataFrame()
-    for term in terms:
-        temp_df = pd.concat([temp_df,df.loc[df['Term'].values == term]])
-    df = temp_df
-    temp_df = None
-# 1.2.3 Filter out data beyond the year range
-df = df.loc[df['Year'].values >= min_year]
-df = df.loc[df['Year'].values <= max_year]
-# 1.2.4 Filter out data that does not satisfy min responses
-df = df.loc[df['Number of Respondents'].values >= min_responses]
-df.reset_index()
-
-# 2. Specify which column you would like to plot
-var_name = 'Teacher Rating (Avg)'
-
-# 3. Plot the distribution of the variable of interest
-# 3.1 Access the data vector from the dataframe
+# 2. Plot the distribution of the variable of interest
+# 2.1 Access the data vector from the dataframe
 data_slice = np.array(df[var_name])
-# 3.1.1 Obtain stats for the data slice
+# 2.1.1 Obtain stats for the data slice
 median = weighted_nanmedian(data_slice, weights=df['Number of Respondents'].values)
 mean = weighted_nanmean(data_slice, weights=df['Number of Respondents'].values)
 std = weighted_nanstd(data_slice, weights=df['Number of Respondents'].values)
-# 3.2 Use matplotlib to plot histogram
+# 2.2 Use matplotlib to plot histogram
 fig = plt.figure(1)
 hist = plt.hist(data_slice,bins=NUM_BINS,weights=df['Number of Respondents'].values)
 plt.vlines([median],ymin=0,ymax=hist[0].max()*1.2,colors=['r'],linestyles=['dashed'],label=f'Median = {median:.2f}')
@@ -1,8 +1,9 @@
 # Plots a line plot with respect to time (years) of a variable of interest.
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 import os
+from plot_data import load_filtered
+from stats_utils import bootstrap_ci_by
 
 # 0. Specify constants
 NUM_BINS = 25
@@ -23,30 +24,16 @@ csv_folder = './course_csv_data/scuffed_csv_files'
 csv_filename = 'subject_2_scuffed.csv'
 # 1.1.3 Make the csv path
 csv_path = os.path.join(csv_folder,csv_filename)
-# 1.1.4 Load the csv into a DataFrame
-df = pd.read_csv(csv_path)
+# 1.1.4 Load the columns needed for the plot and keep the rows passing the filters
+df = load_filtered(csv_path, columns=[VAR_NAME],
+                   levels=['G'] if filter_grad else None,
+                   terms=terms,
+                   min_year=min_year,
+                   max_year=max_year,
+                   min_responses=min_responses)
 # 1.1.5 Print the columns of the df
 print(df.columns)
 
-# 1.2 Filter the df
-# 1.2.1 Filter out graduate/undergraduate courses
-if filter_grad:
-    df = df.loc[df['Level (U or G)'].values == 'G']
-    df = df.reset_index()
-# 1.2.2 Filter out terms
-if terms is not None:
-    temp_df = pd.DataFrame()
-    for term in terms:
-        temp_df = pd.concat([temp_df,df.loc[df['Term'].values == term]])
-    df = temp_df
-    temp_df = None
-# 1.2.3 Filter out data beyond the year range
-df = df.loc[df['Year'].values >= min_year]
-df = df.loc[df['Year'].values <= max_year]
-# 1.2.4 Filter out data that does not satisfy min responses
-df = df.loc[df['Number of Respondents'].values >= min_responses]
-df.reset_index()
-
 # 2. Plot the time plot of the variable of interest with respect to years
 # 2.1 Access the data vector from the dataframe
 data_slice = np.array(df[VAR_NAME])
@@ -59,6 +46,10 @@ time_slice = time_slice[good_indices]
 # 2.2 Use matplotlib to plot histogram
 fig = plt.figure(1)
 plt.scatter(x=time_slice,y=data_slice)
+# 2.4 Add the yearly weighted mean with its bootstrap confidence band
+yearly = bootstrap_ci_by(df, [VAR_NAME], 'Number of Respondents', 'Year')[VAR_NAME].dropna()
+plt.plot(yearly.index, yearly['estimate'], color='r', label='Weighted mean')
+plt.fill_between(yearly.index, yearly['lower'], yearly['upper'], color='r', alpha=0.2, label='95% confidence interval')
 plt.xlim([min_year, max_year])
 plt.xticks(np.arange(np.nanmin(time_slice), np.nanmax(time_slice)))
 plt.grid()
@@ -0,0 +1,114 @@
+# Porter stemmer (M.F. Porter, "An algorithm for suffix stripping", 1980), used by the course search index.
+# The steps follow the published algorithm: a word is seen as [C](VC)^m[V] where C and V are runs of consonants and
+# vowels, and each step replaces a suffix only if the measure m of the remaining stem satisfies the step's condition.
+# Step 2 includes the 'bli' and 'logi' rules of Porter's later reference implementation. Inflected forms reduce to the
+# same stem ('material'/'materials' -> 'materi', 'process'/'processes' -> 'process', 'engineer'/'engineering' -> 'engin').
+
+# 1. Constants
+VOWELS = frozenset('aeiou')
+# (suffix, replacement) of steps 2 and 3, tried in order; the first suffix the word ends with is the only one considered
+STEP_2_RULES = [('ational', 'ate'), ('tional', 'tion'), ('enci', 'ence'), ('anci', 'ance'), ('izer', 'ize'), ('bli', 'ble'),
+                ('alli', 'al'), ('entli', 'ent'), ('eli', 'e'), ('ousli', 'ous'), ('ization', 'ize'), ('ation', 'ate'),
+                ('ator', 'ate'), ('alism', 'al'), ('iveness', 'ive'), ('fulness', 'ful'), ('ousness', 'ous'),
+                ('aliti', 'al'), ('iviti', 'ive'), ('biliti', 'ble'), ('logi', 'log')]
+STEP_3_RULES = [('icate', 'ic'), ('ative', ''), ('alize', 'al'), ('iciti', 'ic'), ('ical', 'ic'), ('ful', ''), ('ness', '')]
+# Suffixes removed by step 4; the longest suffix the word ends with is the only one considered
+STEP_4_SUFFIXES = ['al', 'ance', 'ence', 'er', 'ic', 'able', 'ible', 'ant', 'ement', 'ment', 'ent', 'ion', 'ou', 'ism',
+                   'ate', 'iti', 'ous', 'ive', 'ize']
+STEP_4_SUFFIXES = sorted(STEP_4_SUFFIXES, key=len, reverse=True)
+
+def is_consonant(word, i):
+    """A letter other than a vowel, and 'y' only when it follows a vowel (or starts the word)."""
+    if word[i] in VOWELS:
+        return False
+    if word[i] == 'y':
+        return i == 0 or not is_consonant(word, i - 1)
+    return True
+
+def measure(stem):
+    """Number m of vowel-consonant sequences in the stem."""
+    m = 0
+    previous_vowel = False
+    for i in range(len(stem)):
+        consonant = is_consonant(stem, i)
+        if consonant and previous_vowel:
+            m += 1
+        previous_vowel = not consonant
+    return m
+
+def contains_vowel(stem):
+    return any(not is_consonant(stem, i) for i in range(len(stem)))
+
+def ends_with_double_consonant(word):
+    return len(word) >= 2 and word[-1] == word[-2] and is_consonant(word, len(word) - 1)
+
+def ends_cvc(word):
+    """The word ends consonant-vowel-consonant, the last consonant not being w, x or y ('hop', not 'snow')."""
+    return (len(word) >= 3 and is_consonant(word, len(word) - 3) and not is_consonant(word, len(word) - 2)
+            and is_consonant(word, len(word) - 1) and word[-1] not in 'wxy')
+
+def replace_suffix(word, rules, min_measure):
+    """Apply the first rule whose suffix ends the word, if the measure of the remaining stem exceeds `min_measure`."""
+    for suffix, replacement in rules:
+        if word.endswith(suffix):
+            stem = word[:-len(suffix)]
+            return stem + replacement if measure(stem) > min_measure else word
+    return word
+
+def step_1(word):
+    # 1a. Plurals
+    if word.endswith('sses') or word.endswith('ies'):
+        word = word[:-2]
+    elif word.endswith('s') and not word.endswith('ss'):
+        word = word[:-1]
+
+    # 1b. Past participles and gerunds
+    if word.endswith('eed'):
+        if measure(word[:-3]) > 0:
+            word = word[:-1]
+    else:
+        for suffix in ('ed', 'ing'):
+            if word.endswith(suffix) and contains_vowel(word[:-len(suffix)]):
+                word = word[:-len(suffix)]
+                if word.endswith(('at', 'bl', 'iz')):
+                    word += 'e'
+                elif ends_with_double_consonant(word) and word[-1] not in 'lsz':
+                    word = word[:-1]
+                elif measure(word) == 1 and ends_cvc(word):
+                    word += 'e'
+                break
+
+    # 1c. Terminal y
+    if word.endswith('y') and contains_vowel(word[:-1]):
+        word = word[:-1] + 'i'
+    return word
+
+def step_4(word):
+    for suffix in STEP_4_SUFFIXES:
+        if word.endswith(suffix):
+            stem = word[:-len(suffix)]
+            if measure(stem) > 1 and (suffix != 'ion' or stem.endswith(('s', 't'))):
+                return stem
+            return word
+    return word
+
+def step_5(word):
+    # 5a. Final e
+    if word.endswith('e'):
+        stem = word[:-1]
+        if measure(stem) > 1 or (measure(stem) == 1 and not ends_cvc(stem)):
+            word = stem
+    # 5b. Final double l
+    if measure(word) > 1 and word.endswith('ll'):
+        word = word[:-1]
+    return word
+
+def stem(word):
+    """Porter stem of a lowercase word ('robotics' -> 'robot', 'mechanical' -> 'mechan')."""
+    if len(word) <= 2:
+        return word
+    word = step_1(word)
+    word = replace_suffix(word, STEP_2_RULES, 0)
+    word = replace_suffix(word, STEP_3_RULES, 0)
+    word = step_4(word)
+    return step_5(word)
@@ -0,0 +1,260 @@
+# In-memory store of the professor ratings.
+# Teachers are kept in a dict keyed by their normalized name, so looking up and updating a teacher is O(1) instead of
+# a scan (and for all-caps names, a regex search) over every row of the professor dataframe. All-caps names from the
+# evaluation pages (e.g. 'J SMITH') are matched through a secondary index keyed by (first initial, last name).
+#
+# The table is derived from the subject rows by build_professor_table, one batch of new rows at a time, so it can be
+# rebuilt from the subject csv files after a fix. Each teacher of a page is credited with their own rating, helpfulness
+# and number of ratings, kept in the per-teacher subject columns. Instead of a running mean and std, each teacher holds sufficient
+# statistics (number of ratings, weighted sums and sums of squares of the rating and helpfulness, number of classes).
+# Adding a class, or merging the stores of separate crawls, is a plain addition, so the result does not depend on the
+# order pages were processed in. The averages and standard deviations of the professor csv are derived from the
+# statistics when the dataframe is built, and the statistics are recovered exactly from the csv when it is loaded.
+
+import numpy as np
+import pandas as pd
+
+from stats_utils import weighted_mean_and_std_from_sums
+
+# 1. Constants
+# Subject columns the professor table is derived from
+TEACHER_SOURCE_COLUMNS = ["Teachers", "Teacher Rating (Avg)", "Teacher Helpfulness (Avg)", "Number of Respondents", "Webpage Link",
+                          "Teacher Ratings", "Teacher Helpfulness Ratings", "Teacher Rating Counts"]
+# Per-teacher subject columns, in the order of the (rating, helpfulness, number of ratings) observations, and the page
+# columns standing in for them in rows scraped before they existed
+TEACHER_VALUE_COLUMNS = ["Teacher Ratings", "Teacher Helpfulness Ratings", "Teacher Rating Counts"]
+PAGE_VALUE_COLUMNS = ["Teacher Rating (Avg)", "Teacher Helpfulness (Avg)", "Number of Respondents"]
+TEACHER_SEPARATOR = '; '
+PROFESSOR_COLUMNS = ["Teacher Name", "Teacher Rating (Avg)", "Teacher Rating (STD)","Teacher Helpfulness (Avg)","Teacher Helpfulness (STD)","Number of Ratings","Number of Classes"]
+UNKNOWN_TEACHER_NAME = 'Unknown'
+
+# Custom Exception Handling
+class MultipleTeacherMatches(Exception):
+    pass
+
+# Sufficient statistics kept per teacher. Each class contributes its mean rating weighted by its number of ratings, so
+# the statistics of two sets of classes (e.g. from different workers, departments or terms) are combined by addition.
+STAT_FIELDS = ["Number of Ratings", "Rating Sum", "Rating Sum of Squares", "Helpfulness Sum", "Helpfulness Sum of Squares", "Number of Classes"]
+
+def stats_from_ratings(rating, rating_std, helpfulness, helpfulness_std, num_ratings, num_classes):
+    """Convert professor csv values (scalars or arrays) into sufficient statistics, the inverse of ratings_from_stats."""
+    rating, rating_std, helpfulness, helpfulness_std, num_ratings, num_classes = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (rating, rating_std, helpfulness, helpfulness_std, num_ratings, num_classes)))
+    return np.stack([num_ratings,
+                     num_ratings * rating,
+                     num_ratings * (rating_std**2 + rating**2),
+                     num_ratings * helpfulness,
+                     num_ratings * (helpfulness_std**2 + helpfulness**2),
+                     num_classes], axis=-1)
+
+def ratings_from_stats(stats):
+    """
+    Convert an (n, len(STAT_FIELDS)) array of sufficient statistics into the professor csv columns.
+
+    Returns:
+    - tuple of arrays: rating avg, rating std, helpfulness avg, helpfulness std, number of ratings, number of classes
+    """
+    stats = np.asarray(stats, dtype=float).reshape(-1, len(STAT_FIELDS))
+    num_ratings = stats[:, 0]
+    rating, rating_std = weighted_mean_and_std_from_sums(stats[:, 1], stats[:, 2], num_ratings)
+    helpfulness, helpfulness_std = weighted_mean_and_std_from_sums(stats[:, 3], stats[:, 4], num_ratings)
+    return rating, rating_std, helpfulness, helpfulness_std, num_ratings, stats[:, 5]
+
+def aggregate_teacher_stats(teacher_names, teacher_ratings, teacher_helps, num_votes):
+    """
+    Sum the sufficient statistics of many (teacher, class) observations at once.
+
+    Parameters:
+    - teacher_names (array-like): Canonical teacher name of each observation.
+    - teacher_ratings, teacher_helps, num_votes (array-like): The class ratings and the number of ratings behind them.
+
+    Returns:
+    - list: The distinct teacher names, in order of first appearance.
+    - np.ndarray: (number of teachers, len(STAT_FIELDS)) summed statistics.
+    """
+    teacher_names = np.asarray(teacher_names, dtype=object)
+    if len(teacher_names) == 0:
+        return [], np.zeros((0, len(STAT_FIELDS)))
+    _, first_index, inverse = np.unique(teacher_names.astype(str), return_index=True, return_inverse=True)
+    # renumber the groups by first appearance so the output keeps the order the teachers were seen in
+    order = np.argsort(first_index, kind='stable')
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    group = rank[inverse.ravel()]
+    observations = stats_from_ratings(teacher_ratings, 0, teacher_helps, 0, num_votes, 1)
+    stats = np.column_stack([np.bincount(group, weights=observations[:, i], minlength=len(order)) for i in range(len(STAT_FIELDS))])
+    return list(teacher_names[first_index[order]]), stats
+
+def normalize_teacher_name(teacher_name):
+    """Collapse the whitespace of a teacher name ('Jane  Doe ' -> 'Jane Doe')."""
+    return ' '.join(str(teacher_name).split())
+
+def get_block_key(teacher_name):
+    """(first initial, last name) of a teacher, used to match the all-caps names of some evaluation pages."""
+    words = teacher_name.split(' ')
+    return (words[0][:1], words[-1])
+
+class ProfessorStore:
+    """
+    Sufficient statistics of the professor ratings keyed by normalized teacher name, in the order the teachers were
+    first seen. Stores built from separate crawls can be combined with `merge`.
+    """
+
+    def __init__(self):
+        # teacher name -> np.ndarray of the teacher's STAT_FIELDS
+        self.teachers = {}
+        # (first initial, last name) -> names of the teachers in that block
+        self.blocks = {}
+        # teachers added or updated since the last call to take_changed
+        self.changed = set()
+
+    @classmethod
+    def from_frame(cls, professor_df):
+        """Create a store from a professor dataframe (e.g. professor_ratings.csv)."""
+        store = cls()
+        names = professor_df['Teacher Name'].fillna(UNKNOWN_TEACHER_NAME).to_numpy()
+        stats = stats_from_ratings(*(professor_df[column].to_numpy(dtype=float) for column in PROFESSOR_COLUMNS[1:]))
+        for teacher_name, teacher_stats in zip(names, stats):
+            teacher_name = normalize_teacher_name(teacher_name)
+            if teacher_name not in store.teachers:
+                store._insert(teacher_name, teacher_stats)
+        store.changed.clear()
+        return store
+
+    @classmethod
+    def from_stats(cls, teacher_names, stats):
+        """Create a store from canonical teacher names and their (n, len(STAT_FIELDS)) statistics."""
+        store = cls()
+        for teacher_name, teacher_stats in zip(teacher_names, np.asarray(stats, dtype=float)):
+            store._insert(teacher_name, teacher_stats.copy())
+        return store
+
+    def __len__(self):
+        return len(self.teachers)
+
+    def __contains__(self, teacher_name):
+        return normalize_teacher_name(teacher_name) in self.teachers
+
+    def _insert(self, teacher_name, teacher_stats):
+        self.teachers[teacher_name] = teacher_stats
+        self.blocks.setdefault(get_block_key(teacher_name), []).append(teacher_name)
+        self.changed.add(teacher_name)
+
+    def find(self, teacher_name):
+        """
+        Return the stored name matching `teacher_name`, or None if the teacher is new.
+        All-caps names match any stored teacher with the same first initial and last name.
+        """
+        teacher_name = normalize_teacher_name(teacher_name)
+        if not teacher_name.isupper():
+            return teacher_name if teacher_name in self.teachers else None
+        matches = self.blocks.get(get_block_key(teacher_name.title()), [])
+        if len(matches) > 1:
+            raise MultipleTeacherMatches("Multiple matches found for teacher: {}".format(teacher_name.title()))
+        return matches[0] if matches else None
+
+    def canonical_name(self, teacher_name):
+        """
+        Return the name `teacher_name` is stored under (its existing match, or its own normalized form for a new
+        teacher), or None if it is empty or an all-caps name matching several teachers.
+        """
+        teacher_name = normalize_teacher_name(teacher_name)
+        if not teacher_name:
+            return None
+        try:
+            stored_name = self.find(teacher_name)
+        except MultipleTeacherMatches:
+            return None
+        if stored_name is not None:
+            return stored_name
+        return teacher_name.title() if teacher_name.isupper() else teacher_name
+
+    def add_stats(self, teacher_name, teacher_stats):
+        """Add statistics to a teacher stored under its canonical name."""
+        if teacher_name in self.teachers:
+            self.teachers[teacher_name] = self.teachers[teacher_name] + teacher_stats
+            self.changed.add(teacher_name)
+        else:
+            self._insert(teacher_name, np.array(teacher_stats, dtype=float))
+
+    def merge(self, other):
+        """Add the statistics of another store into this one. Merging is associative and commutative."""
+        for teacher_name, teacher_stats in other.teachers.items():
+            teacher_name = self.canonical_name(teacher_name)
+            if teacher_name is not None:
+                self.add_stats(teacher_name, teacher_stats)
+        return self
+
+    def take_changed(self):
+        """Return the names of the teachers added or updated since the last call, and reset the set."""
+        changed, self.changed = self.changed, set()
+        return changed
+
+    def to_frame(self, teacher_names=None):
+        """Materialize the store (or only the teachers in `teacher_names`) as a professor dataframe."""
+        names = list(self.teachers if teacher_names is None else teacher_names)
+        stats = np.array([self.teachers[name] for name in names]).reshape(-1, len(STAT_FIELDS))
+        df = pd.DataFrame(dict(zip(PROFESSOR_COLUMNS, [names, *ratings_from_stats(stats)])), columns=PROFESSOR_COLUMNS)
+        # the counts are whole numbers, keep them as integers in the csv
+        for column in ["Number of Ratings", "Number of Classes"]:
+            if np.isfinite(df[column]).all():
+                df[column] = df[column].round().astype(np.int64)
+        return df
+
+def join_teacher_values(values):
+    """Join the values of the teachers of a page into one per-teacher subject column value ([5.9, 5.4] -> '5.9; 5.4')."""
+    return TEACHER_SEPARATOR.join(str(x) for x in values)
+
+def explode_teachers(subject_df):
+    """
+    Split the subject rows into one (teacher, rating, helpfulness, number of ratings) observation per teacher and page.
+
+    A page listing several courses produces one subject row per course, so rows are first deduplicated by their
+    webpage link. The values of each teacher come from the per-teacher columns. Rows without them (scraped before
+    they were added) fall back to the page's average teacher rating and helpfulness, weighted by its number of
+    respondents.
+    """
+    df = subject_df.drop_duplicates(subset='Webpage Link')
+    df = df.loc[df['Teachers'].notna()]
+    teachers = df['Teachers'].astype(str).str.split(TEACHER_SEPARATOR)
+    counts = teachers.str.len().to_numpy()
+    names = pd.Series(np.concatenate(teachers.to_numpy()) if len(teachers) else [], dtype=object).str.split().str.join(' ')
+    values = [np.repeat(df[column].to_numpy(dtype=float), counts) for column in PAGE_VALUE_COLUMNS]
+
+    # 1. Replace the page values by the teacher values wherever a row has one value per teacher in every column
+    if all(column in df.columns for column in TEACHER_VALUE_COLUMNS):
+        has_values = df[TEACHER_VALUE_COLUMNS].notna().all(axis=1).to_numpy()
+        split_values = [df.loc[has_values, column].astype(str).str.split(TEACHER_SEPARATOR).to_numpy() for column in TEACHER_VALUE_COLUMNS]
+        matching = np.logical_and.reduce([np.array([len(x) for x in column_values], dtype=int) == counts[has_values] for column_values in split_values])
+        if matching.any():
+            selected = has_values.copy()
+            selected[has_values] = matching
+            teacher_mask = np.repeat(selected, counts)
+            for page_values, column_values in zip(values, split_values):
+                page_values[teacher_mask] = np.concatenate(column_values[matching]).astype(float)
+
+    keep = (names != '').to_numpy() & (names != 'nan').to_numpy()
+    return (names.to_numpy()[keep], *(x[keep] for x in values))
+
+def build_professor_table(subject_df, professors=None):
+    """
+    Derive professor ratings from subject rows and add them to `professors`.
+
+    Parameters:
+    - subject_df (pd.DataFrame): Subject rows not yet counted in `professors`, e.g. the rows added since the last build.
+    - professors (ProfessorStore): Store to update, a new store is created if None.
+
+    Returns:
+    - ProfessorStore: The updated store, its `changed` set holds the teachers touched by `subject_df`.
+    """
+    professors = ProfessorStore() if professors is None else professors
+
+    # 1. Sum the statistics of the new rows per teacher name in one vectorized pass
+    names, stats = aggregate_teacher_stats(*explode_teachers(subject_df))
+
+    # 2. Fold them into the store, resolving all-caps names in the order the teachers appear
+    for teacher_name, teacher_stats in zip(names, stats):
+        teacher_name = professors.canonical_name(teacher_name)
+        if teacher_name is not None:
+            professors.add_stats(teacher_name, teacher_stats)
+
+    return professors
@@ -0,0 +1,85 @@
+# Single-pass index of the per-question tables on new-format evaluation pages.
+# Every `indivQuestions` table is walked once and each row is reduced to its text and (avg, std, n) values, so the
+# metric extractors in scrape.py become lookups or pattern matches against the index instead of repeated soup scans.
+
+from collections import namedtuple
+
+import numpy as np
+
+from telemetry import timed
+
+# A single question row: the full row text, the question text and the parsed statistics
+QuestionRow = namedtuple('QuestionRow', ['text', 'question', 'avg', 'std', 'n'])
+
+def parse_float(text):
+    """Convert a table cell to a float, or np.nan if it is not a number."""
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return np.nan
+
+def parse_question_row(table_row):
+    """Reduce a <tr> of an indivQuestions table to a QuestionRow."""
+    cells = table_row.find_all('td')
+    text = table_row.get_text()
+    if not cells:
+        return QuestionRow(text, text.strip(), np.nan, np.nan, np.nan)
+
+    # 1. The average lives in the cell with class="avg" and the standard deviation in the last cell
+    avg_cell = table_row.find('td', class_='avg')
+    avg = parse_float(avg_cell.get_text()) if avg_cell is not None else np.nan
+    std = parse_float(cells[-1].get_text())
+
+    # 2. The number of responses is the first whole number after the average
+    n = np.nan
+    start = cells.index(avg_cell) + 1 if avg_cell is not None else 1
+    for cell in cells[start:-1]:
+        cell_text = cell.get_text().strip()
+        if cell_text.isdigit():
+            n = int(cell_text)
+            break
+
+    return QuestionRow(text, cells[0].get_text().strip(), avg, std, n)
+
+class QuestionIndex:
+    """Index of question text -> (avg, std, n) for the indivQuestions tables of a new-format page."""
+
+    def __init__(self, tables):
+        # list of (table text, [QuestionRow]) in document order
+        self.tables = tables
+        self.questions = {}
+        for _, rows in tables:
+            for row in rows:
+                self.questions.setdefault(row.question, (row.avg, row.std, row.n))
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __getitem__(self, question):
+        return self.questions[question]
+
+    def table_rows(self, patterns):
+        """Rows of the first table whose text contains any of `patterns`, or None."""
+        for table_text, rows in self.tables:
+            if any(pattern in table_text for pattern in patterns):
+                return rows
+        return None
+
+    def find_row(self, patterns, rows=None):
+        """First row (of `rows`, or of the whole page) whose text contains any of `patterns`, or None."""
+        if rows is None:
+            rows = (row for _, table_rows in self.tables for row in table_rows)
+        for row in rows:
+            if any(pattern in row.text for pattern in patterns):
+                return row
+        return None
+
+@timed('extract.build_question_index')
+def build_question_index(course_soup):
+    """Walk the indivQuestions tables of a new-format page once and build its QuestionIndex."""
+    tables = []
+    for table in course_soup.find_all('table', class_='indivQuestions'):
+        body = table.find('tbody') or table
+        rows = [parse_question_row(table_row) for table_row in body.find_all('tr')]
+        tables.append((table.get_text(), rows))
+    return QuestionIndex(tables)
@@ -0,0 +1,186 @@
+# Ranking of courses by a metric, for the bar chart of the highest/lowest rated courses.
+# The subject csv files of every department are loaded once into flat numpy columns (course id, year, term, level,
+# respondents and the respondent-weighted metric values). A query over a time window sums the rows of the window per
+# course with np.bincount, keeps the courses with enough reviews, and selects the top (or bottom) k courses with
+# np.argpartition, so only the k selected courses are sorted. Per course sums are cached per metric and window, so
+# switching between highest/lowest, k or the minimum number of reviews does not rescan the rows. The result is a
+# compact Plotly figure dict (plain lists, no Plotly dependency) that can be loaded with plotly.io.read_json or passed to
+# Plotly.newPlot.
+
+import argparse
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from analyze import get_department
+from normalized_store import find_subject_tables, read_subject_columns
+from plot_data import load_subject_data, make_filter_mask
+from scraped_index import parse_course_number
+from stats_utils import weighted_mean_and_std_from_sums
+
+# 1. Constants
+CSV_FOLDER_PATH = "course_csv_data"
+WEIGHT_COLUMN = "Number of Respondents"
+COURSE_COLUMNS = ["Course Number", "Subject Name"]
+# A row is the evaluation page of a course in a term, the same in every department csv listing it
+EVALUATION_COLUMNS = ["Webpage Link", "Course Number", "Year", "Term"]
+DEFAULT_K = 20
+
+class CourseRanker:
+    """Per course weighted averages of the metrics of the subject csv files, ranked over filtered windows."""
+
+    def __init__(self, df, metrics):
+        # 1. A page cross-listed in several departments appears in each of their csv files, count it once per course
+        # (rows without a link cannot be matched across departments and are all kept)
+        duplicated = df.duplicated(subset=EVALUATION_COLUMNS) & df["Webpage Link"].notna()
+        df = df[~duplicated].reset_index(drop=True)
+        self.df = df[[column for column in df.columns if column not in metrics]]
+        course_ids, self.course_numbers = pd.factorize(df["Course Number"])
+        self.course_ids = course_ids
+        # the subject name and department of a course are taken from its most recent row
+        latest = np.lexsort((-df["Year"].to_numpy(), course_ids))
+        first_rows = latest[np.r_[True, course_ids[latest][1:] != course_ids[latest][:-1]]]
+        self.subject_names = df["Subject Name"].to_numpy(dtype=object)[first_rows]
+        self.departments = df["Department"].to_numpy(dtype=object)[first_rows]
+
+        # 2. Respondent weighted values of every metric, the rows without a value or weight get no weight
+        weights = df[WEIGHT_COLUMN].to_numpy(dtype=float)
+        self.metrics = {}
+        for metric in metrics:
+            values = df[metric].to_numpy(dtype=float)
+            metric_weights = np.where(np.isfinite(values) & np.isfinite(weights), weights, 0.0)
+            values = np.nan_to_num(values)
+            self.metrics[metric] = (metric_weights, metric_weights * values, metric_weights * values**2)
+        # (metric, filters) -> per course sums
+        self._window_cache = {}
+
+    @classmethod
+    def from_csv_folder(cls, csv_folder_path=CSV_FOLDER_PATH, metrics=None):
+        """Load the subject csv files of every department, keeping only the columns needed for ranking."""
+        frames = []
+        for csv_path in find_subject_tables(csv_folder_path):
+            if metrics is None:
+                metrics = [column for column in read_subject_columns(csv_path) if column.endswith('(Avg)')]
+            df = load_subject_data(csv_path, EVALUATION_COLUMNS + COURSE_COLUMNS + list(metrics))
+            frames.append(df.assign(Department=get_department(csv_path)))
+        if not frames:
+            raise FileNotFoundError(f"No subject csv files found in {csv_folder_path}")
+        return cls(pd.concat(frames, ignore_index=True), metrics)
+
+    @property
+    def num_courses(self):
+        return len(self.course_numbers)
+
+    def aggregate(self, metric, **filters):
+        """
+        Sum the rows passing `filters` (see plot_data.make_filter_mask) per course.
+
+        Returns:
+        - tuple of np.ndarray: number of respondents, weighted mean and weighted std of the metric, and number of terms
+        of each course (indexed by course id).
+        """
+        if metric not in self.metrics:
+            raise ValueError(f"Unknown metric '{metric}', available metrics: {', '.join(self.metrics)}")
+        key = (metric, tuple(sorted((name, tuple(value) if isinstance(value, list) else value) for name, value in filters.items())))
+        if key not in self._window_cache:
+            mask = make_filter_mask(self.df, **filters)
+            weights, weighted_sums, weighted_sums_of_squares = self.metrics[metric]
+            course_ids = self.course_ids[mask]
+            total_weight, weighted_sum, weighted_sum_of_squares, num_terms = (
+                np.bincount(course_ids, weights=x, minlength=self.num_courses)
+                for x in (weights[mask], weighted_sums[mask], weighted_sums_of_squares[mask], (weights[mask] > 0).astype(float)))
+            mean, std = weighted_mean_and_std_from_sums(weighted_sum, weighted_sum_of_squares, total_weight)
+            self._window_cache[key] = (total_weight, mean, std, num_terms)
+        return self._window_cache[key]
+
+    def rank(self, metric, k=DEFAULT_K, highest=True, min_reviews=1, **filters):
+        """
+        The k courses with the highest (or lowest) weighted average of `metric` over the rows passing `filters`.
+
+        Parameters:
+        - metric (str): Column to rank by, e.g. 'Teacher Rating (Avg)'.
+        - k (int): Number of courses to return.
+        - highest (bool): Rank from the highest average down, or from the lowest up.
+        - min_reviews (int): Minimum total number of respondents of a course over the window.
+        - filters: levels, terms, min_year, max_year and min_responses (per term) as in plot_data.make_filter_mask.
+
+        Returns:
+        - pd.DataFrame: The ranked courses with their department, subject name, mean, std, respondents and terms.
+        """
+        total_weight, mean, std, num_terms = self.aggregate(metric, **filters)
+
+        # 1. Select the k best eligible courses without sorting the others
+        eligible = np.flatnonzero((total_weight >= max(min_reviews, 1e-12)) & np.isfinite(mean))
+        scores = -mean[eligible] if highest else mean[eligible]
+        k = min(k, len(eligible))
+        if k == 0:
+            selected = eligible[:0]
+        else:
+            selected = eligible[np.argpartition(scores, k - 1)[:k]] if k < len(eligible) else eligible
+            # 2. Order the selection, ties broken by the number of respondents
+            selected = selected[np.lexsort((-total_weight[selected], -mean[selected] if highest else mean[selected]))]
+
+        return pd.DataFrame({'Course Number': [parse_course_number(x) for x in np.asarray(self.course_numbers)[selected]],
+                             'Department': self.departments[selected],
+                             'Subject Name': self.subject_names[selected],
+                             'Mean': mean[selected],
+                             'STD': std[selected],
+                             'Respondents': total_weight[selected].astype(np.int64),
+                             'Terms': num_terms[selected].astype(np.int64)})
+
+def make_plotly_payload(ranked, metric, highest=True, title=None):
+    """Plotly bar chart figure dict of a ranking, with the std as error bars and the course details on hover."""
+    order = 'Highest' if highest else 'Lowest'
+    return {
+        'data': [{
+            'type': 'bar',
+            'x': ranked['Course Number'].astype(str).tolist(),
+            'y': np.round(ranked['Mean'].to_numpy(dtype=float), 3).tolist(),
+            'error_y': {'type': 'data', 'array': np.round(np.nan_to_num(ranked['STD'].to_numpy(dtype=float)), 3).tolist()},
+            'customdata': ranked[['Subject Name', 'Respondents', 'Terms']].astype(object).to_numpy().tolist(),
+            'hovertemplate': '%{x} %{customdata[0]}<br>' + metric + ': %{y}<br>%{customdata[1]} respondents over %{customdata[2]} terms<extra></extra>',
+        }],
+        'layout': {
+            'title': {'text': title or f'{order} {metric} by Course'},
+            'xaxis': {'title': {'text': 'Course Number'}, 'type': 'category'},
+            'yaxis': {'title': {'text': metric}},
+        },
+    }
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rank courses by the weighted average of a metric.")
+    parser.add_argument('metric', help="Metric to rank by, e.g. 'Teacher Rating (Avg)'.")
+    parser.add_argument('--csv-folder', default=CSV_FOLDER_PATH, help="Folder of the subject csv files.")
+    parser.add_argument('-k', type=int, default=DEFAULT_K, help="Number of courses to show.")
+    parser.add_argument('--lowest', action='store_true', help="Rank from the lowest average up.")
+    parser.add_argument('--min-reviews', type=int, default=1, help="Minimum total number of respondents of a course over the years.")
+    parser.add_argument('--years', nargs=2, type=int, default=None, metavar=('FIRST', 'LAST'), help="Inclusive year range.")
+    parser.add_argument('--terms', nargs='+', default=None, help="Terms to include, e.g. Fall Spring.")
+    parser.add_argument('--levels', nargs='+', default=None, choices=['U', 'G'], help="Course levels to include.")
+    parser.add_argument('--output', default=None, help="Write the Plotly figure json to this path.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    metric = args.metric if args.metric.endswith(')') else f'{args.metric} (Avg)'
+    ranker = CourseRanker.from_csv_folder(args.csv_folder)
+    min_year, max_year = args.years if args.years else (None, None)
+    try:
+        ranked = ranker.rank(metric, args.k, not args.lowest, args.min_reviews,
+                             levels=args.levels, terms=args.terms, min_year=min_year, max_year=max_year)
+    except ValueError as e:
+        print(e)
+        return 1
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(ranked.to_string(index=False, float_format=lambda x: f'{x:0.3f}'))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(make_plotly_payload(ranked, metric, not args.lowest), f)
+        print(f"Saved the Plotly figure to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
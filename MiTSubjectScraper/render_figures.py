@@ -0,0 +1,150 @@
+# Headless batch renderer for the distribution figures of plot_distribution.py.
+# A grid of variables x filter sets x bin counts is rendered in one run. The csv is loaded once, the weighted
+# histograms of every filter set are counted with a single np.bincount per (variable, bin count) over bin edges shared
+# by all filter sets, and the figures are drawn by a pool of worker processes on the Agg backend. Text is rendered with
+# matplotlib's built-in mathtext by default, LaTeX (as in plot_distribution.py) is opt-in with --usetex as it starts a
+# LaTeX process for every text element.
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from plot_data import load_subject_data, make_filter_mask
+from stats_utils import weighted_nanmedian, weighted_nanmean, weighted_nanstd
+
+# 1. Constants
+CSV_PATH = os.path.join('course_csv_data', 'subject_2.csv')
+OUTPUT_FOLDER = 'example_outputs'
+WEIGHT_COLUMN = 'Number of Respondents'
+DEFAULT_VARIABLES = ['Teacher Rating (Avg)', 'Teacher Helpfulness (Avg)', 'Subject Rating (Avg)', 'Total Weekly Hours Spent (Avg)', 'Response Rate']
+DEFAULT_NUM_BINS = [25, 40, 50]
+# Named filter sets (keyword arguments of plot_data.make_filter_mask), the year range and minimum number of responses
+# given on the command line apply to all of them
+FILTER_SETS = {
+    'all': {},
+    'grad': {'levels': ['G']},
+    'undergrad': {'levels': ['U']},
+    'fall': {'terms': ['Fall']},
+    'spring': {'terms': ['Spring']},
+}
+DEFAULT_FILTER_SETS = ['all', 'grad', 'undergrad']
+
+def get_bin_edges(values, num_bins):
+    """Equal width bin edges over the finite `values`, shared by every filter set of a variable."""
+    finite = values[np.isfinite(values)]
+    low, high = (finite.min(), finite.max()) if len(finite) else (0.0, 1.0)
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    return np.linspace(low, high, num_bins + 1)
+
+def weighted_histograms(values, weights, masks, edges):
+    """
+    Weighted histograms of `values` for several row masks at once.
+
+    Parameters:
+    - values, weights (np.ndarray): One value and weight per row.
+    - masks (np.ndarray): (number of filter sets, number of rows) boolean array, the filter sets may overlap.
+    - edges (np.ndarray): Bin edges, as from get_bin_edges.
+
+    Returns:
+    - np.ndarray: (number of filter sets, number of bins) summed weights. The last bin includes its right edge, as with np.histogram.
+    """
+    num_bins = len(edges) - 1
+    bin_index = np.clip(np.searchsorted(edges, values, side='right') - 1, 0, num_bins - 1)
+    valid = np.isfinite(values) & np.isfinite(weights) & (values >= edges[0]) & (values <= edges[-1])
+    set_index, rows = np.nonzero(masks & valid)
+    counts = np.bincount(set_index * num_bins + bin_index[rows], weights=weights[rows], minlength=len(masks) * num_bins)
+    return counts.reshape(len(masks), num_bins)
+
+def get_output_filename(var_name, num_bins, filter_name):
+    return f'distribution({var_name})[bins={num_bins}-filter={filter_name}].png'
+
+def make_figure_specs(df, variables, filter_names, bin_counts, output_folder):
+    """Precompute the histogram and statistics of every figure of the grid as plain, picklable dicts."""
+    weights = df[WEIGHT_COLUMN].to_numpy(dtype=float)
+    masks = np.stack([make_filter_mask(df, **FILTER_SETS[name]) for name in filter_names])
+    specs = []
+    for var_name in variables:
+        values = df[var_name].to_numpy(dtype=float)
+        # 1. The weighted statistics only depend on the variable and the filter set
+        stats = [(weighted_nanmedian(values[mask], weights[mask]),
+                  weighted_nanmean(values[mask], weights[mask]),
+                  weighted_nanstd(values[mask], weights[mask])) for mask in masks]
+        # 2. One bincount per bin count covers every filter set
+        for num_bins in bin_counts:
+            edges = get_bin_edges(values, num_bins)
+            counts = weighted_histograms(values, weights, masks, edges)
+            for filter_name, filter_counts, (median, mean, std) in zip(filter_names, counts, stats):
+                specs.append({'var_name': var_name, 'filter_name': filter_name, 'edges': edges, 'counts': filter_counts,
+                              'median': median, 'mean': mean, 'std': std,
+                              'output_path': os.path.join(output_folder, get_output_filename(var_name, num_bins, filter_name))})
+    return specs
+
+def init_worker(usetex):
+    """Select the non-interactive backend and the text renderer in each worker process."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    plt.rc('text', usetex=usetex)
+    plt.rc('font', family='serif')
+
+def render_figure(spec):
+    """Draw one distribution figure, styled like plot_distribution.py, and save it."""
+    import matplotlib.pyplot as plt
+    counts, edges = spec['counts'], spec['edges']
+    fig = plt.figure()
+    plt.stairs(counts, edges, fill=True)
+    ymax = counts.max() * 1.2 if counts.max() > 0 else 1
+    plt.vlines([spec['median']], ymin=0, ymax=ymax, colors=['r'], linestyles=['dashed'], label=f"Median = {spec['median']:.2f}")
+    plt.ylim([counts.min(), ymax])
+    plt.title(f"Distribution of Values for {spec['var_name']} ({spec['filter_name']})\n"
+              f"$\\mu$ = {spec['mean']:.2f} $\\pm$ {spec['std']:.2f}")
+    plt.legend()
+    plt.tight_layout()
+    fig.savefig(spec['output_path'])
+    plt.close(fig)
+    return spec['output_path']
+
+def render_figures(specs, usetex=False, workers=None):
+    """Render the figure specs in a process pool, return the paths of the saved figures."""
+    if workers == 1:
+        init_worker(usetex)
+        return [render_figure(spec) for spec in specs]
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(usetex,)) as executor:
+        return list(executor.map(render_figure, specs, chunksize=max(1, len(specs) // (4 * (workers or os.cpu_count() or 1)))))
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Render the distribution figures of a grid of variables x filter sets x bin counts.")
+    parser.add_argument('--csv', default=CSV_PATH, help="Subject csv to plot.")
+    parser.add_argument('--output-folder', default=OUTPUT_FOLDER, help="Folder the figures are saved to.")
+    parser.add_argument('--variables', nargs='+', default=DEFAULT_VARIABLES, help="Columns to plot.")
+    parser.add_argument('--filters', nargs='+', default=DEFAULT_FILTER_SETS, choices=list(FILTER_SETS), help="Filter sets to plot.")
+    parser.add_argument('--bins', nargs='+', type=int, default=DEFAULT_NUM_BINS, help="Numbers of histogram bins.")
+    parser.add_argument('--years', nargs=2, type=int, default=None, metavar=('FIRST', 'LAST'), help="Inclusive year range.")
+    parser.add_argument('--min-responses', type=int, default=1, help="Minimum number of respondents of a course.")
+    parser.add_argument('--workers', type=int, default=None, help="Number of rendering processes (default: one per cpu).")
+    parser.add_argument('--usetex', action='store_true', help="Render the text with LaTeX instead of mathtext (much slower).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    start_time = time.perf_counter()
+
+    # 1. Load the needed columns once and keep the rows passing the common filters
+    df = load_subject_data(args.csv, args.variables)
+    min_year, max_year = args.years if args.years else (None, None)
+    df = df.loc[make_filter_mask(df, min_year=min_year, max_year=max_year, min_responses=args.min_responses)]
+
+    # 2. Precompute every histogram, then render the figures in parallel
+    specs = make_figure_specs(df, args.variables, args.filters, args.bins, args.output_folder)
+    os.makedirs(args.output_folder, exist_ok=True)
+    paths = render_figures(specs, args.usetex, args.workers)
+
+    elapsed_time = time.perf_counter() - start_time
+    print(f"Rendered {len(paths)} figures to {args.output_folder} in {elapsed_time:0.1f} s.")
+
+if __name__ == "__main__":
+    main()
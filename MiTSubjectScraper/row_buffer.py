@@ -0,0 +1,96 @@
+# Columnar accumulator for the rows scraped from the course pages.
+# Concatenating a one-page dataframe onto the full table copies the whole table for every page, which makes a crawl
+# quadratic in the number of pages. Instead, every column is kept in its own typed numpy array that grows by doubling,
+# rows are appended as plain records, and a dataframe is only materialized when the rows are written out.
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CAPACITY = 64
+
+class RowBuffer:
+    """Growable column arrays with one dtype per column (columns without a dtype hold Python objects)."""
+
+    def __init__(self, columns, dtypes=None, capacity=DEFAULT_CAPACITY):
+        self.columns = list(columns)
+        self.dtypes = {column: np.dtype((dtypes or {}).get(column, object)) for column in self.columns}
+        self.arrays = {column: np.empty(capacity, dtype=self.dtypes[column]) for column in self.columns}
+        self.size = 0
+
+    @classmethod
+    def from_frame(cls, df, columns, dtypes=None):
+        """Create a buffer holding the rows of `df` (e.g. a csv loaded from disk)."""
+        buffer = cls(columns, dtypes, capacity=max(DEFAULT_CAPACITY, 2 * len(df)))
+        for column in buffer.columns:
+            values = df[column].to_numpy() if column in df.columns else np.full(len(df), None, dtype=object)
+            buffer._store_slice(column, 0, values)
+        buffer.size = len(df)
+        return buffer
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def capacity(self):
+        return len(self.arrays[self.columns[0]]) if self.columns else 0
+
+    def _grow(self, min_capacity):
+        capacity = max(self.capacity, 1)
+        while capacity < min_capacity:
+            capacity *= 2
+        for column, array in self.arrays.items():
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self.size] = array[:self.size]
+            self.arrays[column] = grown
+
+    def _fall_back_to_object(self, column):
+        """Store a column as Python objects once it receives a value its dtype cannot hold (e.g. a missing integer)."""
+        self.arrays[column] = self.arrays[column].astype(object)
+
+    def _store(self, column, index, value):
+        array = self.arrays[column]
+        if array.dtype.kind == 'f' and value is None:
+            value = np.nan
+        elif array.dtype.kind in 'iu' and not isinstance(value, (int, np.integer)):
+            # numpy would silently truncate floats (and mangle NaN) stored in an integer array
+            self._fall_back_to_object(column)
+        try:
+            self.arrays[column][index] = value
+        except (TypeError, ValueError):
+            self._fall_back_to_object(column)
+            self.arrays[column][index] = value
+
+    def _store_slice(self, column, start, values):
+        array = self.arrays[column]
+        if array.dtype != object and not np.can_cast(values.dtype, array.dtype, casting='same_kind'):
+            self._fall_back_to_object(column)
+        try:
+            self.arrays[column][start:start + len(values)] = values
+        except (TypeError, ValueError):
+            self._fall_back_to_object(column)
+            self.arrays[column][start:start + len(values)] = values
+
+    def append(self, record):
+        """Append a row given as a dict of column -> value (missing columns are stored as None/NaN)."""
+        if self.size >= self.capacity:
+            self._grow(self.size + 1)
+        for column in self.columns:
+            self._store(column, self.size, record.get(column))
+        self.size += 1
+
+    def clear(self):
+        """Drop every row and shrink the arrays back to the default capacity (and their original dtypes)."""
+        self.arrays = {column: np.empty(DEFAULT_CAPACITY, dtype=self.dtypes[column]) for column in self.columns}
+        self.size = 0
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def to_frame(self, start=0, stop=None):
+        """Materialize rows [start, stop) as a dataframe with a fresh 0-based index."""
+        stop = self.size if stop is None else min(stop, self.size)
+        return pd.DataFrame({column: self.arrays[column][start:stop].copy() for column in self.columns}, columns=self.columns)
+
+    def to_records(self, start=0, stop=None):
+        return self.to_frame(start, stop).to_dict('records')
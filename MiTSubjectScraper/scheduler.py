@@ -0,0 +1,409 @@
+# Crawl scheduler for scraping one or more MIT departments in a single invocation.
+# The evaluation links of every requested department are fed into one shared work queue, fetched under a single
+# rate budget, and the progress of each department is checkpointed so an interrupted crawl can pick up where it left off.
+
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+
+import scrape
+from catalog_mapping import course_names
+from fetcher import HostRateLimiter, fetch_page, fetch_pages, DEFAULT_CONCURRENCY, DEFAULT_REQUESTS_PER_SECOND
+from page_cache import PageCache, CACHE_FOLDER_PATH
+from catalog_index import load_catalog_index
+from scraped_index import ScrapedIndex
+from journal import JournaledTable, find_journals, DEFAULT_COMPACT_EVERY
+from normalized_store import SubjectTable, find_subject_tables, read_subject_columns, read_subject_table
+from professor_store import build_professor_table, TEACHER_SOURCE_COLUMNS
+from telemetry import telemetry, span, count, profile_run
+from memory_budget import MemoryBudget, MemoryBudgetExceeded
+from search_index import SearchIndex
+from analyze import get_department
+
+# 1. Constants
+CHECKPOINT_PATH = os.path.join(scrape.CSV_FOLDER_PATH, "crawl_checkpoint.json")
+PROFESSOR_CSV_PATH = os.path.join(scrape.CSV_FOLDER_PATH, "professor_ratings.csv")
+
+def resolve_departments(departments):
+    """
+    Convert department arguments into subject numbers.
+
+    Each entry may be a subject number ('2'), a department name from catalog_mapping.course_names
+    ('mechanical-engineering'), or 'all' for every department.
+    """
+    subject_numbers = []
+    for department in departments:
+        if department == 'all':
+            candidates = list(course_names.values())
+        elif department in course_names:
+            candidates = [course_names[department]]
+        elif department in course_names.values():
+            candidates = [department]
+        else:
+            raise ValueError(f"Unknown department: {department}")
+        # keep the order given on the command line but drop duplicates
+        subject_numbers.extend(x for x in candidates if x not in subject_numbers)
+    return subject_numbers
+
+def load_checkpoint(checkpoint_path=CHECKPOINT_PATH):
+    """Load the per-department crawl progress, or an empty checkpoint if there is none."""
+    if not os.path.exists(checkpoint_path):
+        return {}
+    with open(checkpoint_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def save_checkpoint(checkpoint, checkpoint_path=CHECKPOINT_PATH):
+    """Atomically write the per-department crawl progress."""
+    temp_path = checkpoint_path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f, indent=2)
+    os.replace(temp_path, checkpoint_path)
+
+class DepartmentCrawl:
+    """Crawl state of a single department in the shared work queue."""
+
+    def __init__(self, subject_number, catalog_index, table, rows, pending_courses):
+        self.subject_number = subject_number
+        self.catalog_index = catalog_index
+        # journaled csv storage of the department and the columnar buffer of its current rows
+        self.table = table
+        self.rows = rows
+        # url -> (course number, term, year) of every page that still has to be scraped
+        self.pending_courses = pending_courses
+        self.pages_total = len(pending_courses)
+        self.pages_done = 0
+
+    @property
+    def finished(self):
+        return self.pages_done >= self.pages_total
+
+    def progress(self):
+        return {'status': 'done' if self.finished else 'in_progress',
+                'pages_done': self.pages_done,
+                'pages_total': self.pages_total,
+                'updated_at': time.time()}
+
+    def release(self):
+        """Drop the catalog index, rows and page list of a finished department (memory-bounded mode)."""
+        self.catalog_index = None
+        self.rows = None
+        self.pending_courses = {}
+
+def prepare_department(subject_number, replay=False, request_kwargs=None, scraped_index=None, memory_bounded=False, flush_every=DEFAULT_COMPACT_EVERY):
+    """
+    Fetch the listing and catalog pages of a department and work out which evaluation pages still need scraping.
+    Links found in `scraped_index` are skipped; when replaying, or without an index, every link is scraped.
+    In memory-bounded mode and when replaying, the existing rows of the department stay on disk instead of being loaded:
+    the new rows are journaled and merged into them.
+    """
+    request_kwargs = request_kwargs or {}
+
+    # 1. Fetch the department's course listing page (always refreshed unless replaying, since new terms get added over time)
+    response = fetch_page(scrape.session, scrape.get_subject_url(subject_number), scrape.rate_limiter, scrape.page_cache, replay, refresh=True, **request_kwargs)
+    if response is None:
+        print(f"The listing page of department {subject_number} is not in the html cache, run the scraper once without --replay first!")
+        return None
+    if response.status_code != 200:
+        print(f"Error accessing the subject URL of department {subject_number}! Please go through the login and verification process in your browser and try again.")
+        print(f'Error code: {response.status_code}')
+        return None
+    soup = scrape.make_soup(response.content, parse_only=scrape.LISTING_PARSE_ONLY)
+
+    # 2. Fetch the MIT course catalog subject information page
+    search_response = fetch_page(scrape.session, scrape.get_catalog_url(subject_number), scrape.rate_limiter, scrape.page_cache, replay, refresh=True, **request_kwargs)
+    if search_response is None or search_response.status_code != 200:
+        print(f"Error accessing the MIT course catalog subject information page of department {subject_number}!")
+        return None
+    catalog_index = load_catalog_index(subject_number, search_response.content, scrape.make_soup)
+
+    # 3. Load the department's data (replayed rows replace the rows with the same key, the others are kept)
+    table = SubjectTable(scrape.get_subject_csv_path(subject_number), scrape.SUBJECT_COLUMNS, scrape.SUBJECT_KEY_COLUMNS, compact_every=flush_every)
+    rows = scrape.make_subject_rows(None if memory_bounded or replay else table.load())
+
+    # 4. Walk the listing page once and collect the links that still need to be scraped
+    pending_courses = {}
+    for course_link, course_number, term, year in scrape.iter_listing_courses(soup):
+        url = scrape.get_course_page_url(course_link)
+        if scraped_index is None or not scraped_index.contains(course_number, term, year):
+            pending_courses.setdefault(url, (course_number, term, year))
+    soup.decompose()
+
+    return DepartmentCrawl(subject_number, catalog_index, table, rows, pending_courses)
+
+def recover_interrupted_writes():
+    """Merge the journals left behind by an interrupted crawl into their csv files and subject stores."""
+    for csv_path in find_journals(scrape.CSV_FOLDER_PATH):
+        if os.path.basename(csv_path) == os.path.basename(PROFESSOR_CSV_PATH):
+            JournaledTable(csv_path, scrape.PROFESSOR_COLUMNS, scrape.PROFESSOR_KEY_COLUMNS).load()
+        elif os.path.basename(csv_path).startswith('subject_'):
+            SubjectTable(csv_path, scrape.SUBJECT_COLUMNS, scrape.SUBJECT_KEY_COLUMNS).load()
+
+def build_professor_table_from_csv_files(csv_folder_path=scrape.CSV_FOLDER_PATH):
+    """Derive the professor ratings from the subject tables of every department. Returns the store and the number of tables."""
+    subject_dfs = [read_subject_table(csv_path, [x for x in read_subject_columns(csv_path) if x in TEACHER_SOURCE_COLUMNS]) for csv_path in find_subject_tables(csv_folder_path)]
+    professors = build_professor_table(pd.concat(subject_dfs, ignore_index=True)) if subject_dfs else scrape.make_professor_store()
+    return professors, len(subject_dfs)
+
+def rebuild_professor_table(csv_folder_path=scrape.CSV_FOLDER_PATH, professor_csv_path=PROFESSOR_CSV_PATH):
+    """Rebuild the professor csv from the subject tables of every department, e.g. after fixing an extractor."""
+    recover_interrupted_writes()
+    professors, num_files = build_professor_table_from_csv_files(csv_folder_path)
+    professor_table = JournaledTable(professor_csv_path, scrape.PROFESSOR_COLUMNS, scrape.PROFESSOR_KEY_COLUMNS)
+    professor_table.compact(professors.to_frame())
+    professor_table.close()
+    print(f"Rebuilt {professor_csv_path} with {len(professors)} teachers from {num_files} subject tables.")
+    return professors
+
+def merge_replayed_professors(professor_table, replayed, csv_folder_path=scrape.CSV_FOLDER_PATH):
+    """
+    Update the teachers of the replayed pages in the professor csv, keeping every other teacher as it is.
+
+    The replayed rows have been merged into the subject tables, so the ratings of those teachers are recomputed from
+    all of their classes there, not only from the replayed pages. Returns the number of teachers updated.
+    """
+    professors, _ = build_professor_table_from_csv_files(csv_folder_path)
+    teacher_names = [name for name in (professors.canonical_name(x) for x in replayed.teachers) if name in professors.teachers]
+    professor_table.append(professors.to_frame(teacher_names))
+    professor_table.compact_journal()
+    return len(teacher_names)
+
+def crawl_departments(subject_numbers, concurrency=DEFAULT_CONCURRENCY, replay=False, checkpoint_path=CHECKPOINT_PATH,
+                      memory_budget=None, flush_every=DEFAULT_COMPACT_EVERY):
+    """
+    Scrape every department in `subject_numbers` through one shared work queue.
+
+    The rate limiter and the html cache configured on the scrape module are shared by every department, so the whole
+    crawl runs under a single rate budget. Departments marked as done in the checkpoint are skipped; the checkpoint
+    is removed once every requested department has finished. New rows are appended to per-csv journals and compacted
+    into the subject stores and professor csv every `flush_every` rows and when a department finishes.
+
+    Replay merges the rows of the cached pages into the existing subject tables, replacing the rows with the same key, so
+    pages missing from the cache never remove rows. Only the teachers of the replayed pages are updated in the
+    professor csv, and nothing is written if no page was replayed.
+
+    With a MemoryBudget the crawl is memory-bounded: rows are only kept until they are journaled, compaction merges
+    the journal into the table on disk, finished departments are released, and the budget is checked after every page.
+    """
+    memory_bounded = memory_budget is not None
+    # rows merged into the table on disk instead of rewriting it from the rows kept in memory
+    merge_on_disk = memory_bounded or replay
+    # 0. Replay mode never touches the network, so it does not need the browser cookies either
+    request_kwargs = {} if replay else {'cookies': scrape.get_cookies()}
+    checkpoint = {} if replay else load_checkpoint(checkpoint_path)
+    # 0.1 Finish the writes of an interrupted run before anything is read
+    recover_interrupted_writes()
+    professor_table = JournaledTable(PROFESSOR_CSV_PATH, scrape.PROFESSOR_COLUMNS, scrape.PROFESSOR_KEY_COLUMNS)
+    # replay collects the teachers of the replayed pages only, they are merged into the professor csv at the end
+    professors = scrape.make_professor_store(None if replay else professor_table.load())
+    # 0.2 Load the keys of every page scraped so far, across all departments (replay re-extracts everything)
+    scraped_index = None if replay else ScrapedIndex(scrape.CSV_FOLDER_PATH)
+    # 0.3 Keep the search index up to date with the scraped pages (after a replay it is rebuilt when next loaded)
+    search_index = None if replay else SearchIndex.load(scrape.CSV_FOLDER_PATH)
+
+    crawls = {}
+    # url -> departments waiting on that page, so a cross-listed page in flight is only fetched once
+    waiting_departments = {}
+
+    def compact_department(crawl):
+        with span('store.compact'):
+            if merge_on_disk:
+                crawl.table.compact_journal()
+            else:
+                crawl.table.compact(crawl.rows.to_frame())
+        if scraped_index is not None:
+            scraped_index.mark_synced()
+        if search_index is not None:
+            search_index.mark_synced(get_department(crawl.table.csv_path))
+
+    def finish_department(crawl):
+        compact_department(crawl)
+        crawl.table.close()
+        checkpoint[crawl.subject_number] = crawl.progress()
+        if not replay:
+            save_checkpoint(checkpoint, checkpoint_path)
+        print(f"Finished department {crawl.subject_number}: {crawl.pages_done} course pages scraped.")
+        if memory_bounded:
+            crawl.release()
+
+    # 1. Build the shared work queue lazily, one department after another
+    def generate_work():
+        for subject_number in subject_numbers:
+            if checkpoint.get(subject_number, {}).get('status') == 'done':
+                print(f"Skipping department {subject_number}, it is already done according to the checkpoint.")
+                continue
+            with span('prepare_department'):
+                crawl = prepare_department(subject_number, replay, request_kwargs, scraped_index, memory_bounded, flush_every)
+            if crawl is None:
+                continue
+            crawls[subject_number] = crawl
+            print(f"Queued {len(crawl.pending_courses)} course pages for department {subject_number}.")
+            if crawl.finished:
+                finish_department(crawl)
+                continue
+            for url in crawl.pending_courses:
+                waiting = waiting_departments.setdefault(url, [])
+                waiting.append(crawl)
+                if len(waiting) == 1:
+                    yield url
+
+    # 2. Fetch the queue concurrently and parse each page as soon as it arrives
+    start_time = time.time()
+    num_pages = 0
+    for url, response in fetch_pages(scrape.session, generate_work(), concurrency, scrape.rate_limiter, scrape.page_cache, replay, headers=scrape.headers, **request_kwargs):
+        num_pages += 1
+        page_rows = []
+        for crawl in waiting_departments.pop(url):
+            course_number, term, year = crawl.pending_courses[url]
+
+            # 2.1 Process the course page for the department
+            page_start_time = time.time()
+            num_rows = len(crawl.rows)
+            with span('process_page'):
+                crawl.rows = scrape.process_course_response(url, response, crawl.catalog_index, crawl.rows, crawl.subject_number)
+            elapsed_time = time.time() - page_start_time
+            count('rows_extracted', len(crawl.rows) - num_rows)
+            crawl.pages_done += 1
+
+            # 2.2 Journal the new subject rows
+            with span('store.journal_append'):
+                new_rows = crawl.rows.to_frame(num_rows)
+                page_rows.append(new_rows)
+                crawl.table.append(new_rows)
+                if scraped_index is not None:
+                    scraped_index.add_rows(new_rows)
+                if search_index is not None:
+                    search_index.add_rows(new_rows, get_department(crawl.table.csv_path))
+            if merge_on_disk:
+                crawl.rows.clear()
+
+            # 2.3 Checkpoint the department and compact the journals once they grow large
+            if crawl.finished:
+                finish_department(crawl)
+            elif crawl.table.needs_compaction():
+                compact_department(crawl)
+            if not crawl.finished and not replay:
+                with span('store.checkpoint'):
+                    checkpoint[crawl.subject_number] = crawl.progress()
+                    save_checkpoint(checkpoint, checkpoint_path)
+
+            print(f"Finished processing course {course_number} ({term} {year}) in {elapsed_time:0.2f} seconds!")
+
+        # 2.4 Update the professor table with the rows of the page, counted once even if several departments list it
+        if page_rows:
+            with span('professors.update'):
+                build_professor_table(pd.concat(page_rows, ignore_index=True), professors)
+                if not replay:
+                    professor_table.append(professors.to_frame(professors.take_changed()))
+            if not replay and professor_table.needs_compaction():
+                with span('store.compact'):
+                    professor_table.compact(professors.to_frame())
+
+        # 2.5 Stop cleanly if the crawl is over its memory budget, everything up to this page is on disk
+        if memory_bounded:
+            memory_budget.check()
+
+    # 2.6 Write the professor table (replay only updates the teachers of the replayed pages, if there were any)
+    if not replay:
+        professor_table.compact(professors.to_frame())
+    elif num_pages:
+        with span('store.compact'):
+            num_teachers = merge_replayed_professors(professor_table, professors)
+        print(f"Updated {num_teachers} teachers of the replayed pages in {PROFESSOR_CSV_PATH}.")
+    professor_table.close()
+    if search_index is not None:
+        search_index.save()
+
+    # 3. Report and clear the checkpoint once the whole crawl is done
+    total_time = time.time() - start_time
+    if num_pages:
+        print(f"Processed {num_pages} course pages in {total_time:0.2f} seconds ({num_pages/total_time:0.2f} pages/sec).")
+    if scrape.page_cache is not None:
+        print(f"html cache: {scrape.page_cache.hits} hits, {scrape.page_cache.misses} misses, {len(scrape.page_cache)} pages stored.")
+    if num_pages:
+        print(telemetry.format_summary())
+    telemetry.write_summary()
+    if memory_bounded:
+        memory_budget.report()
+    if not replay and all(checkpoint.get(x, {}).get('status') == 'done' for x in subject_numbers) and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    return crawls
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape MIT subject evaluation data into the subject stores and the professor csv.")
+    parser.add_argument('--departments', nargs='+', default=[scrape.SUBJECT_NUMBER],
+                        help="Subject numbers or department names from catalog_mapping.py to scrape, or 'all'.")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help="Maximum number of course pages fetched at once.")
+    parser.add_argument('--rate', type=float, default=DEFAULT_REQUESTS_PER_SECOND,
+                        help="Maximum requests per second sent to each host.")
+    parser.add_argument('--parser', choices=scrape.PARSER_BACKENDS, default=scrape.DEFAULT_PARSER_BACKEND,
+                        help="html parser backend used to build the page trees.")
+    parser.add_argument('--cache-dir', default=CACHE_FOLDER_PATH,
+                        help="Folder of the on-disk html cache.")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="Do not read or write the html cache.")
+    parser.add_argument('--replay', action='store_true',
+                        help="Rebuild the subject tables from cached pages only, without any network access.")
+    parser.add_argument('--restart', action='store_true',
+                        help="Ignore the crawl checkpoint and rebuild the scraped index from the subject tables.")
+    parser.add_argument('--rebuild-professors', action='store_true',
+                        help="Rebuild the professor csv from the subject tables instead of crawling.")
+    parser.add_argument('--max-memory', type=float, default=None, metavar='MB',
+                        help="Memory-bounded mode: keep rows on disk instead of in memory and stop the crawl if its resident memory exceeds this many MB. "
+                             "Outside Linux and Windows (e.g. on macOS) only the peak resident memory is known, which never goes down, "
+                             "so the crawl stops as soon as the peak exceeds the budget.")
+    parser.add_argument('--flush-every', type=int, default=DEFAULT_COMPACT_EVERY, metavar='ROWS',
+                        help="Number of journaled rows after which they are merged into the csv file.")
+    parser.add_argument('--telemetry', default=None, metavar='PATH',
+                        help="Write the timing spans, their percentiles and the counters of the run to a JSON lines file.")
+    parser.add_argument('--profile', nargs='?', const='scrape.prof', default=None, metavar='PATH',
+                        help="Run under cProfile and tracemalloc, print the hot spots and save the profile (default: scrape.prof).")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    # 0. Parse the command line options and configure the rate limiter and the html cache
+    args = parse_args(argv)
+    if args.replay and args.no_cache:
+        print("Replay mode needs the html cache, --replay cannot be combined with --no-cache!")
+        return None
+    try:
+        subject_numbers = resolve_departments(args.departments)
+    except ValueError as e:
+        print(e)
+        return None
+    if args.parser not in scrape.get_available_parser_backends():
+        print(f"The {args.parser} parser backend is not installed!")
+        return None
+    scrape.parser_backend = args.parser
+    scrape.rate_limiter = HostRateLimiter(args.rate)
+    scrape.page_cache = None if args.no_cache else PageCache(args.cache_dir)
+    if args.rebuild_professors:
+        return rebuild_professor_table()
+    if args.restart:
+        if os.path.exists(CHECKPOINT_PATH):
+            os.remove(CHECKPOINT_PATH)
+        ScrapedIndex(scrape.CSV_FOLDER_PATH).rebuild()
+
+    # 1. Run the crawl, recording its spans to the telemetry log if one is requested
+    telemetry.reset()
+    if args.telemetry:
+        telemetry.open_log(args.telemetry)
+    memory_budget = MemoryBudget(args.max_memory * 2**20) if args.max_memory else None
+    crawl_kwargs = {'memory_budget': memory_budget, 'flush_every': args.flush_every}
+    try:
+        if args.profile:
+            return profile_run(crawl_departments, subject_numbers, args.concurrency, args.replay, profile_path=args.profile, **crawl_kwargs)
+        return crawl_departments(subject_numbers, args.concurrency, args.replay, **crawl_kwargs)
+    except MemoryBudgetExceeded as e:
+        print(e)
+        print("The rows scraped so far are journaled and the progress is checkpointed, rerun the scraper to resume.")
+        return None
+    finally:
+        telemetry.close_log()
+
+if __name__ == "__main__":
+    main()
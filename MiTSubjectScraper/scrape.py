@@ -1,59 +1,114 @@
 # The purpose of this script is to extract data from the MIT subject evaluation site. 
-# Currently the script is only designed to handle one subject at a time, due to the large number of subjects in the database.
-# Each course is currently set to take approximately 2 seconds to scrape, so it can take on the order of an hour or so to scrape all course data for a given subject.abs
+# Any set of departments can be scraped in one run through the crawl scheduler (see scheduler.py and the --departments option).
+# Course pages are fetched concurrently under a per-host rate limit (see fetcher.py); at the default of one request every 2 seconds it can take on the order of an hour or so to scrape all course data for a given subject.
 
 import requests
 import browser_cookie3
 import re
 import pandas as pd
-import time
 import os
 import numpy as np
 import math
-from bs4 import BeautifulSoup, Tag
+from bs4 import BeautifulSoup, SoupStrainer, Tag
+from bs4.builder import builder_registry
 from catalog_mapping import course_names
+from fetcher import HostRateLimiter, fetch_page, DEFAULT_REQUESTS_PER_SECOND
+from question_index import build_question_index
+from catalog_index import lookup_course, as_value
+from normalized_store import get_table_file, read_subject_table
+from row_buffer import RowBuffer
+from telemetry import timed, count
+from professor_store import ProfessorStore, PROFESSOR_COLUMNS, build_professor_table, join_teacher_values
 
 # 1. Initialization
 CSV_FOLDER_PATH = "course_csv_data"
 SUBJECT_NUMBER = 2
 SUBJECT_NUMBER = str(SUBJECT_NUMBER)
 BASE_URL = "https://eduapps.mit.edu/ose-rpt/"
-SUBJECT_URL_SUFFIX = f"subjectEvaluationSearch.htm?termId=&departmentId=+++{SUBJECT_NUMBER}&subjectCode=&instructorName=&search=Search"
+SUBJECT_URL_SUFFIX = "subjectEvaluationSearch.htm?termId=&departmentId=+++{subject_number}&subjectCode=&instructorName=&search=Search"
 MIT_CATALOG_BASE_URL = "http://catalog.mit.edu/subjects/"
-subject_url = BASE_URL + SUBJECT_URL_SUFFIX
 
-# Load browser cookies
-cookies = browser_cookie3.firefox()
+def get_subject_url(subject_number):
+    """Url of the subject evaluation listing page for a department."""
+    return BASE_URL + SUBJECT_URL_SUFFIX.format(subject_number=subject_number)
+
+def get_catalog_url(subject_number):
+    """Url of the MIT course catalog page for a department."""
+    return MIT_CATALOG_BASE_URL + subject_number
+
+def get_subject_csv_path(subject_number):
+    """Path of the csv file holding the data of a department."""
+    return os.path.join(CSV_FOLDER_PATH, f"subject_{subject_number.replace('/', '-')}.csv")
+
+subject_url = get_subject_url(SUBJECT_NUMBER)
+
+# Columns of the subject and professor csv files. The last three hold the rating, helpfulness and number of ratings of
+# each teacher of the Teachers column, separated the same way; they come last so older csv files keep their layout.
+SUBJECT_COLUMNS = ["Year", "Term", "Course Number", "Subject Name", "Description", "Level (U or G)", "Teachers",
+                   "Teacher Rating (Avg)", "Teacher Rating (STD)", 
+                   "Teacher Helpfulness (Avg)", "Teacher Helpfulness (STD)", "Number of Respondents", 
+                   "Response Rate", "Subject Rating (Avg)", "Subject Rating (STD)", "Pace (Avg)", 
+                   "Pace (STD)", "Total Weekly Hours Spent (Avg)", "Total Weekly Hours Spent (STD)", 
+                   "Assignment Quality (Avg)", "Assignment Quality (STD)", "Grading Fairness (Avg)", 
+                   "Grading Fairness (STD)", "Webpage Link",
+                   "Teacher Ratings", "Teacher Helpfulness Ratings", "Teacher Rating Counts"]
+# Columns identifying a row of the subject and professor csv files
+SUBJECT_KEY_COLUMNS = ["Course Number", "Term", "Year", "Webpage Link"]
+PROFESSOR_KEY_COLUMNS = ["Teacher Name"]
+# Storage types of the numeric subject columns (the remaining columns hold strings)
+SUBJECT_COLUMN_DTYPES = {"Year": np.int64, "Number of Respondents": np.int64,
+                         **{column: np.float64 for column in SUBJECT_COLUMNS if '(Avg)' in column or '(STD)' in column or column == "Response Rate"}}
+
+# Browser cookies are loaded lazily so the parsing functions can be imported without a Firefox profile
+cookies = None
+
+def get_cookies():
+    """Load the Firefox cookies on first use."""
+    global cookies
+    if cookies is None:
+        cookies = browser_cookie3.firefox()
+    return cookies
 
 # Start a session for requests
 session = requests.Session()
 
+# Shared per-host rate limiter used for every request the scraper makes
+rate_limiter = HostRateLimiter(DEFAULT_REQUESTS_PER_SECOND)
+
+# On-disk html cache shared by every request (configured by scheduler.main)
+page_cache = None
+
+# BeautifulSoup tree builders the pages can be parsed with. lxml is C-backed and much faster than the pure-Python
+# html.parser, but is an optional dependency; parser_parity.py checks that both produce the same records.
+PARSER_BACKENDS = ['html.parser', 'lxml']
+DEFAULT_PARSER_BACKEND = 'html.parser'
+parser_backend = DEFAULT_PARSER_BACKEND
+
+def get_available_parser_backends():
+    """Return the parser backends that are installed."""
+    return [backend for backend in PARSER_BACKENDS if builder_registry.lookup(backend) is not None]
+
+@timed('parse.html')
+def make_soup(content, backend=None, parse_only=None):
+    """Parse an html page with the given parser backend, or the configured one if None. `parse_only` is passed on to BeautifulSoup."""
+    backend = backend or parser_backend
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend: {backend}")
+    if builder_registry.lookup(backend) is None:
+        raise ValueError(f"The {backend} parser backend is not installed!")
+    return BeautifulSoup(content, backend, parse_only=parse_only)
+
 # define the header to bypass student stuff
 headers = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:92.0) Gecko/20100101 Firefox/92.0',
     'Referrer': 'https://student.mit.edu/',
 }
 
-# Custom Exception Handling
-class MultipleTeacherMatches(Exception):
-    pass
-
-def check_course_exists_in_dataframe(course_number, term, year, df):
-    """Check if a course exists in the dataframe based on its course number."""
-    # 0. Initialize the output variable
-    output_condition = False
-
-    # 1. Convert the course number to the format used in the dataframe
-    course_number = f'="{course_number}"'
-
-    # 2. Check if the course number, year, and term exists in the dataframe already
-    if course_number in df['Course Number'].values:
-        # 2.1 Get the row of the course, that is, where the course number, term, and year match
-        course_rows = df.loc[df['Course Number'] == course_number]
-        course_row = course_rows.loc[(course_rows['Term'] == term) & (course_rows['Year'] == year)]
-        output_condition = True if course_row.values.any() else False
-    return output_condition
+def course_matches_subject(course, subject_number):
+    """Check if a course such as '2.12 Introduction to Robotics' belongs to a department such as '2' or 'CMS/21W'."""
+    return course.split('.')[0] in subject_number.split('/')
 
+@timed('extract.get_page_format')
 def get_page_format(course_soup):
     """Determine the format of the course page."""
     
@@ -78,6 +133,7 @@ def get_page_format(course_soup):
     else:
         return "not_implemented"
 
+@timed('extract.get_subject_rating_new_format')
 def get_subject_rating_new_format(course_soup):
     try:
         subject_mean = float(course_soup.find_all('p')[4].get_text().replace('\xa0',' ').replace('\t','').replace('\n','').replace('\r','').split('subject: ')[1].split(' ')[0])
@@ -90,6 +146,7 @@ def get_subject_rating_new_format(course_soup):
     
     return subject_mean, subject_std
 
+@timed('extract.get_teacher_data_new_format')
 def get_teacher_data_new_format(course_soup):
     try:
         teacher_row_data = course_soup.find('table', class_='grid').find_all('tr')[2:]
@@ -109,268 +166,99 @@ def get_teacher_data_new_format(course_soup):
 
     return teacher_data
 
-def combine_distributions(mean1, std1, n1, mean2, std2, n2):
-    # Calculate the combined weight
-    combined_weight = n1 + n2
-
-    # Calculate the weighted mean
-    combined_mean = (mean1 * n1 + mean2 * n2) / combined_weight
-
-    # Compute the combined variance using the provided formula
-    combined_variance = (n1 * std1**2 + n2 * std2**2 + n1 * (mean1 - combined_mean)**2 + n2 * (mean2 - combined_mean)**2) / combined_weight
-
-    # Calculate the combined standard deviation
-    combined_std = np.sqrt(combined_variance)
-
-    return combined_mean, combined_std, combined_weight
-
-def add_teacher_data_to_df(professor_df, teacher_dict):
-    """Add teacher data to the professor dataframe."""
-    # 0. Fill the teacher name column with 'Unkown' if it is empty or nan
-    professor_df['Teacher Name'] = professor_df['Teacher Name'].fillna('Unknown')
-
-    # 1. Iterate over each teacher
-    for i, teacher_name in enumerate(teacher_dict['teacher name']):
-        # 1.1 Handle the case where the teacher name is all caps
-        all_caps_flag = teacher_name.isupper()
-        if all_caps_flag:
-            teacher_name = teacher_name.title()
-        first_letter = teacher_name[0]
-        last_name = teacher_name.split(' ')[-1]
-
-        condition = professor_df['Teacher Name'].apply(lambda x: bool(re.search(r'\b' + re.escape(first_letter) + r'.*' + re.escape(last_name) + r'\b', x))) if all_caps_flag else professor_df['Teacher Name'] == teacher_name
-
-        # 2. Check if the teacher exists in the dataframe
-        if not condition.any():
-            # 2.1 Add the teacher to the dataframe
-            add_dict = {'Teacher Name': teacher_name,
-                        'Teacher Rating (Avg)': teacher_dict['teacher rating'][i],
-                        'Teacher Rating (STD)': 0, # we have to assume a value here unfortunately
-                        'Teacher Helpfulness (Avg)': teacher_dict['teacher help'][i],
-                        'Teacher Helpfulness (STD)': 0, # we have to assume a value here unfortunately
-                        'Number of Ratings': teacher_dict['number of votes'][i],
-                        'Number of Classes': 1}
-            new_df = pd.DataFrame(add_dict, index=[0])
-            professor_df = pd.concat([professor_df,new_df], ignore_index=True)
-        else:
-            # 2.2 Get the current teacher's rating, helpfulness, and number of ratings
-            try:
-                if sum(condition) > 1:
-                    # handle multiple matches
-                    # for example, raise an error, or log a warning
-                    raise MultipleTeacherMatches("Multiple matches found for teacher: {}".format(teacher_name))
-                current_teacher_rating = professor_df.loc[condition, 'Teacher Rating (Avg)'].values[0]
-                current_teacher_rating_std = professor_df.loc[condition, 'Teacher Rating (STD)'].values[0]
-                current_teacher_help = professor_df.loc[condition, 'Teacher Helpfulness (Avg)'].values[0]
-                current_teacher_help_std = professor_df.loc[condition, 'Teacher Helpfulness (STD)'].values[0]
-                current_num_ratings = professor_df.loc[condition, 'Number of Ratings'].values[0]
-                current_num_classes = professor_df.loc[condition, 'Number of Classes'].values[0]
-
-                # 3. Update the teacher's rating, helpfulness, and number of ratings
-                # 3.1 Get the delta values
-                delta_teacher_rating = teacher_dict['teacher rating'][i]
-                delta_teacher_help = teacher_dict['teacher help'][i]
-                delta_num_ratings = teacher_dict['number of votes'][i]
-
-                # 3.2 Combine the distributions
-                combined_teacher_rating, combined_teacher_rating_std, _ = combine_distributions(current_teacher_rating, current_teacher_rating_std, current_num_ratings, delta_teacher_rating, 0, delta_num_ratings)
-                combined_teacher_help, combined_teacher_help_std, _ = combine_distributions(current_teacher_help, current_teacher_help_std, current_num_ratings, delta_teacher_help, 0, delta_num_ratings)
-            
-                # 3.3 Update the dataframe
-                professor_df.loc[condition, 'Teacher Rating (Avg)'] = combined_teacher_rating
-                professor_df.loc[condition, 'Teacher Rating (STD)'] = combined_teacher_rating_std
-                professor_df.loc[condition, 'Teacher Helpfulness (Avg)'] = combined_teacher_help
-                professor_df.loc[condition, 'Teacher Helpfulness (STD)'] = combined_teacher_help_std
-                professor_df.loc[condition, 'Number of Ratings'] = current_num_ratings + delta_num_ratings
-                professor_df.loc[condition, 'Number of Classes'] = current_num_classes + 1
-            except MultipleTeacherMatches:
-                continue
-
-    return professor_df
-
-def get_pace_new_format(course_soup):
-    # 1. Get the pace data
-    # 1.1 Get the pace average rating
+# Question patterns used to find each metric in the QuestionIndex of a new-format page
+PACE_PATTERNS = ['ace ']
+HOURS_TABLE_PATTERNS = ['hrs', 'hours']
+HOURS_ROW_PATTERNS = [['in class', 'in the classroom'], # hours in class
+                      ['outside of the classroom'], # hours out of class
+                      ['on homework'], # hours on homework
+                      ['in lab'], # hours in lab
+                      ['How much time (in hours) did you spend per week on this subject?']] # total hours if given directly
+ASSIGNMENT_QUALITY_PATTERNS = ['assignments contributed to my', 'Problem sets helped me', 'Assignments contributed to my']
+GRADING_FAIRNESS_PATTERNS = ['Graded fairly', 'grading thus far has been fair', 'Grading thus far has been fair', 'Grading was fair']
+
+@timed('extract.get_pace_new_format')
+def get_pace_new_format(question_index):
+    # 1. Get the pace data, which is the third to last row of the first table mentioning the pace
+    pace_rows = question_index.table_rows(PACE_PATTERNS)
     try:
-        pace_avg = float(course_soup.find_all('table', class_='indivQuestions')[['ace ' in x.get_text() for x in course_soup.find_all('table', class_='indivQuestions')].index(True)].find('tbody').find_all('tr')[-3].find('td', class_='avg').get_text())
-    except (NameError, ValueError):
-        pace_avg = np.nan
-    
-    # 1.2 Get the pace standard deviation
-    try:
-        pace_std = float(course_soup.find_all('table', class_='indivQuestions')[['ace ' in x.get_text() for x in course_soup.find_all('table', class_='indivQuestions')].index(True)].find('tbody').find_all('tr')[-3].find_all('td')[-1].get_text())
-    except (NameError, ValueError):
-        pace_std = np.nan
+        pace_row = pace_rows[-3]
+    except (TypeError, IndexError):
+        return np.nan, np.nan
 
-    return pace_avg, pace_std
+    return pace_row.avg, pace_row.std
 
-def get_hour_data_new_format(course_soup):
+@timed('extract.get_hour_data_new_format')
+def get_hour_data_new_format(question_index):
     # 1. Get the hours data
     # 1.0 Initialize the total hours lists
     total_hours_avg = []
     total_hours_std = []
 
-    # 1.0.1 Get the hours table html data
-    hours_table_html = course_soup.find_all('table', class_='indivQuestions')[[('hrs' in x.get_text() or 'hours' in x.get_text()) for x in course_soup.find_all('table', class_='indivQuestions')].index(True)].find('tbody').find_all('tr')
+    # 1.0.1 Get the rows of the hours table
+    hours_rows = question_index.table_rows(HOURS_TABLE_PATTERNS) or []
 
-    # 1.1 Get the hours in class average
-    try:
-        hours_in_class_avg = float(hours_table_html[[('in class' in x.get_text() or 'in the classroom' in x.get_text()) for x in hours_table_html].index(True)].find('td', class_='avg').get_text())
-        total_hours_avg.append(hours_in_class_avg)
-    except:
-        hours_in_class_avg = np.nan
-    
-    # 1.2 Get the hours in class standard deviation
-    try:
-        hours_in_class_std = float(hours_table_html[[('in class' in x.get_text() or 'in the classroom' in x.get_text()) for x in hours_table_html].index(True)].find_all('td')[-1].get_text())
-        total_hours_std.append(hours_in_class_std)
-    except:
-        hours_in_class_std = np.nan
-    
-    # 1.3 Get the hours out of class average
-    try:
-        hours_out_class_avg = float(hours_table_html[['outside of the classroom' in x.get_text() for x in hours_table_html].index(True)].find('td', class_='avg').get_text())
-        total_hours_avg.append(hours_out_class_avg)
-    except:
-        hours_out_class_avg = np.nan
-    
-    # 1.4 Get the hours out of class standard deviation
-    try:
-        hours_out_class_std = float(hours_table_html[['outside of the classroom' in x.get_text() for x in hours_table_html].index(True)].find_all('td')[-1].get_text())
-        total_hours_std.append(hours_out_class_std)
-    except:
-        hours_out_class_std = np.nan
-    
-    # 1.4.1 Get the hours on homework average
-    try:
-        hours_on_homework_avg = float(hours_table_html[['on homework' in x.get_text() for x in hours_table_html].index(True)].find('td', class_='avg').get_text())
-        total_hours_avg.append(hours_on_homework_avg)
-    except:
-        hours_on_homework_avg = np.nan
-    
-    # 1.4.2 Get the hours on homework standard deviation
-    try:
-        hours_on_homework_std = float(hours_table_html[['on homework' in x.get_text() for x in hours_table_html].index(True)].find_all('td')[-1].get_text())
-        total_hours_std.append(hours_on_homework_std)
-    except:
-        hours_on_homework_std = np.nan
-    
-    # 1.4.3 Get the hours on lab average
-    try:
-        hours_lab_avg = float(hours_table_html[['in lab' in x.get_text() for x in hours_table_html].index(True)].find('td', class_='avg').get_text())
-        total_hours_avg.append(hours_lab_avg)
-    except:
-        hours_lab_avg = np.nan
-    
-    # 1.4.4 Get the hours on lab standard deviation
-    try:
-        hours_lab_std = float(hours_table_html[['in lab' in x.get_text() for x in hours_table_html].index(True)].find_all('td')[-1].get_text())
-        total_hours_std.append(hours_lab_std)
-    except:
-        hours_lab_std = np.nan
-    
-    # 1.5 Get the total hours average if given directly
-    try:
-        hours_per_week_avg = float(hours_table_html[['How much time (in hours) did you spend per week on this subject?' in x.get_text() for x in hours_table_html].index(True)].find('td', class_='avg').get_text())
-        total_hours_avg.append(hours_per_week_avg)
-    except:
-        hours_per_week_avg = np.nan
-    
-    # 1.5.1 Get the total hours standard deviation if given directly
-    try:
-        hours_per_week_std = float(hours_table_html[['How much time (in hours) did you spend per week on this subject?' in x.get_text() for x in hours_table_html].index(True)].find_all('td')[-1].get_text())
-        total_hours_std.append(hours_per_week_std)
-    except:
-        hours_per_week_std = np.nan
-    
-    # 1.6 Get the total hours average
+    # 1.1 Collect the average and standard deviation of every kind of hours reported
+    for patterns in HOURS_ROW_PATTERNS:
+        hours_row = question_index.find_row(patterns, hours_rows)
+        if hours_row is None:
+            continue
+        if not np.isnan(hours_row.avg):
+            total_hours_avg.append(hours_row.avg)
+        if not np.isnan(hours_row.std):
+            total_hours_std.append(hours_row.std)
+
+    # 1.2 Get the total hours average
     total_hours_avg = np.sum(total_hours_avg)
     total_hours_std = np.sqrt(np.sum([x**2 for x in total_hours_std])) # can only sum variances, not standard deviations. Assuming the standard deviations are independent, we can sum the variances and then take the square root to get the total standard deviation
 
     return total_hours_avg, total_hours_std
 
-def get_assignment_quality_new_format(course_soup):
+@timed('extract.get_assignment_quality_new_format')
+def get_assignment_quality_new_format(question_index):
     # 1. Get the assignment quality data
-    # 1.1 Get the assignment quality average rating
-    # 1.1.1 Get the assignment quality table html data
-    assignment_quality_table_html = course_soup.find_all('table', class_='indivQuestions')[[('assignments contributed to my' in x.get_text() or 'Problem sets helped me' in x.get_text() or 'Assignments contributed to my' in x.get_text()) for x in course_soup.find_all('table', class_='indivQuestions')].index(True)].find('tbody').find_all('tr')
-
-    # 1.1.2 Get the assignment quality average
-    try:
-        assignment_quality_avg = float(assignment_quality_table_html[[('assignments contributed to my' in x.get_text() or 'Problem sets helped me' in x.get_text() or 'Assignments contributed to my' in x.get_text()) for x in assignment_quality_table_html].index(True)].find('td', class_='avg').get_text())
-    except:
-        assignment_quality_avg = np.nan
-    
-    # 1.1.3 Get the assignment quality standard deviation
-    try:
-        assignment_quality_std = float(assignment_quality_table_html[[('assignments contributed to my' in x.get_text() or 'Problem sets helped me' in x.get_text() or 'Assignments contributed to my' in x.get_text()) for x in assignment_quality_table_html].index(True)].find_all('td')[-1].get_text())
-    except:
-        assignment_quality_std = np.nan
+    assignment_quality_row = question_index.find_row(ASSIGNMENT_QUALITY_PATTERNS, question_index.table_rows(ASSIGNMENT_QUALITY_PATTERNS) or [])
+    if assignment_quality_row is None:
+        return np.nan, np.nan
 
-    return assignment_quality_avg, assignment_quality_std
+    return assignment_quality_row.avg, assignment_quality_row.std
 
-def get_grading_fairness_ratings_new_format(course_soup):
+@timed('extract.get_grading_fairness_ratings_new_format')
+def get_grading_fairness_ratings_new_format(question_index):
     # 1. Get the grading fairness data
-    # 1.1 Get the grading fairness table html data
-    grading_fairness_table = course_soup.find_all('table', class_='indivQuestions')[[('Graded fairly' in x.get_text() or 'grading thus far has been fair' in x.get_text() or 'Grading thus far has been fair' in x.get_text() or 'Grading was fair' in x.get_text()) for x in course_soup.find_all('table', class_='indivQuestions')].index(True)].find('tbody').find_all('tr')
+    grading_fairness_row = question_index.find_row(GRADING_FAIRNESS_PATTERNS, question_index.table_rows(GRADING_FAIRNESS_PATTERNS) or [])
+    if grading_fairness_row is None:
+        return np.nan, np.nan
 
-    # 1.2 Get the grading fairness average
-    try:
-        grading_fairness_avg = float(grading_fairness_table[[('Graded fairly' in x.get_text() or 'grading thus far has been fair' in x.get_text() or 'Grading thus far has been fair' in x.get_text() or 'Grading was fair' in x.get_text()) for x in grading_fairness_table].index(True)].find('td', class_='avg').get_text())
-    except:
-        grading_fairness_avg = np.nan
-    
-    # 1.3 Get the grading fairness standard deviation
-    try:
-        grading_fairness_std = float(grading_fairness_table[[('Graded fairly' in x.get_text() or 'grading thus far has been fair' in x.get_text() or 'Grading thus far has been fair' in x.get_text() or 'Grading was fair' in x.get_text()) for x in grading_fairness_table].index(True)].find_all('td')[-1].get_text())
-    except:
-        grading_fairness_std = np.nan
+    return grading_fairness_row.avg, grading_fairness_row.std
 
-    return grading_fairness_avg, grading_fairness_std
-
-def get_course_catalog_info(course_information_list, course):
+@timed('extract.get_course_catalog_info')
+def get_course_catalog_info(catalog_index, course):
     # 1. Get the course number and subject name
     course_number = course.split(' ')[0]
     subject_name = course.split(' ')[1].replace(' : ','').strip()
-    # 1.1 Find which row in course_information_list corresponds to the current course
-    # 1.1.1 Define a re pattern to match the course number properly
-    pattern = r'\b' + re.escape(str(course_number)) + r'\b'
-    try:
-        # 1.1.2 Find the row in course_information_list that matches the course number pattern
-        course_information_row = course_information_list[[re.search(pattern, str(x.find('strong'))) is not None for x in course_information_list].index(True)]
 
-        # 1.1.3 If the subject name is not in the course information row, then raise a ValueError to assign np.nan to the course information
-        if subject_name not in str(course_information_row):
-            print(f'{course_number} {subject_name} is not in the current MIT course catalog...')
-            raise ValueError('The subject name is not in the course information row...')
-        
-        # 1.2 Get the level of the course (U or G)
-        # 1.2.1 Define a re pattern to search for the course type (' U ' or ' G ')
-        pattern = r'U \(|G \('
-        # 1.2.2 Find the course type from the course information row
-        try:
-            course_type = re.search(pattern, str(course_information_row)).group().strip().replace('>','').replace(' (','')
-        except AttributeError:
-            course_type = np.nan
-
-        # 1.3 Get the course description
-        # 1.3.1 Define a re pattern to search for the course description
-        pattern = r'<p class="courseblockdesc">.*</p>'
-        # 1.3.2 Find the course description from the course information row
-        try:
-            course_description = re.search(pattern, str(course_information_row)).group().strip().replace('>','').replace('<','').replace('/','').replace('p class="courseblockdesc"','').replace('"','').replace('Description','')
-        except AttributeError:
-            course_description = np.nan
-    except ValueError:
-        course_type = np.nan
-        course_description = np.nan
+    # 1.1 Look the course up in the catalog index
+    catalog_entry = lookup_course(catalog_index, course_number)
+    if catalog_entry is None:
+        return np.nan, np.nan, course_number, subject_name
+
+    # 1.2 If the subject name is not in the catalog entry, the course is no longer in the catalog under this number
+    if subject_name not in catalog_entry['text']:
+        print(f'{course_number} {subject_name} is not in the current MIT course catalog...')
+        return np.nan, np.nan, course_number, subject_name
+
+    # 2. Get the level of the course (U or G) and the course description
+    course_type = as_value(catalog_entry['level'])
+    course_description = as_value(catalog_entry['description'])
 
     return course_type, course_description, course_number, subject_name
 
-def extract_data_from_new_webpage(course_soup, course_information_list, df, url, professor_df):
-    """Extract data from a given course page."""
-    # 0. Initialize the data dictionary by iterating over the columns of df
-    data_dict = { column : None for column in df.columns }
+@timed('extract.new_format')
+def extract_data_from_new_webpage(course_soup, catalog_index, rows, url, subject_number=SUBJECT_NUMBER):
+    """Extract data from a given course page and append its rows to the `rows` buffer."""
+    # 0. Initialize the data dictionary by iterating over the columns of the rows buffer
+    data_dict = { column : None for column in rows.columns }
 
     # 1. Locate the required HTML tag
     h1_tag = course_soup.find('td', class_='subjectTitle')\
@@ -402,36 +290,32 @@ def extract_data_from_new_webpage(course_soup, course_information_list, df, url,
     # 3.4 Extract data related to professors
     teacher_dict = get_teacher_data_new_format(course_soup)    
     
-    # 3.5 Extract data related to pace
-    pace_avg, pace_std = get_pace_new_format(course_soup)
+    # 3.5 Index the individual question tables once for the remaining metrics
+    question_index = build_question_index(course_soup)
 
-    # 3.6 Extract data related to hours spent in class
-    total_hours_avg, total_hours_std = get_hour_data_new_format(course_soup)
+    # 3.6 Extract data related to pace
+    pace_avg, pace_std = get_pace_new_format(question_index)
 
-    # 3.7 Extract data related to assignment quality
-    assignment_quality_avg, assignment_quality_std = get_assignment_quality_new_format(course_soup)
+    # 3.7 Extract data related to hours spent in class
+    total_hours_avg, total_hours_std = get_hour_data_new_format(question_index)
 
-    # 3.8 Extract data related to grading fairness
-    grading_fairness_avg, grading_fairness_std = get_grading_fairness_ratings_new_format(course_soup)
+    # 3.8 Extract data related to assignment quality
+    assignment_quality_avg, assignment_quality_std = get_assignment_quality_new_format(question_index)
 
-    # 4. Initialize an empty list
-    output_data_list = []
+    # 3.9 Extract data related to grading fairness
+    grading_fairness_avg, grading_fairness_std = get_grading_fairness_ratings_new_format(question_index)
 
-    # 5. Add course data to the output data list
+    # 5. Add course data to the rows buffer
     # 5.1 Iterate over each course in course_list
     for course in course_list:
         # 5.2 Check if the course in question matches the subject number we are looking for
-        # 5.2.1 Extract the subject number
-        subject_number = course.split('.')[0]
-
-        # 5.2.2 Check if it matches SUBJECT_NUMBER
-        if subject_number == SUBJECT_NUMBER:
+        if course_matches_subject(course, subject_number):
             # 5.3 Output the scraped course data to a dictionary
             # 5.3.1 Initialize the data dictionary
             current_data = data_dict.copy()
 
-            # 5.3.2 Obtain data about the course from the course catalog using the course_information_list object
-            course_type, course_description, course_number, subject_name = get_course_catalog_info(course_information_list, course)
+            # 5.3.2 Obtain data about the course from the course catalog using the catalog_index object
+            course_type, course_description, course_number, subject_name = get_course_catalog_info(catalog_index, course)
 
             # 5.3.3 Add the data to the dictionary
             current_data["Course Number"] = f'="{course_number}"'
@@ -445,6 +329,9 @@ def extract_data_from_new_webpage(course_soup, course_information_list, df, url,
             current_data["Teacher Rating (STD)"] = np.std(teacher_dict['teacher rating'])
             current_data["Teacher Helpfulness (Avg)"] = np.mean(teacher_dict['teacher help'])
             current_data["Teacher Helpfulness (STD)"] = np.std(teacher_dict['teacher help'])
+            current_data["Teacher Ratings"] = join_teacher_values(teacher_dict['teacher rating'])
+            current_data["Teacher Helpfulness Ratings"] = join_teacher_values(teacher_dict['teacher help'])
+            current_data["Teacher Rating Counts"] = join_teacher_values(teacher_dict['number of votes'])
             current_data["Number of Respondents"] = number_of_respondents
             current_data["Response Rate"] = response_rate
             current_data["Subject Rating (Avg)"] = subject_rating_mean
@@ -459,20 +346,18 @@ def extract_data_from_new_webpage(course_soup, course_information_list, df, url,
             current_data["Grading Fairness (STD)"] = grading_fairness_std
             current_data["Webpage Link"] = url
 
-            # 5.4 Add the data to the output data list
-            output_data_list.append(current_data)
+            # 5.4 Add the data to the rows buffer
+            rows.append(current_data)
 
-    # 6. Return the new df and professor df
-    new_df = pd.DataFrame(output_data_list)
-    df = pd.concat([df,new_df], ignore_index=True)
-    professor_df = add_teacher_data_to_df(professor_df, teacher_dict) if teacher_dict['teacher name'][0] is not np.nan else professor_df
-    return df, professor_df
+    # 6. Return the rows buffer (the professor table is derived from the rows by build_professor_table)
+    return rows
 
-def extract_data_from_old_webpage(course_soup, course_information_list, df, url, professor_df):
-    """Extract data from a given course page with old format."""
+@timed('extract.old_format')
+def extract_data_from_old_webpage(course_soup, catalog_index, rows, url, subject_number=SUBJECT_NUMBER):
+    """Extract data from a given course page with old format and append its rows to the `rows` buffer."""
 
-    # 0. Initialize data_dict with columns of df
-    data_dict = {column: None for column in df.columns}
+    # 0. Initialize data_dict with the columns of the rows buffer
+    data_dict = {column: None for column in rows.columns}
 
     # 1. Get the course list that contains which courses the page corresponds to
     # 1.1 Find where in the page the course list is located
@@ -507,23 +392,16 @@ def extract_data_from_old_webpage(course_soup, course_information_list, df, url,
     # 3.8. Get grading fairness data
     grading_fairness_avg, grading_fairness_std = get_grading_fairness_old_format(course_soup)
 
-    # 4. Initialize an empty output_data_list
-    output_data_list = []
-
     # 5. Iterate over each course in course_list:
     for course in course_list:
         # 5.2 Check if the course in question matches the subject number we are looking for
-        # 5.2.1 Extract the subject number
-        subject_number = course.split('.')[0]
-
-        # 5.2.2 Check if it matches SUBJECT_NUMBER
-        if subject_number == SUBJECT_NUMBER:
+        if course_matches_subject(course, subject_number):
             # 5.3 Output the scraped course data to a dictionary
             # 5.3.1 Initialize the data dictionary
             current_data = data_dict.copy()
 
-            # 5.3.2 Obtain data about the course from the course catalog using the course_information_list object
-            course_type, course_description, course_number, subject_name = get_course_catalog_info(course_information_list, course)
+            # 5.3.2 Obtain data about the course from the course catalog using the catalog_index object
+            course_type, course_description, course_number, subject_name = get_course_catalog_info(catalog_index, course)
 
             # 5.3.3 Add the data to the dictionary
             current_data["Course Number"] = f'="{course_number}"'
@@ -537,6 +415,9 @@ def extract_data_from_old_webpage(course_soup, course_information_list, df, url,
             current_data["Teacher Rating (STD)"] = np.std(teacher_dict['teacher rating'])
             current_data["Teacher Helpfulness (Avg)"] = np.mean(teacher_dict['teacher help'])
             current_data["Teacher Helpfulness (STD)"] = np.std(teacher_dict['teacher help'])
+            current_data["Teacher Ratings"] = join_teacher_values(teacher_dict['teacher rating'])
+            current_data["Teacher Helpfulness Ratings"] = join_teacher_values(teacher_dict['teacher help'])
+            current_data["Teacher Rating Counts"] = join_teacher_values(teacher_dict['number of votes'])
             current_data["Number of Respondents"] = num_responses
             current_data["Response Rate"] = response_rate
             current_data["Subject Rating (Avg)"] = subject_rating_mean
@@ -551,19 +432,13 @@ def extract_data_from_old_webpage(course_soup, course_information_list, df, url,
             current_data["Grading Fairness (STD)"] = grading_fairness_std
             current_data["Webpage Link"] = url
 
-            # 5.4 Add the data to the output data list
-            output_data_list.append(current_data)
+            # 5.4 Add the data to the rows buffer
+            rows.append(current_data)
 
-    # 6. Convert output_data_list to a new_df and concatenate it with df
-    new_df = pd.DataFrame(output_data_list)
-    df = pd.concat([df, new_df], ignore_index=True)
-
-    # 7. Update professor_df with teacher data
-    professor_df = add_teacher_data_to_df(professor_df, teacher_dict) if teacher_dict['teacher name'][0] is not np.nan else professor_df
-
-    # 8. Return df and professor_df
-    return df, professor_df
+    # 6. Return the rows buffer (the professor table is derived from the rows by build_professor_table)
+    return rows
 
+@timed('extract.get_year_and_term_old_format')
 def get_year_and_term_old_format(soup):
     """Get the year and term of the course from the old format webpage."""
     # 1. Find where the year and term is located
@@ -574,6 +449,7 @@ def get_year_and_term_old_format(soup):
 
     return year, term
 
+@timed('extract.get_responders_data_old_format')
 def get_responders_data_old_format(soup):
     # 1. Find where the response data is located
     response_data_tag = soup.find_all('table')[1].find_all('td')[3].find('font') # get the second table in the list
@@ -591,6 +467,7 @@ def get_responders_data_old_format(soup):
 
     return num_responses, response_rate
 
+@timed('extract.get_subject_rating_old_format')
 def get_subject_rating_old_format(soup):
     # 1. Find where the subject rating data is located
     subject_rating_data_tag = soup.find_all('table')[1].find_all('td')[4].find('b')
@@ -600,6 +477,7 @@ def get_subject_rating_old_format(soup):
     
     return subject_rating_avg
 
+@timed('extract.get_teacher_data_old_format')
 def get_teacher_data_old_format(soup):
     try:
         teacher_row_data = soup.find('div', id='contentsframe').find('table').find_all('table')[1].find_all('tr')[1::]
@@ -634,6 +512,7 @@ def get_teacher_data_old_format(soup):
 
     return teacher_data
 
+@timed('extract.get_pace_old_format')
 def get_pace_old_format(soup):
     # 1. Obtain the pace from the soup
     try:
@@ -645,6 +524,7 @@ def get_pace_old_format(soup):
 
     return pace_avg, pace_std
 
+@timed('extract.get_hours_old_format')
 def get_hours_old_format(soup):
     # 1. Obtain the hour data from the soup
     # 1.1 Initialize the hour outputs
@@ -677,6 +557,7 @@ def get_hours_old_format(soup):
 
     return total_hours_avg, total_hours_std
 
+@timed('extract.get_assignment_quality_old_format')
 def get_assignment_quality_old_format(soup):
     # 1. Get the assignment quality data
     # 1.1 Get the grading fairness table html data
@@ -689,6 +570,7 @@ def get_assignment_quality_old_format(soup):
 
     return assignment_quality_avg, assignment_quality_std
 
+@timed('extract.get_grading_fairness_old_format')
 def get_grading_fairness_old_format(soup):
     # 1. Get the grading fairness data
     # 1.1 Get the grading fairness table html data
@@ -701,8 +583,9 @@ def get_grading_fairness_old_format(soup):
 
     return grading_fairness_avg, grading_fairness_std
 
-def extract_data(course_soup, course_information_list, df, url, professor_df):
-    """Extract data from a given course page."""
+@timed('extract')
+def extract_data(course_soup, catalog_index, rows, url, subject_number=SUBJECT_NUMBER):
+    """Extract data from a given course page, appending its subject rows to the `rows` buffer."""
     
     # Determine the format of the course page
     page_format = get_page_format(course_soup)
@@ -710,54 +593,76 @@ def extract_data(course_soup, course_information_list, df, url, professor_df):
     # Handle the different formats
     if page_format == "new_format":
         # Extract data from the new format webpage
-        df, professor_df = extract_data_from_new_webpage(course_soup, course_information_list, df, url, professor_df)
-        return df, professor_df
+        rows = extract_data_from_new_webpage(course_soup, catalog_index, rows, url, subject_number)
+        return rows
     elif page_format == "old_format":
         # Logic to handle the old format will go here
-        df, professor_df = extract_data_from_old_webpage(course_soup, course_information_list, df, url, professor_df)
-        return df, professor_df
+        rows = extract_data_from_old_webpage(course_soup, catalog_index, rows, url, subject_number)
+        return rows
     else:
         # Handle the not_implemented case
         raise NotImplementedError("The given page format is not implemented!")
     
-def process_course_link(course_link, course_information_list, df, professor_df):
-    link = BASE_URL + course_link if course_link.startswith('subjectEvaluation') else course_link
-    response = session.get(link, cookies=cookies,headers=headers)
-    if response.status_code != 200:
-        print(f"Error accessing course page: {link}")
-        return df, professor_df
+def get_course_page_url(course_link):
+    """Convert a link from the subject listing page into an absolute url."""
+    return BASE_URL + course_link if course_link.startswith('subjectEvaluation') else course_link
 
-    course_soup = BeautifulSoup(response.content, 'html.parser')
-    df, professor_df = extract_data(course_soup, course_information_list, df, link, professor_df)
-
-    return df, professor_df
-
-def extract_header_to_content(soup):
-    header_to_content = {}
-    current_header = None
-    
-    for tag in soup.find_all(['h2', 'p']):
-        if tag.name == 'h2':
-            current_header = tag.text
-            header_to_content[current_header] = []
-        elif tag.name == 'p' and current_header is not None:
-            header_to_content[current_header].append(str(tag))
+def process_course_response(link, response, catalog_index, rows, subject_number=SUBJECT_NUMBER):
+    """Parse a fetched course page and add its data to the rows buffer."""
+    if response is None or response.status_code != 200:
+        print(f"Error accessing course page: {link}")
+        return rows
+
+    course_soup = make_soup(response.content)
+    count('pages_parsed')
+    rows = extract_data(course_soup, catalog_index, rows, link, subject_number)
+    # the rows only hold plain values, so the tree can be torn down right away instead of waiting for the gc
+    course_soup.decompose()
+
+    return rows
+
+def process_course_link(course_link, catalog_index, rows, subject_number=SUBJECT_NUMBER):
+    link = get_course_page_url(course_link)
+    response = fetch_page(session, link, rate_limiter, page_cache, cookies=get_cookies(), headers=headers)
+    return process_course_response(link, response, catalog_index, rows, subject_number)
+
+def load_subject_df(subject_data_csv_path):
+    """Load the subject table (its normalized store or csv), or create an empty dataframe if it does not exist yet."""
+    if os.path.exists(get_table_file(subject_data_csv_path)):
+        return read_subject_table(subject_data_csv_path)
+    return pd.DataFrame(columns=SUBJECT_COLUMNS)
+
+def make_subject_rows(df=None):
+    """Create the columnar buffer the extractors append subject rows to, optionally holding the rows of `df`."""
+    if df is None:
+        return RowBuffer(SUBJECT_COLUMNS, SUBJECT_COLUMN_DTYPES)
+    return RowBuffer.from_frame(df, SUBJECT_COLUMNS, SUBJECT_COLUMN_DTYPES)
+
+def load_professor_df(professor_csv_path):
+    """Load the professor csv, or create an empty dataframe if it does not exist yet."""
+    if pd.io.common.file_exists(professor_csv_path):
+        return pd.read_csv(professor_csv_path)
+    return pd.DataFrame(columns=PROFESSOR_COLUMNS)
 
-    return header_to_content
+def make_professor_store(professor_df=None):
+    """Create the store build_professor_table adds teacher ratings to, optionally holding the teachers of `professor_df`."""
+    if professor_df is None:
+        return ProfessorStore()
+    return ProfessorStore.from_frame(professor_df)
 
-def get_course_year_and_term(html_string, header_to_content):
-    # 1. Get the course year and term based on the link and the header_to_content dictionary
-    course_year_and_term = list(header_to_content.keys())[[html_string.split('>')[0] in str(x) for x in header_to_content.values()].index(True)]
+# Only the term headers and the links of the listing page are needed, so everything else is skipped while parsing
+LISTING_PARSE_ONLY = SoupStrainer(['h2', 'a'])
 
-    # 2. Extract the year and term from the course_year_and_term string
-    # 2.1 Extract the term
+def get_course_year_and_term(course_year_and_term):
+    """Convert a listing page header such as 'Spring Term 2022-2023' into a (term, year) pair."""
+    # 1. Extract the term
     term = course_year_and_term.split(' Term')[0]
 
-    # 2.1.2 Convert the term to the appropriate format
+    # 1.1 Convert the term to the appropriate format
     if term == 'January':
         term = 'IAP'
     
-    # 2.2 Extract the year depending on the term
+    # 2. Extract the year depending on the term
     if term == 'IAP' or term == 'Spring':
         year = int(course_year_and_term.split(' ')[-1].split('-')[-1])
     else:
@@ -765,92 +670,34 @@ def get_course_year_and_term(html_string, header_to_content):
 
     return term, year
 
-def main():
-    # Fetch the main course listing page
-    response = session.get(subject_url, cookies=cookies)
-    if response.status_code != 200:
-        print("Error accessing the main subject URL! Please go through the login and verification process in your browser and try again.")
-        print(f'Error code: {response.status_code}')
-        print('Exiting...')
-        return None
-    
-    # Get the course links list
-    soup = BeautifulSoup(response.content, 'html.parser')
-    course_links = soup.find_all('a', href=True)
-
-    # Fetch the MIT course catalog subject information page
-    # 1. Construct the search URL
-    # 1.2 Construct the search URL using the url suffix
-    search_url = MIT_CATALOG_BASE_URL + SUBJECT_NUMBER
-
-    # 1.3 Fetch the search URL
-    search_response = session.get(search_url, cookies=cookies)
-    if search_response.status_code != 200:
-        print("Error accessing the MIT course catalog subject information page!")
-        return None
-    
-    # 2. Obtain a course information list from the search response
-    # 2.1 Get the catalog soup
-    catalog_soup = BeautifulSoup(search_response.content, 'html.parser')
-
-    # 2.2 Get the course information list
-    course_information_list = catalog_soup.find_all('div', class_='courseblock')
-
-    # Obtain the header to content dictionary map
-    header_to_content = extract_header_to_content(soup)
-
-    # Define CSV file paths
-    subject_data_csv_path = os.path.join(CSV_FOLDER_PATH, f"subject_{SUBJECT_NUMBER}.csv")
-    professor_csv_path = os.path.join(CSV_FOLDER_PATH, f"professor_ratings.csv")
-
-    # initialize the subject csv
-    if pd.io.common.file_exists(subject_data_csv_path):
-        df = pd.read_csv(subject_data_csv_path)
-    else:
-        columns = ["Year", "Term", "Course Number", "Subject Name", "Description", "Level (U or G)", "Teachers",
-                   "Teacher Rating (Avg)", "Teacher Rating (STD)", 
-                   "Teacher Helpfulness (Avg)", "Teacher Helpfulness (STD)", "Number of Respondents", 
-                   "Response Rate", "Subject Rating (Avg)", "Subject Rating (STD)", "Pace (Avg)", 
-                   "Pace (STD)", "Total Weekly Hours Spent (Avg)", "Total Weekly Hours Spent (STD)", 
-                   "Assignment Quality (Avg)", "Assignment Quality (STD)", "Grading Fairness (Avg)", 
-                   "Grading Fairness (STD)", "Webpage Link"]
-        df = pd.DataFrame(columns=columns)
-    
-    # initialize the professor csv
-    if pd.io.common.file_exists(professor_csv_path):
-        professor_df = pd.read_csv(professor_csv_path)
-    else:
-        columns = ["Teacher Name", "Teacher Rating (Avg)", "Teacher Rating (STD)","Teacher Helpfulness (Avg)","Teacher Helpfulness (STD)","Number of Ratings","Number of Classes"]
-        professor_df = pd.DataFrame(columns=columns)
-
-    # Iterate through each link
-    for link in course_links:
-        html_string = str(link)  # Assuming the link text contains the course number
-        if 'subjectId=' in html_string or 'evaluation' in html_string: # "subjectId=" in html_string: evaluation
-            # Get the course year and term
-            term, year = get_course_year_and_term(html_string, header_to_content)
-
-            # Get the course number
-            course_number = link.get_text().split(' ')[0]
-
-            # test filter, if course number is equal to 2.12
-            if not check_course_exists_in_dataframe(course_number, term, year, df):
-                # 1. Start the timer
-                start_time = time.time()
-
-                # 2. Process the course link
-                df, professor_df = process_course_link(link['href'], course_information_list, df, professor_df)
-
-                # 3. Sleep for 2 seconds
-                elapsed_time = time.time() - start_time
-                if elapsed_time < 2:
-                    time.sleep(2 - elapsed_time)
-
-                # 4. Save dataframe to CSV
-                df.to_csv(subject_data_csv_path, index=False)
-                professor_df.to_csv(professor_csv_path, index=False)
-
-                print(f"Finished processing course {course_number} ({term} {year}) in {elapsed_time:0.2f} seconds!")
+def iter_listing_courses(soup):
+    """
+    Walk the subject listing page once in document order and yield (link, course number, term, year) for every
+    evaluation link, where the term and year come from the closest <h2> header above the link.
+    """
+    term_and_year = None
+    for tag in soup.find_all(['h2', 'a']):
+        # 1. A header starts a new term
+        if tag.name == 'h2':
+            try:
+                term_and_year = get_course_year_and_term(tag.get_text())
+            except ValueError:
+                term_and_year = None
+            continue
+
+        # 2. Evaluation links inherit the term of the current header
+        href = tag.get('href')
+        if href is None or term_and_year is None:
+            continue
+        link_text = tag.get_text()
+        if 'subjectId=' in href or 'evaluation' in href or 'evaluation' in link_text:
+            course_number = link_text.split(' ')[0]
+            yield (href, course_number) + term_and_year
+
+def main(argv=None):
+    # The crawl itself is driven by scheduler.py, which builds on the functions in this module
+    from scheduler import main as crawl_main
+    return crawl_main(argv)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,115 @@
+# Persistent hash index of the course pages that have already been scraped.
+# Every scraped record contributes a (course number, term, year, url) key. The keys of all departments live in one
+# append-only file that is loaded once at startup, so checking whether a listing link still needs scraping is a set
+# lookup instead of a scan over the subject dataframe. If the file is missing, or a subject table has been modified
+# since the file was last written, the index is rebuilt from the subject tables.
+
+import json
+import os
+
+import pandas as pd
+
+from normalized_store import find_subject_tables, get_table_file, read_subject_table
+
+# 1. Constants
+CSV_FOLDER_PATH = "course_csv_data"
+SCRAPED_INDEX_FILENAME = "scraped_index.jsonl"
+KEY_COLUMNS = ["Course Number", "Term", "Year", "Webpage Link"]
+
+def parse_course_number(course_number):
+    """Convert a course number from the csv format ('="2.12"') back to its plain form ('2.12')."""
+    course_number = str(course_number)
+    if course_number.startswith('="') and course_number.endswith('"'):
+        return course_number[2:-1]
+    return course_number
+
+def make_key(course_number, term, year, url):
+    return (parse_course_number(course_number), str(term), int(year), str(url))
+
+class ScrapedIndex:
+    """Set of (course number, term, year, url) keys of every scraped record, shared by all departments."""
+
+    def __init__(self, csv_folder_path=CSV_FOLDER_PATH):
+        self.csv_folder_path = csv_folder_path
+        self.path = os.path.join(csv_folder_path, SCRAPED_INDEX_FILENAME)
+        self.keys = set()
+        # derived lookups of the scraped (course number, term, year) triples and page urls
+        self.courses = set()
+        self.urls = set()
+        if self._is_stale():
+            self.rebuild()
+        else:
+            self._load()
+
+    def _subject_csv_paths(self):
+        return find_subject_tables(self.csv_folder_path)
+
+    def _is_stale(self):
+        """The index is stale if it does not exist or any subject table was written after it."""
+        if not os.path.exists(self.path):
+            return True
+        index_mtime = os.path.getmtime(self.path)
+        return any(os.path.getmtime(get_table_file(x)) > index_mtime for x in self._subject_csv_paths())
+
+    def _remember(self, key):
+        self.keys.add(key)
+        self.courses.add(key[:3])
+        self.urls.add(key[3])
+
+    def _load(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    self._remember(tuple(json.loads(line)))
+                except (json.JSONDecodeError, TypeError):
+                    # a partially written last line from an interrupted run
+                    continue
+
+    def rebuild(self):
+        """Rebuild the index from the subject tables and rewrite the index file."""
+        self.keys, self.courses, self.urls = set(), set(), set()
+        for csv_path in self._subject_csv_paths():
+            try:
+                df = read_subject_table(csv_path, KEY_COLUMNS)
+            except ValueError:
+                # not a subject table with the expected columns
+                continue
+            self.add_rows(df, persist=False)
+        os.makedirs(self.csv_folder_path, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for key in self.keys:
+                f.write(json.dumps(key) + '\n')
+        os.replace(temp_path, self.path)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def contains(self, course_number, term, year):
+        """Check if the course was already scraped for this term and year."""
+        return (parse_course_number(course_number), str(term), int(year)) in self.courses
+
+    def add(self, course_number, term, year, url):
+        """Record a scraped key and append it to the index file."""
+        self.add_rows(pd.DataFrame([[course_number, term, year, url]], columns=KEY_COLUMNS))
+
+    def add_rows(self, df, persist=True):
+        """Record the keys of the rows of a subject dataframe, appending the new ones to the index file."""
+        new_keys = []
+        for course_number, term, year, url in zip(*(df[column].values for column in KEY_COLUMNS)):
+            if pd.isna(year):
+                continue
+            key = make_key(course_number, term, year, url)
+            if key not in self.keys:
+                self._remember(key)
+                new_keys.append(key)
+        if persist and new_keys:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for key in new_keys:
+                    f.write(json.dumps(key) + '\n')
+        return new_keys
+
+    def mark_synced(self):
+        """Mark the index as up to date after writing subject tables whose rows are all in the index."""
+        if os.path.exists(self.path):
+            os.utime(self.path)
@@ -0,0 +1,272 @@
+# Full-text search over the course titles and descriptions of every scraped department.
+# Each course (per department) is one document made of its subject name and catalog description. The words are
+# lowercased, stop words dropped and reduced by the Porter stemmer (see porter_stemmer.py: 'robotics' and 'robot'
+# share the stem 'robot', 'materials' and 'material' the stem 'materi'), and an inverted index maps every stem to the
+# courses containing it with their term frequencies. Queries are scored with BM25 over the postings of the query stems
+# only, and the best courses are joined back to their per-term rating rows. The index is persisted next to the subject
+# tables together with the modification time and size of the file each of them was read from: departments whose table
+# changed are reindexed on load, and the crawl adds the rows of every scraped page as it goes.
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import time
+
+import pandas as pd
+
+from analyze import get_department
+from normalized_store import find_subject_tables, get_source_signature, read_subject_columns
+from plot_data import load_subject_data, make_filter_mask
+from porter_stemmer import stem
+from scraped_index import parse_course_number
+
+# 1. Constants
+CSV_FOLDER_PATH = "course_csv_data"
+SEARCH_INDEX_FILENAME = "search_index.json"
+SEARCH_INDEX_VERSION = 2
+DOCUMENT_COLUMNS = ["Course Number", "Subject Name", "Description"]
+# The title words count this many times in a document, so a match in the title outranks one in the description
+TITLE_WEIGHT = 2
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+DEFAULT_NUM_RESULTS = 10
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+STOP_WORDS = frozenset("""a an and are as at be by for from has in into is it its of on or that the their this to was
+were will with which how such other both each including students subject subjects topics these those""".split())
+
+def tokenize(text):
+    """Lowercased, stemmed words of a text without the stop words."""
+    if not isinstance(text, str):
+        return []
+    # Greek singulars are stemmed in their plural form, which Porter strips like any other plural ('analysis' and
+    # 'analyses' -> 'analys')
+    return [stem(word[:-3] + 'ses' if word.endswith('sis') else word) for word in TOKEN_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+
+def get_document_key(department, course_number):
+    return f'{department}|{course_number}'
+
+class SearchIndex:
+    """Persistent BM25 inverted index of the courses of every subject csv in a folder."""
+
+    def __init__(self, csv_folder_path=CSV_FOLDER_PATH):
+        self.csv_folder_path = csv_folder_path
+        self.path = os.path.join(csv_folder_path, SEARCH_INDEX_FILENAME)
+        # document key -> {'department', 'course', 'title', 'length', 'terms', 'sha1' of the indexed text}
+        self.documents = {}
+        # stem -> {document key: term frequency}
+        self.postings = {}
+        # department -> signature of the subject csv the department was indexed from
+        self.sources = {}
+        self.total_length = 0
+
+    @classmethod
+    def load(cls, csv_folder_path=CSV_FOLDER_PATH, rebuild=False):
+        """Load the persisted index and reindex the departments whose csv was added, changed or removed."""
+        index = cls(csv_folder_path)
+        if not rebuild and os.path.exists(index.path):
+            with open(index.path, 'r', encoding='utf-8') as f:
+                persisted = json.load(f)
+            if persisted.get('version') == SEARCH_INDEX_VERSION:
+                index.documents, index.postings, index.sources = persisted['documents'], persisted['postings'], persisted['sources']
+                index.total_length = sum(document['length'] for document in index.documents.values())
+        if index.refresh():
+            index.save()
+        return index
+
+    def get_source_paths(self):
+        return {get_department(x): x for x in find_subject_tables(self.csv_folder_path)}
+
+    def refresh(self):
+        """Reindex the departments whose subject table changed since they were indexed. Returns True if any did."""
+        sources = self.get_source_paths()
+        stale = [x for x in sources if self.sources.get(x) != get_source_signature(sources[x])]
+        removed = [x for x in self.sources if x not in sources]
+        for department in stale + removed:
+            self.remove_department(department)
+        for department in stale:
+            self.add_rows(load_subject_data(sources[department], DOCUMENT_COLUMNS), department)
+            self.sources[department] = get_source_signature(sources[department])
+        return bool(stale or removed)
+
+    def remove_department(self, department):
+        keys = {key for key, document in self.documents.items() if document['department'] == department}
+        for key in keys:
+            self.total_length -= self.documents.pop(key)['length']
+        for term in list(self.postings):
+            term_postings = self.postings[term]
+            for key in keys.intersection(term_postings):
+                del term_postings[key]
+            if not term_postings:
+                del self.postings[term]
+        self.sources.pop(department, None)
+
+    def add_document(self, department, course_number, title, description):
+        """Index a course, replacing its document if the title or description changed."""
+        key = get_document_key(department, course_number)
+        digest = hashlib.sha1(f'{title}\n{description}'.encode('utf-8')).hexdigest()
+        document = self.documents.get(key)
+        if document is not None:
+            if document['sha1'] == digest:
+                return False
+            self._remove_document(key)
+
+        # 1. Term frequencies of the document, with the title words counted TITLE_WEIGHT times
+        term_frequencies = {}
+        tokens = tokenize(title) * TITLE_WEIGHT + tokenize(description)
+        for token in tokens:
+            term_frequencies[token] = term_frequencies.get(token, 0) + 1
+
+        # 2. Add the document to the postings of its terms
+        for term, frequency in term_frequencies.items():
+            self.postings.setdefault(term, {})[key] = frequency
+        self.documents[key] = {'department': department, 'course': course_number, 'title': title, 'length': len(tokens),
+                               'terms': list(term_frequencies), 'sha1': digest}
+        self.total_length += len(tokens)
+        return True
+
+    def _remove_document(self, key):
+        document = self.documents.pop(key)
+        self.total_length -= document['length']
+        for term in document['terms']:
+            term_postings = self.postings.get(term)
+            if term_postings is not None:
+                term_postings.pop(key, None)
+                if not term_postings:
+                    del self.postings[term]
+
+    def add_rows(self, df, department):
+        """Index the courses of subject rows (e.g. the rows of a freshly scraped page). Returns the number of changed documents."""
+        # the most recent row of a course holds its current catalog description
+        df = df.dropna(subset=['Course Number']).sort_values('Year', kind='stable').drop_duplicates(subset='Course Number', keep='last')
+        changed = 0
+        for course_number, title, description in zip(df['Course Number'], df['Subject Name'], df['Description']):
+            changed += self.add_document(str(department), parse_course_number(course_number), '' if pd.isna(title) else str(title), description)
+        return changed
+
+    def mark_synced(self, department):
+        """Record that the index holds every row of the department's subject table as currently written."""
+        csv_path = self.get_source_paths().get(str(department))
+        if csv_path is not None:
+            self.sources[str(department)] = get_source_signature(csv_path)
+
+    def save(self):
+        """Atomically write the index."""
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': SEARCH_INDEX_VERSION, 'sources': self.sources, 'documents': self.documents, 'postings': self.postings}, f)
+        os.replace(temp_path, self.path)
+
+    def score(self, query, departments=None):
+        """BM25 score of every course matching at least one query term, as a dict of document key -> score."""
+        num_documents = len(self.documents)
+        if num_documents == 0:
+            return {}
+        average_length = self.total_length / num_documents
+        departments = None if departments is None else {str(x) for x in departments}
+        scores = {}
+        for term in set(tokenize(query)):
+            term_postings = self.postings.get(term)
+            if not term_postings:
+                continue
+            idf = math.log(1 + (num_documents - len(term_postings) + 0.5) / (len(term_postings) + 0.5))
+            for key, frequency in term_postings.items():
+                document = self.documents[key]
+                if departments is not None and document['department'] not in departments:
+                    continue
+                length_norm = BM25_K1 * (1 - BM25_B + BM25_B * document['length'] / average_length)
+                scores[key] = scores.get(key, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + length_norm)
+        return scores
+
+    def search(self, query, filters=None, k=DEFAULT_NUM_RESULTS, columns=None):
+        """
+        Find the courses best matching `query` and return their rating rows.
+
+        Parameters:
+        - query (str): Free text, e.g. 'robotics control'.
+        - filters (dict): 'departments' (list) and the keyword arguments of plot_data.make_filter_mask (levels, terms,
+          min_year, max_year, min_responses), applied to the rating rows.
+        - k (int): Number of courses to return.
+        - columns (list): Rating columns to return, every column but the description if None.
+
+        Returns:
+        - pd.DataFrame: One row per course and term, with the course's 'Score', ordered by score then year.
+        """
+        filters = dict(filters or {})
+        departments = filters.pop('departments', None)
+        scores = self.score(query, departments)
+        sources = self.get_source_paths()
+
+        # 1. Join the courses to their rating rows in score order until k courses have rows passing the filters
+        frames, num_courses = [], 0
+        by_department = {}
+        for key, score in sorted(scores.items(), key=lambda x: x[1], reverse=True):
+            document = self.documents[key]
+            if document['department'] not in by_department:
+                df = None
+                if document['department'] in sources:
+                    csv_path = sources[document['department']]
+                    if columns is None:
+                        row_columns = [x for x in read_subject_columns(csv_path) if x != 'Description']
+                    else:
+                        row_columns = ["Course Number", "Subject Name"] + list(columns)
+                    df = load_subject_data(csv_path, row_columns)
+                if df is not None:
+                    df = df.loc[make_filter_mask(df, **filters)]
+                    df = df.assign(**{'Course Number': df['Course Number'].map(parse_course_number)})
+                by_department[document['department']] = df
+            df = by_department[document['department']]
+            if df is None:
+                continue
+            rows = df.loc[df['Course Number'] == document['course']]
+            if len(rows):
+                frames.append(rows.assign(Department=document['department'], Score=score))
+                num_courses += 1
+                if num_courses >= k:
+                    break
+
+        if not frames:
+            return pd.DataFrame(columns=['Score', 'Department', 'Course Number', 'Subject Name', 'Year', 'Term'])
+        result = pd.concat(frames, ignore_index=True)
+        leading_columns = ['Score', 'Department', 'Course Number', 'Subject Name']
+        result = result[leading_columns + [x for x in result.columns if x not in leading_columns]]
+        return result.sort_values(['Score', 'Course Number', 'Year'], ascending=[False, True, False], kind='stable').reset_index(drop=True)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Search the scraped courses by keywords in their titles and descriptions.")
+    parser.add_argument('query', help="Keywords, e.g. 'robotics control'.")
+    parser.add_argument('--csv-folder', default=CSV_FOLDER_PATH, help="Folder of the subject csv files.")
+    parser.add_argument('-k', type=int, default=DEFAULT_NUM_RESULTS, help="Number of courses to return.")
+    parser.add_argument('--departments', nargs='+', default=None, help="Departments to search, e.g. 2 6 (default: all).")
+    parser.add_argument('--years', nargs=2, type=int, default=None, metavar=('FIRST', 'LAST'), help="Inclusive year range.")
+    parser.add_argument('--terms', nargs='+', default=None, help="Terms to include, e.g. Fall Spring.")
+    parser.add_argument('--levels', nargs='+', default=None, choices=['U', 'G'], help="Course levels to include.")
+    parser.add_argument('--columns', nargs='+', default=["Teacher Rating (Avg)", "Subject Rating (Avg)"], help="Rating columns to show.")
+    parser.add_argument('--rebuild', action='store_true', help="Rebuild the search index from scratch.")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    index = SearchIndex.load(args.csv_folder, args.rebuild)
+    min_year, max_year = args.years if args.years else (None, None)
+    filters = {'departments': args.departments, 'levels': args.levels, 'terms': args.terms, 'min_year': min_year, 'max_year': max_year}
+
+    # the rating columns are parsed once per csv and cached, so they are loaded before timing the query
+    for csv_path in index.get_source_paths().values():
+        load_subject_data(csv_path, ["Course Number", "Subject Name"] + args.columns)
+    start_time = time.perf_counter()
+    result = index.search(args.query, filters, args.k, args.columns)
+    elapsed_time = time.perf_counter() - start_time
+
+    columns = ['Score', 'Department', 'Course Number', 'Subject Name', 'Year', 'Term', 'Level (U or G)', 'Number of Respondents'] + args.columns
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(result[[x for x in columns if x in result.columns]].to_string(index=False, float_format=lambda x: f'{x:0.3f}'))
+    print(f"Searched {len(index.documents)} courses in {elapsed_time*1e3:0.1f} ms.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,42 @@
+# Check of the search stemming on inflected query pairs.
+# Each pair of queries differs only by the inflection of its word (singular and plural, noun and gerund), so both must
+# reduce to the same stems and match the same courses of the search index. A mismatch means the stemmer maps the two
+# forms to different stems and one of the queries silently misses courses.
+
+import argparse
+import sys
+
+from search_index import CSV_FOLDER_PATH, SearchIndex, tokenize
+
+QUERY_PAIRS = [('material', 'materials'), ('process', 'processes'), ('class', 'classes'), ('engineer', 'engineering'),
+               ('analysis', 'analyses'), ('system', 'systems'), ('design', 'designs'), ('robot', 'robotics'),
+               ('control', 'controlling'), ('property', 'properties')]
+
+def check_query_pairs(index, query_pairs=QUERY_PAIRS):
+    """
+    Search both queries of every pair and compare their stems and matching courses.
+
+    Returns:
+    - list: (query, other query, stems, other stems, number of hits, number of other hits) of every pair that differs.
+    """
+    mismatches = []
+    for query, other_query in query_pairs:
+        hits, other_hits = set(index.score(query)), set(index.score(other_query))
+        if tokenize(query) != tokenize(other_query) or hits != other_hits:
+            mismatches.append((query, other_query, tokenize(query), tokenize(other_query), len(hits), len(other_hits)))
+    return mismatches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that inflected forms of a query match the same courses.")
+    parser.add_argument('--csv-folder', default=CSV_FOLDER_PATH, help="Folder of the subject csv files.")
+    args = parser.parse_args(argv)
+
+    index = SearchIndex.load(args.csv_folder)
+    mismatches = check_query_pairs(index)
+    print(f"{len(QUERY_PAIRS) - len(mismatches)}/{len(QUERY_PAIRS)} query pairs match the same courses.")
+    for query, other_query, stems, other_stems, num_hits, num_other_hits in mismatches:
+        print(f"  {query!r} {stems} ({num_hits} courses) vs {other_query!r} {other_stems} ({num_other_hits} courses)")
+    return 1 if mismatches else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 import numpy as np
+import pandas as pd
 
 def weighted_nanmedian(data, weights=None):
     """
@@ -91,4 +92,345 @@ def weighted_nanstd(values, weights):
 
     weighted_mean = np.average(filtered_values, weights=filtered_weights)
     variance = np.average((filtered_values - weighted_mean) ** 2, weights=filtered_weights)  # Weighted variance
-    return np.sqrt(variance)
\ No newline at end of file
+    return np.sqrt(variance)
+
+# Relative size below which E[x^2] - E[x]^2 is float cancellation rather than spread (e.g. a single observation)
+VARIANCE_RTOL = 1e-12
+
+def weighted_mean_and_std_from_sums(weighted_sum, weighted_sum_of_squares, total_weight):
+    """
+    Weighted mean and std from the sums sum(w*x), sum(w*x^2) and sum(w), e.g. of pre-aggregated groups.
+    Variances within float rounding of the mean square are treated as 0; empty groups give NaN.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = weighted_sum / total_weight
+        mean_square = weighted_sum_of_squares / total_weight
+        variance = mean_square - mean**2
+        variance = np.where(variance > VARIANCE_RTOL * mean_square, variance, 0)
+        return mean, np.where(np.isnan(mean), np.nan, np.sqrt(variance))
+
+def _group_ids(df, group_cols):
+    """
+    Number the groups of `df` by `group_cols` in sorted order.
+
+    Returns:
+    - np.ndarray: Group id of every row (-1 for rows with a missing group value).
+    - pd.Index: The group labels, one per id (a MultiIndex for several group columns).
+    """
+    if not group_cols:
+        return np.zeros(len(df), dtype=np.intp), pd.Index(['all'])
+    codes, uniques = zip(*(pd.factorize(df[column], sort=True) for column in group_cols))
+    codes = np.stack(codes)
+    missing = (codes < 0).any(axis=0)
+    flat = np.ravel_multi_index(np.where(missing, 0, codes), [max(len(x), 1) for x in uniques])
+    present, group_ids = np.unique(flat[~missing], return_inverse=True)
+    ids = np.full(len(df), -1, dtype=np.intp)
+    ids[~missing] = group_ids.ravel()
+    levels = np.unravel_index(present, [max(len(x), 1) for x in uniques])
+    labels = [np.asarray(x)[level] for x, level in zip(uniques, levels)]
+    index = pd.MultiIndex.from_arrays(labels, names=group_cols) if len(group_cols) > 1 else pd.Index(labels[0], name=group_cols[0])
+    return ids, index
+
+def _grouped_quantiles(values, weights, group_ids, num_groups, quantiles):
+    """
+    Weighted quantiles of every group, using the same definition as weighted_nanmedian: the smallest value whose
+    cumulative weight exceeds q times the group's total weight. All groups are handled by one lexsort and one cumsum.
+    """
+    result = np.full((len(quantiles), num_groups), np.nan)
+    if len(values) == 0:
+        return result
+
+    # 1. Sort by group, then by value, and accumulate the weights over the whole array
+    order = np.lexsort((values, group_ids))
+    sorted_values, sorted_weights, sorted_ids = values[order], weights[order], group_ids[order]
+    cum_weights = np.cumsum(sorted_weights)
+
+    # 2. Locate every group's slice of the sorted array and the cumulative weight before it
+    starts = np.searchsorted(sorted_ids, np.arange(num_groups), side='left')
+    ends = np.searchsorted(sorted_ids, np.arange(num_groups), side='right')
+    nonempty = ends > starts
+    offsets = np.where(starts > 0, cum_weights[np.maximum(starts - 1, 0)], 0.0)
+    totals = np.where(nonempty, cum_weights[np.maximum(ends - 1, 0)] - offsets, 0.0)
+
+    # 3. The first position past each group's target weight is its quantile
+    for i, q in enumerate(quantiles):
+        positions = np.searchsorted(cum_weights, offsets + q * totals, side='right')
+        positions = np.clip(positions, starts, np.maximum(ends - 1, starts))
+        result[i, nonempty] = sorted_values[positions[nonempty]]
+    return result
+
+def weighted_stats_by(df, value_cols, weight_col=None, group_cols=None, quantiles=(0.5,)):
+    """
+    Compute weighted statistics of many columns for every group in a single vectorized pass.
+
+    Parameters:
+    - df (pd.DataFrame): The data, e.g. a subject csv.
+    - value_cols (list): Columns to summarize (e.g. ['Subject Rating (Avg)', 'Pace (Avg)']).
+    - weight_col (str): Column of weights (e.g. 'Number of Respondents'), every row weighs 1 if None.
+    - group_cols (list): Columns to group by (e.g. ['Year', 'Term']), the whole frame is one group if None.
+    - quantiles (tuple): Quantiles to compute in addition to the mean and std (0.5 is reported as 'median').
+
+    NaN values (or weights) are ignored per column, as in weighted_nanmean/weighted_nanstd/weighted_nanmedian.
+
+    Returns:
+    - pd.DataFrame: One row per group and a (value column, statistic) column for each of 'count', 'weight', 'mean',
+      'std', 'median' and the other quantiles ('q0.25', ...).
+    """
+    value_cols = [value_cols] if isinstance(value_cols, str) else list(value_cols)
+    group_cols = [group_cols] if isinstance(group_cols, str) else list(group_cols or [])
+    group_ids, index = _group_ids(df, group_cols)
+    num_groups = len(index)
+    all_weights = np.ones(len(df)) if weight_col is None else df[weight_col].to_numpy(dtype=float)
+    quantile_names = ['median' if q == 0.5 else f'q{q:g}' for q in quantiles]
+
+    columns = {}
+    for value_col in value_cols:
+        # 1. Keep the rows where both the value and its weight are known
+        values = df[value_col].to_numpy(dtype=float)
+        valid = ~np.isnan(values) & ~np.isnan(all_weights) & (group_ids >= 0)
+        values, weights, ids = values[valid], all_weights[valid], group_ids[valid]
+
+        # 2. Weighted moments per group
+        count = np.bincount(ids, minlength=num_groups)
+        weight = np.bincount(ids, weights=weights, minlength=num_groups)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.bincount(ids, weights=weights * values, minlength=num_groups) / weight
+            variance = np.bincount(ids, weights=weights * (values - mean[ids])**2, minlength=num_groups) / weight
+        empty = count == 0
+        mean[empty], variance[empty] = np.nan, np.nan
+
+        # 3. Weighted quantiles per group
+        group_quantiles = _grouped_quantiles(values, weights, ids, num_groups, quantiles)
+
+        columns[(value_col, 'count')] = count
+        columns[(value_col, 'weight')] = weight
+        columns[(value_col, 'mean')] = mean
+        columns[(value_col, 'std')] = np.sqrt(variance)
+        for name, quantile_values in zip(quantile_names, group_quantiles):
+            columns[(value_col, name)] = quantile_values
+
+    return pd.DataFrame(columns, index=index)
+
+# Default compression of WeightedQuantileSketch, the sketch keeps at most about compression/2 centroids
+DEFAULT_SKETCH_COMPRESSION = 200
+
+class WeightedQuantileSketch:
+    """
+    Mergeable weighted quantile sketch (a merging t-digest) for data that does not fit in memory.
+
+    Values are fed in chunks with `update`, and sketches built by separate workers are combined with `merge`. The
+    sketch summarizes the data as at most about compression/2 weighted centroids: points are sorted and grouped so that
+    each centroid covers at most one unit of the scale k(q) = compression/(2*pi) * asin(2q - 1), which makes the
+    centroids small near the tails and largest at the median. The exact minimum and maximum are kept as well.
+
+    Error bound: a quantile estimate is interpolated between adjacent centroids, so its rank is off by at most about
+    half a centroid, i.e. |rank error| <~ (pi/compression) * sqrt(q(1 - q)) * total weight. At the default compression
+    of 200 that is under 0.8% of the total weight at the median and far less in the tails; q=0 and q=1 are exact.
+    """
+
+    def __init__(self, compression=DEFAULT_SKETCH_COMPRESSION, buffer_size=None):
+        self.compression = compression
+        self.buffer_size = buffer_size or 20 * compression
+        self.means = np.zeros(0)
+        self.weights = np.zeros(0)
+        self.buffer_values = []
+        self.buffer_weights = []
+        self.buffered = 0
+        self.total_weight = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def __len__(self):
+        """Number of centroids (after flushing the buffer)."""
+        self._compress()
+        return len(self.means)
+
+    def update(self, values, weights=None):
+        """Add a chunk of values (and optional weights), ignoring NaN values, NaN weights and zero weights."""
+        values = np.asarray(values, dtype=float).ravel()
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=float).ravel()
+        valid = ~np.isnan(values) & ~np.isnan(weights) & (weights > 0)
+        if not valid.any():
+            return self
+        values, weights = values[valid], weights[valid]
+        self.buffer_values.append(values)
+        self.buffer_weights.append(weights)
+        self.buffered += len(values)
+        self.total_weight += weights.sum()
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+        if self.buffered >= self.buffer_size:
+            self._compress()
+        return self
+
+    def merge(self, other):
+        """Add the contents of another sketch to this one. Merging is associative and commutative up to the error bound."""
+        other._compress()
+        if len(other.means):
+            self.buffer_values.append(other.means)
+            self.buffer_weights.append(other.weights)
+            self.buffered += len(other.means)
+            self.total_weight += other.total_weight
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self._compress()
+        return self
+
+    def _scale(self, q):
+        return self.compression / (2 * np.pi) * np.arcsin(2 * np.clip(q, 0, 1) - 1)
+
+    def _compress(self):
+        """Merge the buffered points into the centroids, grouping points that fall in the same unit of k(q)."""
+        if not self.buffered:
+            return
+        means = np.concatenate([self.means] + self.buffer_values)
+        weights = np.concatenate([self.weights] + self.buffer_weights)
+        self.buffer_values, self.buffer_weights, self.buffered = [], [], 0
+
+        # 1. Sort the points and place each one at the quantile of its center of mass
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        cum_weights = np.cumsum(weights)
+        total = cum_weights[-1]
+        centers = (cum_weights - weights / 2) / total
+
+        # 2. Points in the same unit of the scale function form one centroid (the groups are contiguous)
+        groups = np.floor(self._scale(centers) - self._scale(0)).astype(np.intp)
+        _, groups = np.unique(groups, return_inverse=True)
+        groups = groups.ravel()
+        self.weights = np.bincount(groups, weights=weights)
+        self.means = np.bincount(groups, weights=weights * means) / self.weights
+
+    def quantile(self, q):
+        """Estimate the weighted quantile(s) `q` (a scalar or an array of values in [0, 1])."""
+        self._compress()
+        if not len(self.means):
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        # centroid means sit at the cumulative weight of their center, the extremes at 0 and the total weight
+        centers = np.cumsum(self.weights) - self.weights / 2
+        positions = np.concatenate([[0], centers, [self.total_weight]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return np.interp(np.asarray(q, dtype=float) * self.total_weight, positions, values)
+
+    def median(self):
+        return self.quantile(0.5)
+
+def sketch_csv(csv_path, value_cols, weight_col=None, chunksize=100_000, compression=DEFAULT_SKETCH_COMPRESSION):
+    """
+    Build a WeightedQuantileSketch for each of `value_cols` by streaming a csv in chunks.
+
+    Returns:
+    - dict: value column -> WeightedQuantileSketch
+    """
+    value_cols = [value_cols] if isinstance(value_cols, str) else list(value_cols)
+    usecols = value_cols + ([weight_col] if weight_col is not None else [])
+    sketches = {column: WeightedQuantileSketch(compression) for column in value_cols}
+    for chunk in pd.read_csv(csv_path, usecols=usecols, chunksize=chunksize):
+        weights = None if weight_col is None else chunk[weight_col].to_numpy(dtype=float)
+        for column, sketch in sketches.items():
+            sketch.update(chunk[column].to_numpy(dtype=float), weights)
+    return sketches
+
+# Memory budget of the resample matrices of bootstrap_ci_by, the resamples are drawn in chunks that fit in it
+DEFAULT_BOOTSTRAP_MEMORY_BYTES = 64 * 2**20
+# Approximate bytes used per resampled row (indices, values, weights, group ids and sort order)
+BOOTSTRAP_BYTES_PER_ENTRY = 48
+
+def _bootstrap_statistics(values, weights, group_ids, num_groups, statistic, num_resamples, rng, max_memory_bytes):
+    """
+    Return a (num_resamples, num_groups) array of the weighted `statistic` ('mean' or 'median') of every group over
+    stratified resamples, each group being resampled with replacement from its own rows.
+    """
+    # 1. Sort the rows by group so each group is a contiguous slice [starts[g], starts[g] + sizes[g])
+    order = np.argsort(group_ids, kind='stable')
+    values, weights, group_ids = values[order], weights[order], group_ids[order]
+    sizes = np.bincount(group_ids, minlength=num_groups)
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    num_rows = len(values)
+
+    results = np.full((num_resamples, num_groups), np.nan)
+    if num_rows == 0:
+        return results
+
+    # 2. Draw the resamples in chunks of rows of an index matrix, each chunk fitting in the memory budget
+    chunk_size = max(1, int(max_memory_bytes // (num_rows * BOOTSTRAP_BYTES_PER_ENTRY)))
+    for chunk_start in range(0, num_resamples, chunk_size):
+        num_chunk = min(chunk_size, num_resamples - chunk_start)
+        # every slot of a group draws one of that group's rows
+        indices = starts[group_ids] + (rng.random((num_chunk, num_rows)) * sizes[group_ids]).astype(np.intp)
+        # (resample, group) pairs are numbered resample * num_groups + group
+        cell_ids = (np.arange(num_chunk)[:, None] * num_groups + group_ids[None, :]).ravel()
+        sampled_values, sampled_weights = values[indices].ravel(), weights[indices].ravel()
+        num_cells = num_chunk * num_groups
+        if statistic == 'mean':
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cell_stats = np.bincount(cell_ids, weights=sampled_weights * sampled_values, minlength=num_cells) / np.bincount(cell_ids, weights=sampled_weights, minlength=num_cells)
+        elif statistic == 'median':
+            cell_stats = _grouped_quantiles(sampled_values, sampled_weights, cell_ids, num_cells, [0.5])[0]
+        else:
+            raise ValueError(f"Unknown bootstrap statistic: {statistic}")
+        results[chunk_start:chunk_start + num_chunk] = cell_stats.reshape(num_chunk, num_groups)
+
+    return results
+
+def _nan_quantiles_by_column(a, quantiles):
+    """Linearly interpolated quantiles of every column of a 2d array ignoring NaNs (NaN for all-NaN columns)."""
+    sorted_a = np.sort(a, axis=0)  # NaNs are sorted last
+    counts = (~np.isnan(a)).sum(axis=0)
+    columns = np.arange(a.shape[1])
+    result = np.full((len(quantiles), a.shape[1]), np.nan)
+    nonempty = counts > 0
+    for i, q in enumerate(quantiles):
+        positions = q * np.maximum(counts - 1, 0)
+        below = np.floor(positions).astype(np.intp)
+        above = np.minimum(below + 1, np.maximum(counts - 1, 0))
+        fraction = positions - below
+        interpolated = sorted_a[np.minimum(below, len(a) - 1), columns] * (1 - fraction) + sorted_a[np.minimum(above, len(a) - 1), columns] * fraction
+        result[i, nonempty] = interpolated[nonempty]
+    return result
+
+def bootstrap_ci_by(df, value_cols, weight_col=None, group_cols='Year', statistic='mean', confidence=0.95,
+                    num_resamples=1000, seed=0, max_memory_bytes=DEFAULT_BOOTSTRAP_MEMORY_BYTES):
+    """
+    Percentile bootstrap confidence intervals of a weighted statistic for every group, e.g. yearly error bands.
+
+    All resamples of all groups are drawn at once as an index matrix (in chunks that fit in `max_memory_bytes`) and
+    the statistic of every (resample, group) pair is computed with a single bincount or lexsort, so there is no Python
+    loop over resamples or groups. Each group is resampled from its own rows, and the results only depend on `seed`,
+    not on the memory budget.
+
+    Parameters:
+    - df (pd.DataFrame): The data, e.g. a subject csv.
+    - value_cols (list): Columns to compute intervals for.
+    - weight_col (str): Column of weights (e.g. 'Number of Respondents'), every row weighs 1 if None.
+    - group_cols (list): Columns to group by (default: 'Year').
+    - statistic (str): 'mean' or 'median'.
+    - confidence (float): Confidence level of the intervals.
+    - num_resamples (int): Number of bootstrap resamples.
+    - seed (int): Seed of the random number generator.
+    - max_memory_bytes (int): Approximate memory budget of the resample matrices.
+
+    Returns:
+    - pd.DataFrame: One row per group and a (value column, 'estimate'/'lower'/'upper') column for each value column.
+    """
+    value_cols = [value_cols] if isinstance(value_cols, str) else list(value_cols)
+    group_cols = [group_cols] if isinstance(group_cols, str) else list(group_cols or [])
+    group_ids, index = _group_ids(df, group_cols)
+    num_groups = len(index)
+    all_weights = np.ones(len(df)) if weight_col is None else df[weight_col].to_numpy(dtype=float)
+    rng = np.random.default_rng(seed)
+    alpha = (1 - confidence) / 2
+
+    # the point estimates use the same definitions as weighted_stats_by
+    estimates = weighted_stats_by(df, value_cols, weight_col, group_cols, quantiles=(0.5,))
+    columns = {}
+    for value_col in value_cols:
+        values = df[value_col].to_numpy(dtype=float)
+        valid = ~np.isnan(values) & ~np.isnan(all_weights) & (group_ids >= 0)
+        resampled = _bootstrap_statistics(values[valid], all_weights[valid], group_ids[valid], num_groups, statistic, num_resamples, rng, max_memory_bytes)
+        lower, upper = _nan_quantiles_by_column(resampled, [alpha, 1 - alpha])
+        columns[(value_col, 'estimate')] = estimates[(value_col, 'median' if statistic == 'median' else 'mean')].to_numpy()
+        columns[(value_col, 'lower')] = lower
+        columns[(value_col, 'upper')] = upper
+
+    return pd.DataFrame(columns, index=index)
@@ -0,0 +1,151 @@
+# Per-stage timing spans and counters for the scrape pipeline.
+# Every fetch, parse, extractor call and storage write records its duration under a span name, and counters keep
+# totals such as the bytes fetched, pages parsed and cache hits. Spans are kept in memory for the p50/p95/p99 summary
+# printed at the end of a crawl, and can also be streamed to a JSON lines file (one object per span, followed by the
+# summary and the counters) for comparing runs. The recorder is shared by the fetch threads, so it is thread-safe.
+# `profile_run` wraps a whole run in cProfile and tracemalloc for the --profile option.
+
+import cProfile
+import functools
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+# 1. Constants
+SUMMARY_PERCENTILES = [50, 95, 99]
+PROFILE_TOP_FUNCTIONS = 25
+PROFILE_TOP_ALLOCATIONS = 15
+
+class Telemetry:
+    """Thread-safe recorder of named timing spans and counters, optionally streamed to a JSON lines file."""
+
+    def __init__(self):
+        # span name -> list of durations in seconds
+        self.spans = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+        self.log_file = None
+
+    def open_log(self, log_path):
+        """Stream every span to `log_path` (JSON lines) from now on."""
+        self.close_log()
+        self.log_file = open(log_path, 'w', encoding='utf-8')
+
+    def close_log(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+    def _write(self, record):
+        if self.log_file is not None:
+            self.log_file.write(json.dumps(record) + '\n')
+
+    def record(self, name, duration, **attributes):
+        """Record one span of `duration` seconds."""
+        with self.lock:
+            self.spans.setdefault(name, []).append(duration)
+            if self.log_file is not None:
+                self._write({'type': 'span', 'name': name, 'duration': duration, 'time': time.time(), **attributes})
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """Time the body of a `with` block as span `name`."""
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start_time, **attributes)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """Count, total and percentiles (in seconds) of every span name."""
+        with self.lock:
+            spans = {name: np.array(durations) for name, durations in self.spans.items()}
+        summary = {}
+        for name, durations in sorted(spans.items()):
+            percentiles = np.percentile(durations, SUMMARY_PERCENTILES)
+            summary[name] = {'count': len(durations), 'total': float(durations.sum()),
+                             **{f'p{p}': float(x) for p, x in zip(SUMMARY_PERCENTILES, percentiles)},
+                             'max': float(durations.max())}
+        return summary
+
+    def write_summary(self):
+        """Append the span summary and the counters to the JSON lines log, if one is open."""
+        summary = self.summary()
+        with self.lock:
+            for name, stats in summary.items():
+                self._write({'type': 'summary', 'name': name, **stats})
+            self._write({'type': 'counters', **self.counters})
+            if self.log_file is not None:
+                self.log_file.flush()
+
+    def format_summary(self):
+        """Table of the span summary (in milliseconds) and the counters, for printing at the end of a run."""
+        lines = [f"{'span':<48}{'count':>8}{'total s':>10}" + ''.join(f"{f'p{p} ms':>10}" for p in SUMMARY_PERCENTILES)]
+        for name, stats in self.summary().items():
+            lines.append(f"{name:<48}{stats['count']:>8}{stats['total']:>10.2f}" + ''.join(f"{stats[f'p{p}']*1e3:>10.2f}" for p in SUMMARY_PERCENTILES))
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"{name:<48}{value:>8}")
+        return '\n'.join(lines)
+
+    def reset(self):
+        with self.lock:
+            self.spans.clear()
+            self.counters.clear()
+
+# Recorder shared by the whole scrape pipeline
+telemetry = Telemetry()
+
+def span(name, **attributes):
+    return telemetry.span(name, **attributes)
+
+def count(name, value=1):
+    telemetry.count(name, value)
+
+def timed(name=None):
+    """Decorator recording every call of a function as a span (named after the function by default)."""
+    def decorator(function):
+        span_name = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with telemetry.span(span_name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def profile_run(function, *args, profile_path=None, **kwargs):
+    """
+    Run `function` under cProfile and tracemalloc, print the slowest functions and the largest allocation sites, and
+    save the raw profile to `profile_path` (readable with pstats or snakeviz) if given.
+    """
+    tracemalloc.start()
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function, *args, **kwargs)
+    finally:
+        snapshot = tracemalloc.take_snapshot()
+        current_memory, peak_memory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # 1. Time spent per function
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        print(stream.getvalue())
+        if profile_path is not None:
+            profiler.dump_stats(profile_path)
+            print(f"Saved the profile to {profile_path}")
+
+        # 2. Memory allocated per source line
+        print(f"Traced memory: {current_memory/2**20:0.1f} MiB at the end, {peak_memory/2**20:0.1f} MiB at the peak.")
+        for stat in snapshot.statistics('lineno')[:PROFILE_TOP_ALLOCATIONS]:
+            print(stat)
@@ -28,7 +28,10 @@ setup(
     entry_points={
         'console_scripts': [
             'mitscrape=MiTSubjectScraper.scrape:main',  # Assuming your main function is in 'main' of 'your_module_name.py'
-            'mitanalyze=MiTSubjectScraper.analyze:main'
+            'mitanalyze=MiTSubjectScraper.analyze:main',
+            'mitrank=MiTSubjectScraper.ranking:main',
+            'mitsearch=MiTSubjectScraper.search_index:main',
+            'mitnormalize=MiTSubjectScraper.normalized_store:main'
         ],
     },
 )